@@ -6,6 +6,7 @@ DROP TABLE IF EXISTS annual_metrics_stage;
 DROP TABLE IF EXISTS cumulative_metrics_stage;
 DROP TABLE IF EXISTS wages_metrics_stage;
 DROP TABLE IF EXISTS permits_metrics_stage;
+DROP TABLE IF EXISTS cumulative_metrics_by_base_stage;
 
 CREATE TABLE IF NOT EXISTS annual_metrics (
   Area VARCHAR,
@@ -35,6 +36,21 @@ CREATE TABLE IF NOT EXISTS cumulative_metrics (
   Structural_Gap DOUBLE
 );
 
+-- one row per (Base_Year, Code, Year): pick the base year at query time
+CREATE TABLE IF NOT EXISTS cumulative_metrics_by_base (
+  Base_Year BIGINT,
+  Area VARCHAR,
+  Code BIGINT,
+  Year BIGINT,
+  Real_Total_Wages DOUBLE,
+  Total_Permits DOUBLE,
+  Base_Wage DOUBLE,
+  Base_Permits DOUBLE,
+  Cumul_Wage_Index DOUBLE,
+  Cumul_Permit_Index DOUBLE,
+  Structural_Gap DOUBLE
+);
+
 CREATE TABLE IF NOT EXISTS wages_metrics (
     Area VARCHAR,
     Code BIGINT,
@@ -52,7 +68,13 @@ CREATE TABLE IF NOT EXISTS permits_metrics (
     Total_Permits BIGINT
 );
 
+CREATE TABLE IF NOT EXISTS build_meta (
+  table_name VARCHAR,
+  last_built TIMESTAMP
+);
+
 -- sanity check helpers (run manually or from build script)
 -- should always return 0 rows
 -- SELECT Code, Year, COUNT(*) c FROM annual_metrics GROUP BY Code, Year HAVING COUNT(*) > 1;
--- SELECT Code, Year, COUNT(*) c FROM cumulative_metrics GROUP BY Code, Year HAVING COUNT(*) > 1;
\ No newline at end of file
+-- SELECT Code, Year, COUNT(*) c FROM cumulative_metrics GROUP BY Code, Year HAVING COUNT(*) > 1;
+-- SELECT Base_Year, Code, Year, COUNT(*) c FROM cumulative_metrics_by_base GROUP BY ALL HAVING COUNT(*) > 1;
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""Run the wage / permit builders and the marts with the pandas and polars engines
+side by side, check the outputs are identical and print timings.
+
+    python scripts/bench_engines.py --codes 12420,42660 --years 2014-2024 [--source lake] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+from time import perf_counter
+
+import pandas as pd
+
+from bls_housing.pipeline import polars_engine
+from bls_housing.pipeline.duck import list_metros, managed_connection
+from bls_housing.pipeline.marts import build_annual_metrics, build_cumulative_metrics
+from bls_housing.pipeline.permits import build_annual_permits
+from bls_housing.pipeline.wages import build_annual_wages
+
+
+def _years(spec: str) -> list[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def _timed(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        out = fn()
+        best = min(best, perf_counter() - t0)
+    return best, out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the pandas and polars engines")
+    ap.add_argument("--codes", help="comma separated CBSA codes (default: all metros in dim_metro_full)")
+    ap.add_argument("--years", default="2014-2024")
+    ap.add_argument("--source", default="cache", choices=polars_engine.WAGE_SOURCES,
+                    help="wage source for the polars engine")
+    ap.add_argument("--streaming", action="store_true", help="collect polars plans with the streaming engine")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    years = _years(args.years)
+    with managed_connection(profile="query") as con:
+        if args.codes:
+            metros = list_metros(con, [int(c) for c in args.codes.split(",")])
+        else:
+            metros = con.execute("SELECT DISTINCT Area, Code FROM dim_metro_full ORDER BY Code").df()
+
+    steps = {
+        "annual_wages": (
+            lambda: build_annual_wages(metros, years),
+            lambda: polars_engine.build_annual_wages(metros, years, source=args.source, streaming=args.streaming),
+        ),
+        "annual_permits": (
+            lambda: build_annual_permits(metros, years),
+            lambda: polars_engine.build_annual_permits(metros, years, streaming=args.streaming),
+        ),
+    }
+    results: dict[str, tuple] = {}
+    failed = False
+    print(f"{'step':<22}{'pandas':>10}{'polars':>10}  identical")
+    for name, (pd_fn, pl_fn) in steps.items():
+        t_pd, out_pd = _timed(pd_fn, args.repeat)
+        t_pl, out_pl = _timed(pl_fn, args.repeat)
+        same = all(a.equals(b) for a, b in zip(out_pd, out_pl))
+        failed |= not same
+        print(f"{name:<22}{t_pd:>9.3f}s{t_pl:>9.3f}s  {same}")
+        results[name] = out_pd
+
+    (_, wages), (_, permits) = results["annual_wages"], results["annual_permits"]
+    marts = {
+        "annual_metrics": lambda engine: build_annual_metrics(wages, permits, engine=engine),
+        "cumulative_metrics": lambda engine: build_cumulative_metrics(wages, permits, years[1], engine=engine),
+    }
+    for name, fn in marts.items():
+        t_pd, out_pd = _timed(lambda: fn("pandas"), args.repeat)
+        t_pl, out_pl = _timed(lambda: fn("polars"), args.repeat)
+        same = out_pd.equals(out_pl)
+        if not same:
+            pd.testing.assert_frame_equal(out_pd, out_pl)   # show where they differ
+        failed |= not same
+        print(f"{name:<22}{t_pd:>9.3f}s{t_pl:>9.3f}s  {same}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
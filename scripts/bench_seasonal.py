@@ -0,0 +1,84 @@
+"""Benchmark the matrix seasonal decomposition against a per-metro loop over the same
+math, on synthetic monthly permits, and check both give the same result.
+
+    python scripts/bench_seasonal.py [--metros 260,2000] [--years 2009-2024] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from bls_housing.helper import QUARTER_TO_MONTH
+from bls_housing.pipeline.seasonal import build_seasonal, decompose, monthly_matrix
+
+
+def _years(spec: str) -> list[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def _timed(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        out = fn()
+        best = min(best, perf_counter() - t0)
+    return best, out
+
+
+def synthetic_permits(n_metros: int, years: list[int], seed: int = 0) -> pd.DataFrame:
+    """Poisson counts with a per-metro level, trend and seasonal amplitude; small
+    metros get many zero months, like the real BPS data."""
+    rng = np.random.default_rng(seed)
+    months = np.arange(len(years) * 12)
+    level = np.exp(rng.normal(3.0, 1.5, n_metros))[:, None]
+    growth = rng.normal(0.0, 0.002, n_metros)[:, None]
+    season = 1 + rng.uniform(0.1, 0.6, n_metros)[:, None] * np.sin(2 * np.pi * (months - 3) / 12)
+    counts = rng.poisson(level * np.exp(growth * months) * season)
+
+    month_to_qtr = {int(m): int(q) for q, ms in QUARTER_TO_MONTH.items() for m in ms}
+    codes = 10000 + 10 * np.arange(n_metros)
+    return pd.DataFrame({
+        "Area": np.repeat([f"Metro {c}" for c in codes], len(months)),
+        "Code": np.repeat(codes, len(months)),
+        "Year": np.tile(np.repeat(years, 12), n_metros),
+        "Quarter": np.tile([month_to_qtr[m % 12 + 1] for m in months], n_metros),
+        "Month": np.tile(months % 12 + 1, n_metros),
+        "Total_Permits": counts.ravel(),
+    })
+
+
+def per_metro(permits: pd.DataFrame) -> np.ndarray:
+    """Reference: the same decomposition, one metro at a time."""
+    m = monthly_matrix(permits)
+    rows = [decompose(m.values[i:i + 1], m.month_of_year)[1] for i in range(len(m.codes))]
+    return np.vstack(rows)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the vectorized seasonal adjustment")
+    ap.add_argument("--metros", default="260,2000", help="comma separated metro counts")
+    ap.add_argument("--years", default="2009-2024")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    years = _years(args.years)
+    failed = False
+    print(f"{'metros':>8}{'rows':>10}{'matrix':>10}{'per-metro':>11}  identical")
+    for n in (int(x) for x in args.metros.split(",")):
+        permits = synthetic_permits(n, years)
+        t_vec, out = _timed(lambda: build_seasonal(permits), args.repeat)
+        t_loop, ref = _timed(lambda: per_metro(permits), args.repeat)
+        m = monthly_matrix(permits)
+        same = np.allclose(decompose(m.values, m.month_of_year)[1], ref, equal_nan=True)
+        failed |= not same
+        print(f"{n:>8}{len(out):>10}{t_vec:>9.3f}s{t_loop:>10.3f}s  {same}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
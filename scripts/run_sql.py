@@ -1,22 +1,123 @@
 # scripts/run_sql.py
+"""Run one or more .sql files (or globs) against a DuckDB database on one connection.
+
+Each file's `-- include:` lines are expanded like `build-data` does, then it runs
+statement by statement with timings. A file that starts with a `-- independent` line
+declares that it does not depend on its neighbours. Consecutive independent files
+run concurrently, each on its own cursor.
+
+    python scripts/run_sql.py data/analysis.duckdb data/ingest/*.sql --profile-json logs/sql_profile.json
+"""
+
 import argparse
+import glob
+import json
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
 from pathlib import Path
-import duckdb
+from time import perf_counter
+
+from bls_housing.build_data import expand_sql
+from bls_housing.pipeline.duck import PROFILES, managed_connection
+from bls_housing.sql_runner import StatementTiming, run_statements, sha256_text
+
+ROOT = Path(__file__).resolve().parents[1]  # repo root, base of `-- include:` paths
+INDEPENDENT_RE = re.compile(r"^\s*--\s*independent\s*$", re.IGNORECASE)
+
+
+def resolve_files(specs: list[str]) -> list[Path]:
+    """Files and globs in command-line order; each glob expands sorted."""
+    files: list[Path] = []
+    for spec in specs:
+        if any(ch in spec for ch in "*?["):
+            matches = sorted(glob.glob(spec, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No files match {spec}")
+            files += [Path(m) for m in matches]
+        else:
+            files.append(Path(spec))
+    return list(dict.fromkeys(files))
+
+
+def is_independent(path: Path) -> bool:
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            return bool(INDEPENDENT_RE.match(line))
+    return False
+
+
+def plan_groups(files: list[Path]) -> list[list[Path]]:
+    """Consecutive independent files share a group; every other file is its own group."""
+    groups: list[list[Path]] = []
+    prev_independent = False
+    for f in files:
+        independent = is_independent(f)
+        if independent and prev_independent:
+            groups[-1].append(f)
+        else:
+            groups.append([f])
+        prev_independent = independent
+    return groups
+
+
+def _run_file(con, path: Path, profile_dir: Path | None) -> list[StatementTiming]:
+    profile_output = None
+    if profile_dir is not None:
+        profile_output = profile_dir / f"{sha256_text(str(path))[:16]}.json"
+    return run_statements(con, expand_sql(path, ROOT), source=str(path), profile_output=profile_output)
+
+
+def run_files(con, files: list[Path], workers: int = 4,
+              profile_dir: Path | None = None) -> list[StatementTiming]:
+    timings: list[StatementTiming] = []
+    for group in plan_groups(files):
+        if len(group) == 1:
+            timings += _run_file(con, group[0], profile_dir)
+            continue
+        cursors = [con.cursor() for _ in group]
+        try:
+            with ThreadPoolExecutor(max_workers=min(workers, len(group))) as pool:
+                for res in pool.map(_run_file, cursors, group, [profile_dir] * len(group)):
+                    timings += res
+        finally:
+            for cur in cursors:
+                cur.close()
+    return timings
+
 
 def main():
-    ap = argparse.ArgumentParser(description="Run a .sql file against a DuckDB database")
+    ap = argparse.ArgumentParser(description="Run .sql files against a DuckDB database")
     ap.add_argument("db", help="DuckDB database file (e.g., data/analysis.duckdb)")
-    ap.add_argument("sql", help=".sql file to execute (e.g., data/ingest/ingest_dim_metro_full.sql)")
+    ap.add_argument("sql", nargs="+", help=".sql files or globs, run in order (e.g., data/ingest/*.sql)")
+    ap.add_argument("--profile", default="build", choices=sorted(PROFILES),
+                    help="connection profile (threads, memory_limit, temp_directory, read-only)")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent independent files")
+    ap.add_argument("--profile-json", default=None,
+                    help="write per-statement timings and DuckDB profiles (EXPLAIN ANALYZE trees) here")
     args = ap.parse_args()
 
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
     db_path = Path(args.db)
-    sql_path = Path(args.sql)
+    files = resolve_files(args.sql)
 
-    sql_text = sql_path.read_text(encoding="utf-8")
+    t0 = perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        profile_dir = Path(tmp) if args.profile_json else None
+        with managed_connection(db_path, args.profile) as con:
+            timings = run_files(con, files, args.workers, profile_dir)
 
-    con = duckdb.connect(str(db_path))
-    con.execute(sql_text)
-    con.close()
+    for t in timings:
+        print(f"[run-sql] {t.source} #{t.index:<3} {t.kind:<8} {t.seconds:8.3f}s  {t.preview}")
+    print(f"[run-sql] {len(files)} files, {len(timings)} statements in {perf_counter() - t0:.2f}s")
+    if args.profile_json:
+        out = Path(args.profile_json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps([asdict(t) for t in timings], indent=1), encoding="utf-8")
+        print(f"[run-sql] profiles written to {out}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,31 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from time import perf_counter
+
 import duckdb
-import re
+
 from bls_housing.logging_config import configure_logging
+from bls_housing.pipeline.duck import DBPATH, managed_connection
+from bls_housing.settings import log_root
+from bls_housing.sql_runner import (
+    StatementTiming,
+    data_dependencies,
+    run_statements,
+    sha256_file,
+    sha256_text,
+)
 
+logger = logging.getLogger(__name__)
 
 INCLUDE_RE = re.compile(r"^\s*--\s*include:\s*(.+?)\s*$")
+MIGRATIONS_TABLE = "build_migrations"
+
 
 def expand_sql(sql_path: Path, root: Path) -> str:
     lines = []
@@ -20,20 +41,155 @@ def expand_sql(sql_path: Path, root: Path) -> str:
             lines.append(line)
     return "\n".join(lines) + "\n"
 
+
+@dataclass(frozen=True)
+class Step:
+    name: str           # include path, or "<script>#<n>" for inline SQL
+    sql: str
+    deps: tuple[Path, ...]
+    group: int          # consecutive includes share a group and run in parallel
+    include: bool = False
+
+    def checksum(self) -> str:
+        parts = [sha256_text(self.sql)] + [f"{p.name}:{sha256_file(p)}" for p in self.deps]
+        return sha256_text("\n".join(parts))
+
+
+@dataclass(frozen=True)
+class StepResult:
+    name: str
+    skipped: bool
+    seconds: float
+    timings: tuple[StatementTiming, ...] = ()
+
+
+def plan_steps(sql_path: Path, root: Path) -> list[Step]:
+    """Split a rebuild script into include steps and inline SQL steps, in order."""
+    rel_script = sql_path.resolve().relative_to(root.resolve()).as_posix()
+    steps: list[Step] = []
+    buf: list[str] = []
+
+    def add(name: str, text: str, include: bool) -> None:
+        prev = steps[-1] if steps else None
+        if prev is None:
+            group = 0
+        else:
+            group = prev.group if (include and prev.include) else prev.group + 1
+        steps.append(Step(name, text, tuple(data_dependencies(text, root)), group, include))
+
+    def flush_inline() -> None:
+        code = [ln for ln in buf if ln.strip() and not ln.strip().startswith("--")]
+        if code:
+            n = sum(1 for s in steps if s.name.startswith(f"{rel_script}#")) + 1
+            add(f"{rel_script}#{n}", "\n".join(buf).strip() + "\n", include=False)
+        buf.clear()
+
+    for line in sql_path.read_text(encoding="utf-8").splitlines():
+        m = INCLUDE_RE.match(line)
+        if m:
+            flush_inline()
+            rel = m.group(1).strip()
+            add(rel, (root / rel).resolve().read_text(encoding="utf-8"), include=True)
+        else:
+            buf.append(line)
+    flush_inline()
+    return steps
+
+
+def _ensure_migrations_table(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+          step VARCHAR PRIMARY KEY,
+          checksum VARCHAR,
+          applied_at TIMESTAMP,
+          seconds DOUBLE
+        )""")
+
+
+def _applied(con: duckdb.DuckDBPyConnection) -> dict[str, str]:
+    return dict(con.execute(f"SELECT step, checksum FROM {MIGRATIONS_TABLE}").fetchall())
+
+
+def _run_step(con: duckdb.DuckDBPyConnection, step: Step) -> StepResult:
+    t0 = perf_counter()
+    timings = run_statements(con, step.sql, source=step.name)
+    return StepResult(step.name, False, perf_counter() - t0, tuple(timings))
+
+
+def run_migrations(
+    con: duckdb.DuckDBPyConnection,
+    sql_path: Path,
+    root: Path,
+    force: bool = False,
+    max_workers: int = 4,
+) -> list[StepResult]:
+    """Apply the steps of `sql_path` whose checksum changed since the last run.
+
+    Independent include scripts (consecutive `-- include:` lines) run in parallel,
+    each on its own cursor. Checksums cover the step's SQL and any data file it
+    reads by literal path, and are stored in `build_migrations`.
+    """
+    _ensure_migrations_table(con)
+    applied = {} if force else _applied(con)
+    steps = plan_steps(sql_path, root)
+
+    results: list[StepResult] = []
+    for group in sorted({s.group for s in steps}):
+        todo = []
+        for step in (s for s in steps if s.group == group):
+            checksum = step.checksum()
+            if applied.get(step.name) == checksum:
+                logger.info("Step %s unchanged, skipping", step.name)
+                results.append(StepResult(step.name, True, 0.0))
+            else:
+                todo.append((step, checksum))
+        if not todo:
+            continue
+
+        if len(todo) == 1:
+            done = [_run_step(con, todo[0][0])]
+        else:
+            cursors = [con.cursor() for _ in todo]
+            try:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as pool:
+                    done = list(pool.map(_run_step, cursors, [s for s, _ in todo]))
+            finally:
+                for cur in cursors:
+                    cur.close()
+
+        for (step, checksum), res in zip(todo, done):
+            con.execute(
+                f"INSERT OR REPLACE INTO {MIGRATIONS_TABLE} VALUES (?, ?, now(), ?)",
+                [step.name, checksum, res.seconds],
+            )
+            results.append(res)
+    return results
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Apply data/rebuild.sql to the analysis DuckDB")
+    ap.add_argument("--force", action="store_true", help="re-run every step, ignoring checksums")
+    ap.add_argument("--workers", type=int, default=4, help="parallel include scripts")
+    args = ap.parse_args()
+
     configure_logging(level="INFO")
-    
+
     root = Path(__file__).resolve().parents[2]  # repo root
-    db_path = root / "data" / "analysis.duckdb"
+    db_path = DBPATH
     rebuild_sql = root / "data" / "rebuild.sql"
-    LOG_DIR = root / "logs"
-    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_root().mkdir(parents=True, exist_ok=True)
 
     print("Building DuckDB database...")
-    con = duckdb.connect(str(db_path))
-
-    sql = expand_sql(rebuild_sql, root)
-    con.execute(sql)
+    t0 = perf_counter()
+    with managed_connection(db_path, "build") as con:
+        results = run_migrations(con, rebuild_sql, root, force=args.force, max_workers=args.workers)
 
-    con.close()
-    print("Done.")
\ No newline at end of file
+    for res in results:
+        if res.skipped:
+            print(f"  {res.name}: unchanged")
+            continue
+        print(f"  {res.name}: {len(res.timings)} statements in {res.seconds:.3f}s")
+        for t in res.timings:
+            print(f"    #{t.index:<3} {t.kind:<8} {t.seconds:8.3f}s  {t.preview}")
+    applied = sum(not r.skipped for r in results)
+    print(f"Done. {applied} applied, {len(results) - applied} unchanged in {perf_counter() - t0:.2f}s")
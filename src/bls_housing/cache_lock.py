@@ -0,0 +1,98 @@
+"""Single-flight cache fills shared by the QCEW and Census caches.
+
+`fetch_once(target, produce)` makes sure that concurrent callers asking for the same
+cache file do the download (or conversion) only once:
+
+- within a process, callers of the same key wait on a per-key lock;
+- across processes (notebook kernels, pool workers, shard builds), they wait on an
+  advisory `fcntl.flock` on `<cache dir>/.locks/<file name>.lock`.
+
+Whoever gets the lock first writes to a unique temporary name and renames it into
+place. The others find the file when they get the lock and return it without
+downloading. Where `fcntl` is not available (Windows), only the in-process
+coalescing applies.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+LOCK_DIRNAME = ".locks"
+
+_registry_lock = threading.Lock()
+_key_locks: dict[str, threading.Lock] = {}
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _registry_lock:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def cache_lock(target: Path) -> Iterator[None]:
+    """Exclusive lock on `target` for this thread and, via flock, other processes."""
+    target = Path(target)
+    with _key_lock(str(target.resolve())):
+        if fcntl is None:
+            yield
+            return
+        lock_path = target.parent / LOCK_DIRNAME / f"{target.name}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a+b") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def unique_tmp(target: Path) -> Path:
+    """Temporary sibling of `target` that no other process or thread uses."""
+    return target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _mtime_ns(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def fetch_once(target: Path, produce: Callable[[Path], None], force: bool = False) -> Path:
+    """Return `target`, calling `produce(tmp_path)` to create it if needed.
+
+    Concurrent callers for the same target wait for one `produce` and share its
+    result. With `force`, the file is rebuilt unless another caller replaced it
+    while this one waited for the lock.
+    """
+    target = Path(target)
+    if not force and target.exists():
+        return target
+    seen = _mtime_ns(target)
+    with cache_lock(target):
+        now = _mtime_ns(target)
+        if now is not None and (not force or now != seen):
+            logger.debug("Cache fill of %s done by another caller", target.name)
+            return target
+        tmp = unique_tmp(target)
+        try:
+            produce(tmp)
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+    return target
@@ -1,7 +1,7 @@
 """Simple census area XLS cache and loader utilities.
 
 
-The cache stores files under `cache_dir/census/xls` (default: `[project root]/data/cache/census/xls`).
+The cache stores files under `cache_dir/census/xls` (default: `[cache root]/census/xls`, see `settings.cache_root()`).
 """
 
 from __future__ import annotations
@@ -13,16 +13,18 @@ from typing import Optional
 import pandas as pd
 import requests
 from bls_housing.census_txt_parser import convert_census_txt_to_csv
+from bls_housing.settings import cache_root
+from bls_housing.tiered_cache import fetch_tiered, lookup_cached
 
-# Repository root (two levels up from this file: src/bls_housing -> src -> repo root)
-REPO_ROOT = Path(__file__).resolve().parents[2]
-XLS_DIR = REPO_ROOT / "data" / "cache" / "census" / "xls"
+# [cache root]/census, see settings.cache_root()
+CENSUS_CACHE_DIR = cache_root() / "census"
+XLS_DIR = CENSUS_CACHE_DIR / "xls"
 XLS_DIR.mkdir(parents=True, exist_ok=True)
-CSV_DIR = REPO_ROOT / "data" / "cache" / "census" / "csv"
+CSV_DIR = CENSUS_CACHE_DIR / "csv"
 CSV_DIR.mkdir(parents=True, exist_ok=True)
-RAW_TXT_DIR = REPO_ROOT / "data" / "cache" / "census" / "txt"
+RAW_TXT_DIR = CENSUS_CACHE_DIR / "txt"
 RAW_TXT_DIR.mkdir(parents=True, exist_ok=True)
-CLEAN_CSV_DIR = REPO_ROOT / "data" / "cache" / "census" / "csv"
+CLEAN_CSV_DIR = CENSUS_CACHE_DIR / "csv"
 CLEAN_CSV_DIR.mkdir(parents=True, exist_ok=True)
 
 def get_census_cbsa_url(year: str, mon: str) -> str:
@@ -67,6 +69,11 @@ def _norm_mon(mon: str) -> str:
     return mon
 
 
+def _is_txt_era(year: str, mon: str) -> bool:
+    """TXT format was published through Oct 2019, XLS afterwards."""
+    return int(year) < 2019 or (int(year) == 2019 and int(mon) < 11)
+
+
 def _xls_filename(year: str, mon: str) -> str:
     mon = _norm_mon(mon)
     return f"cbsamonthly_{year}{mon}.xls"
@@ -84,17 +91,45 @@ def _ensure_cache_dir(cache_dir: str | Path = XLS_DIR) -> Path:
 
 
 def get_cached_xls_path(year: str, mon: str, cache_dir: str | Path = XLS_DIR) -> Optional[Path]:
+    """Hot cache path of the XLS for (year, mon), or None if not cached. A file only
+    in the cold tier is copied into the hot tier first (see tiered_cache.lookup_cached)."""
     p = Path(cache_dir) / _xls_filename(year, mon)
-    return p if p.exists() else None
+    return lookup_cached(p)
 
 
 def get_cached_csv_path(year: str, mon: str, cache_dir: str | Path = CSV_DIR) -> Optional[Path]:
+    """Hot cache path of the CSV for (year, mon), or None if not cached. A file only
+    in the cold tier is copied into the hot tier first (see tiered_cache.lookup_cached)."""
     p = Path(cache_dir) / _csv_filename(year, mon)
-    return p if p.exists() else None
+    return lookup_cached(p)
 
 def get_cached_txt_path(year: str, mon: str, cache_dir: str | Path = RAW_TXT_DIR) -> Optional[Path]:
+    """Hot cache path of the TXT for (year, mon), or None if not cached. A file only
+    in the cold tier is copied into the hot tier first (see tiered_cache.lookup_cached)."""
     p = Path(cache_dir) / f"tb3u{year}{_norm_mon(mon)}.txt"
-    return p if p.exists() else None
+    return lookup_cached(p)
+
+
+def get_raw_path(year: str, mon: str) -> Path:
+    """Cache path of the raw download for (year, mon): TXT before Nov 2019, XLS after.
+    The path is returned whether or not the file exists."""
+    if _is_txt_era(str(year), str(mon)):
+        return RAW_TXT_DIR / f"tb3u{year}{_norm_mon(mon)}.txt"
+    return XLS_DIR / _xls_filename(str(year), str(mon))
+
+
+def _downloader(url: str, timeout: int):
+    """`produce` callback for fetch_tiered: download `url` into the temporary path."""
+    def download(tmp_path: Path) -> None:
+        try:
+            resp = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(f"Failed to download {url}: {e}") from e
+        if resp.status_code >= 400:
+            raise RuntimeError(f"Failed to download {url}: HTTP {resp.status_code}")
+        with open(tmp_path, "wb") as fh:
+            fh.write(resp.content)
+    return download
 
 
 def fetch_census_txt(
@@ -110,19 +145,8 @@ def fetch_census_txt(
     cached = get_cached_txt_path(year, mon, cache_dir_path)
     if cached and not force_download:
         return cached       
-    url = get_census_cbsa_url(year, mon)
-    try:
-        resp = requests.get(url, timeout=timeout)
-    except requests.RequestException as e:
-        raise RuntimeError(f"Failed to download {url}: {e}") from e
-    if resp.status_code >= 400:
-        raise RuntimeError(f"Failed to download {url}: HTTP {resp.status_code}")        
     out_path = cache_dir_path / f"tb3u{year}{_norm_mon(mon)}.txt"
-    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    with open(tmp_path, "wb") as fh:
-        fh.write(resp.content)
-    tmp_path.replace(out_path)
-    return out_path
+    return fetch_tiered(out_path, _downloader(get_census_cbsa_url(year, mon), timeout), force=force_download)
 
 
 def fetch_cbsa_xls(
@@ -139,21 +163,8 @@ def fetch_cbsa_xls(
     if cached and not force_download:
         return cached
 
-    url = get_census_cbsa_url(year, mon)
-    try:
-        resp = requests.get(url, timeout=timeout)
-    except requests.RequestException as e:
-        raise RuntimeError(f"Failed to download {url}: {e}") from e
-    if resp.status_code >= 400:
-        raise RuntimeError(f"Failed to download {url}: HTTP {resp.status_code}")
-
     out_path = cache_dir_path / _xls_filename(year, mon)
-    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    with open(tmp_path, "wb") as fh:
-        fh.write(resp.content)
-    tmp_path.replace(out_path)
-
-    return out_path
+    return fetch_tiered(out_path, _downloader(get_census_cbsa_url(year, mon), timeout), force=force_download)
 
 
 def clean_and_convert_xls_to_csv(xls_path: Path, csv_path: Path) -> None:
@@ -231,20 +242,29 @@ def fetch_cbsa_csv(
         return cached
 
     # if before Nov 2019, use txt format
-    if(int(year) < 2019 or (int(year) == 2019 and int(mon) < 11)):
+    if _is_txt_era(year, mon):
         # Ensure TXT is downloaded
         txt_path = fetch_census_txt(year, mon, cache_dir=RAW_TXT_DIR, force_download=force_download)
         out_csv = Path(csv_cache_dir) / _csv_filename(year, mon)
-        convert_census_txt_to_csv(txt_path, out_csv)
-        return out_csv
+        return fetch_tiered(out_csv, lambda tmp: convert_census_txt_to_csv(txt_path, tmp), force=force_download)
 
 
     # Ensure XLS is downloaded
     xls_path = fetch_cbsa_xls(year, mon, cache_dir=xls_cache_dir, force_download=force_download)
 
     out_csv = Path(csv_cache_dir) / _csv_filename(year, mon)
-    clean_and_convert_xls_to_csv(xls_path, out_csv)
-    return out_csv
+    return fetch_tiered(out_csv, lambda tmp: clean_and_convert_xls_to_csv(xls_path, tmp), force=force_download)
+
+
+def convert_cached_raw(year: str, mon: str, csv_cache_dir: str | Path = CSV_DIR) -> Path:
+    """Re-derive the cleaned CSV from the already cached raw TXT/XLS (no download).
+    Used when a raw file was refreshed and the CSV is stale."""
+    raw = get_raw_path(year, mon)
+    if not raw.exists():
+        raise FileNotFoundError(f"No cached raw census file for {year}-{_norm_mon(mon)}: {raw}")
+    out_csv = _ensure_cache_dir(csv_cache_dir) / _csv_filename(year, mon)
+    convert = convert_census_txt_to_csv if _is_txt_era(year, mon) else clean_and_convert_xls_to_csv
+    return fetch_tiered(out_csv, lambda tmp: convert(raw, tmp), force=True)
 
 
 # Load area CSV into pandas DataFrame, with caching
@@ -285,6 +305,8 @@ __all__ = [
     "fetch_cbsa_csv",
     "get_cached_xls_path",
     "get_cached_csv_path",
+    "get_raw_path",
     "clean_and_convert_xls_to_csv",
+    "convert_cached_raw",
     "load_cbsa_df",
 ]
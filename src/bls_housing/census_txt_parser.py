@@ -8,16 +8,13 @@
 from pathlib import Path
 import pandas as pd
 import logging
-from bls_housing.logging_config import configure_logging
-
-configure_logging(level="INFO")
 logger = logging.getLogger(__name__)
 
 def _parse_census_stream(file_path: Path | str):
     code_start=49
     name_start=10
 
-    logger.info(f"Starting to parse census TXT format file: {file_path}")
+    logger.info("Starting to parse census TXT format file: %s", file_path)
     # Define exact slice positions (based on your screenshot)
     # You need to confirm the exact start index of the "GA" on line 2
     SLICE_CODE = slice(0, 9)
@@ -25,8 +22,10 @@ def _parse_census_stream(file_path: Path | str):
     SLICE_NAME_MULTI_LINE = slice(0, code_start) # For continuation lines
     SLICE_DATA = slice(code_start, None) # The rest of the line
 
-    logger.info(f"Parsing file: {file_path}")
+    logger.info("Parsing file: %s", file_path)
     
+    # checked once: the per-line debug call is skipped entirely unless enabled
+    debug = logger.isEnabledFor(logging.DEBUG)
     with open(file_path, 'r', encoding='latin1') as f:
         buffer_code = None
         buffer_name = None
@@ -34,7 +33,8 @@ def _parse_census_stream(file_path: Path | str):
         for line in f:
             line_no += 1
 
-            logger.debug(f"Processing line {line_no}: {line.rstrip()}")
+            if debug:
+                logger.debug("Processing line %d: %s", line_no, line.rstrip())
 
             if(line_no < 12): 
                 continue # Skip header lines  # noqa: E701
@@ -77,15 +77,15 @@ def _parse_census_stream(file_path: Path | str):
 
             else:
                 # SCENARIO: Continuation Line (Starts with spaces)
-                logger.debug(f"Continuation line detected at line {line_no}.")
+                logger.debug("Continuation line detected at line %d.", line_no)
                 if buffer_code:
                     # Merge with buffer
                     if(buffer_name is None):
                         raise ValueError(f"Buffer name is None when processing continuation line at line {line_no}")
                     full_name = buffer_name + " " + line[SLICE_NAME_MULTI_LINE].strip()
-                    logger.debug(f"Continuation line found. Merged name: {full_name}")
+                    logger.debug("Continuation line found. Merged name: %s", full_name)
                     raw_data = line[SLICE_DATA]
-                    logger.debug(f"Continuation line raw data: {raw_data.strip()}")
+                    logger.debug("Continuation line raw data: %s", raw_data.strip())
                     yield {
                         "code": buffer_code, 
                         "name": full_name, 
@@ -107,14 +107,14 @@ def convert_parsed_record(record):
     code_values = record["code"].strip().split()
 
     if len(code_values) != 2:
-        logger.error(f"Unexpected code format: {record['code']}")
+        logger.error("Unexpected code format: %s", record['code'])
         raise ValueError(f"Unexpected code format: {record['code']}")
     if len(data_values) != 7:
-        logger.error(f"Unexpected data length: {record['raw_data']}")
+        logger.error("Unexpected data length: %s", record['raw_data'])
         raise ValueError(f"Unexpected data length: {record['raw_data']}")
     for value in data_values:
         if not value.replace('.', '', 1).isdigit():
-            logger.error(f"Non-numeric data value found: {value}")
+            logger.error("Non-numeric data value found: %s", value)
             raise ValueError(f"Non-numeric data value found: {value}")
         
     structured_record = {
@@ -142,11 +142,11 @@ def convert_census_txt_to_csv(txt_path: Path, csv_path: Path) -> None:
             structured_record = convert_parsed_record(parsed_record)
             records.append(structured_record)
         except ValueError as e:
-            logger.error(f"Error converting record: {e}")
+            logger.error("Error converting record: %s", e)
 
     df = pd.DataFrame(records)
     df.to_csv(csv_path, index=False)
-    logger.info(f"Converted TXT file {txt_path} to CSV file {csv_path}")
+    logger.info("Converted TXT file %s to CSV file %s", txt_path, csv_path)
 
 
 def convert_census_txt_to_data_frame(txt_path: Path) -> 'pd.DataFrame':
@@ -159,7 +159,7 @@ def convert_census_txt_to_data_frame(txt_path: Path) -> 'pd.DataFrame':
             structured_record = convert_parsed_record(parsed_record)
             records.append(structured_record)
         except ValueError as e:
-            logger.error(f"Error converting record: {e}")
+            logger.error("Error converting record: %s", e)
 
     df = pd.DataFrame(records)
     return df
@@ -1,3 +1,5 @@
+import pandas as pd
+
 # quarter mapping to month
 QUARTER_TO_MONTH = {
     "1": ["01", "02", "03"],
@@ -23,3 +25,8 @@ CPI_U = {
     "2024": 314.175  # Preliminary 2024 avg (or use Dec 2024 spot)
 }
 
+
+def pct_change_unfilled(df: pd.DataFrame, col: str, by: str = "Code") -> pd.Series:
+    """`df.groupby(by)[col].pct_change()` without filling: a missing year stays missing
+    and so does the change of the year after it. Rows must be sorted by year."""
+    return df[col] / df.groupby(by)[col].shift(1) - 1
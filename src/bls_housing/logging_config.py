@@ -1,29 +1,122 @@
+"""Root logging setup for entrypoints.
+
+By default records go synchronously to the console and logs/bls_housing.log. With
+`queue=True` (or `BLS_LOG_QUEUE=1`, or `queue = true` under `[logging]` in the config
+file) the root logger only gets a QueueHandler: callers enqueue the record and a
+QueueListener thread does the formatting and file I/O. The queue is a
+multiprocessing queue, so process-pool workers log through it as well:
+
+    ProcessPoolExecutor(initializer=configure_worker_logging,
+                        initargs=worker_logging_initargs())
+
+`json=True` (`BLS_LOG_JSON=1`) writes one JSON object per record instead of text.
+Library code should log with %-style arguments (`logger.debug("line %d", n)`) so
+disabled records are never formatted.
+"""
+
 from __future__ import annotations
 
+import atexit
+import json as jsonlib
 import logging
 import logging.config
-from pathlib import Path
+import logging.handlers
+import multiprocessing
 
-LOG_DIR = Path(__file__).resolve().parents[2] / "logs"
+from bls_housing.settings import env_value, get_section, log_root, parse_bool
+
+LOG_DIR = log_root()
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+_queue = None
+
+# LogRecord attributes that are not `extra=` fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
 
 
-    
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra=` fields are included as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "process": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return jsonlib.dumps(out, default=str)
+
+
+def _option(name: str, env: str, value: bool | None) -> bool:
+    if value is not None:
+        return value
+    raw = env_value(env)
+    if raw is None:
+        raw = get_section("logging").get(name, False)
+    return parse_bool(raw)
+
+
+def _build_handlers(level: str, log_file: str | None, json: bool) -> list[logging.Handler]:
+    formatter = JsonFormatter() if json else logging.Formatter(TEXT_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if log_file is not None:
+        handlers.append(logging.FileHandler(LOG_DIR / log_file, encoding="utf-8"))
+    for h in handlers:
+        h.setLevel(level)
+        h.setFormatter(formatter)
+    return handlers
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def configure_logging(
     *,
     level: str = "INFO",
     log_file: str | None = "bls_housing.log",
+    queue: bool | None = None,
+    json: bool | None = None,
 ) -> None:
     """
     Configure root logging once for the whole app.
     Call this from entrypoints only (scripts/CLI/notebook top cell).
+    `queue` and `json` default to BLS_LOG_QUEUE / BLS_LOG_JSON, then the [logging]
+    config section.
     """
+    global _listener, _queue
     root = logging.getLogger()
     if root.handlers:
         return  # already configured
-    
+
+    queue = _option("queue", "BLS_LOG_QUEUE", queue)
+    json = _option("json", "BLS_LOG_JSON", json)
+
+    if queue:
+        # a spawn-context queue can be handed to fork, forkserver and spawn workers
+        _queue = multiprocessing.get_context("spawn").Queue(-1)
+        _listener = logging.handlers.QueueListener(
+            _queue, *_build_handlers(level, log_file, json), respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_stop_listener)
+        root.addHandler(logging.handlers.QueueHandler(_queue))
+        root.setLevel(level)
+        return
+
+    formatter = {"()": JsonFormatter} if json else {"format": TEXT_FORMAT}
     handlers: dict = {
         "console": {
             "class": "logging.StreamHandler",
@@ -48,11 +141,7 @@ def configure_logging(
         {
             "version": 1,
             "disable_existing_loggers": False,  # critical for 3rd party libs
-            "formatters": {
-                "standard": {
-                    "format": "%(asctime)s %(levelname)s %(name)s: %(message)s"
-                }
-            },
+            "formatters": {"standard": formatter},
             "handlers": handlers,
             "root": {
                 "level": level,
@@ -60,3 +149,21 @@ def configure_logging(
             },
         }
     )
+
+
+def worker_logging_initargs() -> tuple:
+    """Arguments for `configure_worker_logging` in a process pool initializer."""
+    root = logging.getLogger()
+    return (_queue, root.level)
+
+
+def configure_worker_logging(queue, level: int = logging.INFO) -> None:
+    """Process-pool initializer: route the worker's records into the parent's queue.
+    Without a queue (queue mode off) the worker keeps its inherited handlers."""
+    if queue is None:
+        return
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level)
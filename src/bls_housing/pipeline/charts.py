@@ -0,0 +1,291 @@
+# bls_housing/pipeline/charts.py
+"""Headless, parallel chart rendering from the marts.
+
+Charts are written to stable paths under `outputs/charts/`:
+- metros/<Code>_zoning.png, metros/<Code>_cumulative.png   (one per metro)
+- small_multiples/<kind>_<page>.png                         (grid of metros per page)
+
+Each chart's input series is hashed together with the chart spec and dpi; a chart whose hash
+matches `manifest.json` and whose file exists is skipped. Rendering runs in a process
+pool using the Agg canvas directly (no pyplot state), in batches per worker.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from bls_housing.logging_config import configure_worker_logging, worker_logging_initargs
+from bls_housing.pipeline.duck import DBPATH, managed_connection
+from bls_housing.settings import outputs_root
+
+logger = logging.getLogger(__name__)
+
+CHARTS_DIR = outputs_root() / "charts"
+MANIFEST_NAME = "manifest.json"
+
+# bump when the drawing code changes so every chart re-renders once
+RENDER_VERSION = 1
+
+# kind -> (mart table, value column, title, y label)
+CHART_KINDS: dict[str, tuple[str, str, str, str]] = {
+    "zoning": (
+        "annual_metrics", "Zoning_Pressure",
+        "Zoning Pressure Index (inflation adjusted)",
+        "Pressure (>1 means Demand outpaces Supply)",
+    ),
+    "cumulative": (
+        "cumulative_metrics", "Structural_Gap",
+        "Cumulative Housing Deficit (inflation adjusted)",
+        "Deficit Index (1.2 = Demand is 20% ahead of Supply)",
+    ),
+}
+
+SMALL_MULTIPLES_PER_PAGE = 20  # 5 x 4 grid
+BATCH_SIZE = 16
+
+
+@dataclass(frozen=True)
+class ChartJob:
+    out_path: str
+    digest: str
+    kind: str
+    title: str
+    ylabel: str
+    years: np.ndarray
+    series: tuple[tuple[str, np.ndarray], ...]  # (label, values) per metro
+    small_multiples: bool = False
+
+
+def load_pivots(
+    con: duckdb.DuckDBPyConnection,
+    codes: list[int] | None = None,
+) -> dict[str, tuple[pd.DataFrame, dict[int, str]]]:
+    """Return kind -> (Year x Code pivot, Code -> label) for the requested metros.
+    `codes=None` means every metro in the marts; an empty list selects none."""
+    out = {}
+    for kind, (table, value_col, _, _) in CHART_KINDS.items():
+        sql = f"SELECT Area, Code, Year, {value_col} AS v FROM {table}"
+        args: list = []
+        if codes is not None:
+            sql += " WHERE Code IN (SELECT * FROM UNNEST(?))"
+            args.append(codes)
+        df = con.execute(sql, args).df()
+        df["v"] = df["v"].replace([np.inf, -np.inf], np.nan)
+        pivot = df.pivot_table(index="Year", columns="Code", values="v", aggfunc="last", dropna=False)
+        first = df.drop_duplicates("Code")
+        labels = {int(c): f"{a}, {c}" for a, c in zip(first["Area"], first["Code"])}
+        out[kind] = (pivot.sort_index(), labels)
+    return out
+
+
+def _digest(kind: str, years: np.ndarray, series: tuple[tuple[str, np.ndarray], ...], dpi: int) -> str:
+    h = hashlib.sha256()
+    h.update(f"{RENDER_VERSION}|{kind}|{dpi}".encode())
+    h.update(np.ascontiguousarray(years, dtype="int64").tobytes())
+    for label, values in series:
+        h.update(label.encode())
+        h.update(np.ascontiguousarray(values, dtype="float64").tobytes())
+    return h.hexdigest()
+
+
+def plan_jobs(
+    pivots: dict[str, tuple[pd.DataFrame, dict[int, str]]],
+    out_dir: Path = CHARTS_DIR,
+    per_page: int = SMALL_MULTIPLES_PER_PAGE,
+    dpi: int = 100,
+) -> list[ChartJob]:
+    jobs: list[ChartJob] = []
+    for kind, (pivot, labels) in pivots.items():
+        _, _, title, ylabel = CHART_KINDS[kind]
+        years = pivot.index.to_numpy(dtype="int64")
+        codes = sorted((int(c) for c in pivot.columns), key=lambda c: labels.get(c, str(c)))
+
+        for code in codes:
+            series: tuple[tuple[str, np.ndarray], ...] = (
+                (labels.get(code, str(code)), pivot[code].to_numpy(dtype="float64")),
+            )
+            jobs.append(ChartJob(
+                out_path=str(out_dir / "metros" / f"{code}_{kind}.png"),
+                digest=_digest(kind, years, series, dpi),
+                kind=kind, title=f"{title}\n{series[0][0]}", ylabel=ylabel,
+                years=years, series=series,
+            ))
+
+        for page, start in enumerate(range(0, len(codes), per_page), start=1):
+            series = tuple(
+                (labels.get(c, str(c)), pivot[c].to_numpy(dtype="float64"))
+                for c in codes[start:start + per_page]
+            )
+            jobs.append(ChartJob(
+                out_path=str(out_dir / "small_multiples" / f"{kind}_{page:03d}.png"),
+                digest=_digest(f"{kind}|sm", years, series, dpi),
+                kind=kind, title=title, ylabel=ylabel,
+                years=years, series=series, small_multiples=True,
+            ))
+    return jobs
+
+
+def _render_one(job: ChartJob, dpi: int) -> None:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if job.small_multiples:
+        ncols = 5
+        nrows = max(1, -(-len(job.series) // ncols))
+        fig = Figure(figsize=(3.2 * ncols, 2.4 * nrows))
+        axes = fig.subplots(nrows, ncols, sharex=True, squeeze=False).ravel()
+        for ax, (label, values) in zip(axes, job.series):
+            ax.plot(job.years, values, marker="o", markersize=2, linewidth=1.2)
+            ax.axhline(y=1.0, color="black", linestyle="--", alpha=0.5, linewidth=0.8)
+            ax.set_title(label, fontsize=8)
+            ax.tick_params(labelsize=7)
+            ax.grid(True, linestyle="--", alpha=0.3)
+        for ax in axes[len(job.series):]:
+            ax.set_visible(False)
+        fig.suptitle(job.title)
+        fig.subplots_adjust(left=0.04, right=0.99, bottom=0.05, top=0.92, hspace=0.45, wspace=0.22)
+    else:
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        (label, values), = job.series
+        ax.plot(job.years, values, marker="o", linewidth=2, label=label)
+        ax.axhline(y=1.0, color="black", linestyle="--", alpha=0.5, label="Balanced (1.0)")
+        ax.set_title(job.title)
+        ax.set_ylabel(job.ylabel)
+        ax.set_xlabel("Year")
+        ax.legend(loc="upper left")
+        ax.grid(True, linestyle="--", alpha=0.3)
+        fig.subplots_adjust(left=0.08, right=0.98, bottom=0.1, top=0.88)
+
+    # fixed margins instead of tight_layout: avoids an extra full draw per chart
+    out = Path(job.out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(f".{os.getpid()}.tmp.png")
+    FigureCanvasAgg(fig)
+    fig.savefig(tmp, dpi=dpi, format="png")
+    tmp.replace(out)
+
+
+def _render_batch(jobs: list[ChartJob], dpi: int) -> list[tuple[str, str]]:
+    done = []
+    for job in jobs:
+        _render_one(job, dpi)
+        done.append((job.out_path, job.digest))
+    return done
+
+
+def _init_worker(log_queue=None, log_level: int = logging.INFO) -> None:
+    configure_worker_logging(log_queue, log_level)
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _prune_pages(out_dir: Path, jobs: list[ChartJob], manifest: dict[str, str]) -> int:
+    """Delete small-multiple pages not produced by this run, e.g. page 7 after the
+    selection shrank to 6 pages. Returns the number of files removed."""
+    keep = {Path(j.out_path).name for j in jobs if j.small_multiples}
+    removed = 0
+    for path in (out_dir / "small_multiples").glob("*.png"):
+        if path.name not in keep:
+            path.unlink(missing_ok=True)
+            manifest.pop(os.path.relpath(path, out_dir), None)
+            removed += 1
+    if removed:
+        logger.info("Removed %d stale small-multiple pages", removed)
+    return removed
+
+
+def _read_manifest(out_dir: Path) -> dict[str, str]:
+    p = out_dir / MANIFEST_NAME
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+
+
+def _write_manifest(out_dir: Path, manifest: dict[str, str]) -> None:
+    p = out_dir / MANIFEST_NAME
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(p)
+
+
+def render_charts(
+    con: duckdb.DuckDBPyConnection,
+    codes: list[int] | None = None,
+    out_dir: Path = CHARTS_DIR,
+    workers: int | None = None,
+    dpi: int = 100,
+    force: bool = False,
+) -> tuple[int, int]:
+    """Render per-metro and small-multiple charts; returns (rendered, skipped)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = plan_jobs(load_pivots(con, codes), out_dir, dpi=dpi)
+
+    manifest = _read_manifest(out_dir)
+    if _prune_pages(out_dir, jobs, manifest):
+        _write_manifest(out_dir, manifest)
+    key = lambda j: os.path.relpath(j.out_path, out_dir)  # noqa: E731
+    todo = [
+        j for j in jobs
+        if force or manifest.get(key(j)) != j.digest or not Path(j.out_path).exists()
+    ]
+    skipped = len(jobs) - len(todo)
+    if not todo:
+        return (0, skipped)
+
+    batches = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+    if workers == 1 or len(batches) == 1:
+        _init_worker()
+        results = [_render_batch(b, dpi) for b in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=worker_logging_initargs()) as pool:
+            results = list(pool.map(_render_batch, batches, [dpi] * len(batches)))
+
+    for batch in results:
+        for out_path, digest in batch:
+            manifest[os.path.relpath(out_path, out_dir)] = digest
+    _write_manifest(out_dir, manifest)
+    return (len(todo), skipped)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Render zoning / cumulative deficit charts from the marts")
+    ap.add_argument("--db", default=str(DBPATH), help="DuckDB database file")
+    ap.add_argument("--codes", default=None, help="comma-separated CBSA codes (default: all in marts)")
+    ap.add_argument("--title", default=None, help="select metros by dim_metro_full.Title (e.g. TX)")
+    ap.add_argument("--out", default=str(CHARTS_DIR), help="output directory")
+    ap.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    ap.add_argument("--dpi", type=int, default=100)
+    ap.add_argument("--force", action="store_true", help="re-render even if inputs are unchanged")
+    args = ap.parse_args()
+
+    t0 = perf_counter()
+    print("[render-charts] starting...")
+    with managed_connection(args.db, "query") as con:
+        codes = [int(c) for c in args.codes.split(",")] if args.codes else None
+        if args.title:
+            rows = con.execute("SELECT Code FROM dim_metro_full WHERE Title = ?", [args.title]).fetchall()
+            if not rows:
+                ap.error(f"--title {args.title!r} matches no metro in dim_metro_full")
+            codes = sorted(set(codes or []) | {int(r[0]) for r in rows})
+        rendered, skipped = render_charts(
+            con, codes, Path(args.out), workers=args.workers, dpi=args.dpi, force=args.force
+        )
+    print(f"[render-charts] rendered: {rendered}, skipped (unchanged): {skipped}")
+    print(f"[render-charts] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
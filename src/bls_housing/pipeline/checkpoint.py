@@ -0,0 +1,140 @@
+# bls_housing/pipeline/checkpoint.py
+"""Run journal for resumable builds.
+
+The pandas builders fetch and parse one file per metro-quarter (wages) or read one
+file per month (permits), then keep everything in memory until the end. With a
+`RunJournal` every completed (Code, Year) unit is buffered and flushed in batches:
+
+    data/derived/checkpoints/annual_wages-<run key>/part-00000.parquet
+    data/derived/checkpoints/annual_wages-<run key>/journal.jsonl
+
+A part file is written under a temporary name and renamed before its journal line is
+appended, so a line always refers to a complete part. The run key hashes the target
+and parameters (metros, years, quarters). A restarted run with the same parameters
+finds the journal, reloads the finished units and only builds the rest. `finish()`
+removes the checkpoint once the result is stored in the derived parquet.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, cast
+
+import pandas as pd
+
+from bls_housing.settings import derived_root
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ROOT = derived_root() / "checkpoints"
+JOURNAL_FILE = "journal.jsonl"
+BATCH_UNITS = 25
+
+
+def run_key(target: str, codes: Iterable[int], years: Iterable[int], quarters: Iterable[int]) -> str:
+    params = {
+        "target": target,
+        "codes": sorted(int(c) for c in codes),
+        "years": sorted(int(y) for y in years),
+        "quarters": sorted(int(q) for q in quarters),
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class RunJournal:
+    """Batched, append-only checkpoint of completed (Code, Year) units of one run."""
+
+    def __init__(
+        self,
+        target: str,
+        codes: Iterable[int],
+        years: Iterable[int],
+        quarters: Iterable[int] = (1, 2, 3, 4),
+        root: Path = CHECKPOINT_ROOT,
+        batch_units: int = BATCH_UNITS,
+    ) -> None:
+        self.target = target
+        self.key = run_key(target, codes, years, quarters)
+        self.dir = root / f"{target}-{self.key}"
+        self.batch_units = batch_units
+        self._pending: dict[tuple[int, int], list[dict]] = {}
+        self._done: dict[tuple[int, int], list[dict]] | None = None
+        self.skipped = 0
+
+    @property
+    def journal_path(self) -> Path:
+        return self.dir / JOURNAL_FILE
+
+    def _entries(self) -> list[dict]:
+        if not self.journal_path.exists():
+            return []
+        entries = []
+        for line in self.journal_path.read_text(encoding="utf-8").splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # torn last line of an interrupted append; its part is rewritten later
+                logger.warning("Ignoring unreadable journal line in %s", self.journal_path)
+        return entries
+
+    def load(self) -> dict[tuple[int, int], list[dict]]:
+        """Rows of every unit flushed by earlier attempts of this run, by unit."""
+        if self._done is None:
+            self._done = {}
+            for entry in self._entries():
+                part = pd.read_parquet(self.dir / entry["part"])
+                for key, rows in part.groupby(["Code", "Year"], sort=False):
+                    code, year = cast(tuple[int, int], key)
+                    self._done[(int(code), int(year))] = rows.to_dict("records")
+            if self._done:
+                logger.info("Resuming %s run %s: %d units already done", self.target, self.key, len(self._done))
+        return self._done
+
+    def done(self, code: int, year: int) -> list[dict] | None:
+        rows = self.load().get((int(code), int(year)))
+        if rows is not None:
+            self.skipped += 1
+        return rows
+
+    def add(self, code: int, year: int, rows: list[dict]) -> None:
+        self._pending[(int(code), int(year))] = rows
+        if len(self._pending) >= self.batch_units:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        n = len(self._entries())
+        name = f"part-{n:05d}.parquet"
+        tmp = self.dir / f".{name}.{os.getpid()}"
+        pd.DataFrame([r for rows in self._pending.values() for r in rows]).to_parquet(tmp, index=False)
+        os.replace(tmp, self.dir / name)
+        line = json.dumps({
+            "part": name,
+            "units": [list(u) for u in self._pending],
+            "at": datetime.now().isoformat(),
+        })
+        with open(self.journal_path, "a+b") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell():
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1) != b"\n":
+                    fh.write(b"\n")   # terminate a torn line from an interrupted append
+            fh.write(line.encode("utf-8") + b"\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.load().update(self._pending)
+        logger.debug("Checkpointed %d %s units to %s", len(self._pending), self.target, name)
+        self._pending = {}
+
+    def finish(self) -> None:
+        """Drop the checkpoint after the run's output has been stored."""
+        self._pending = {}
+        shutil.rmtree(self.dir, ignore_errors=True)
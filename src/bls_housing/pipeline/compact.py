@@ -0,0 +1,237 @@
+# bls_housing/pipeline/compact.py
+"""Compaction of the QCEW parquet lake.
+
+`build-parquet-lake` writes one small file per cbsa_code=/year=/quarter= directory,
+so a full lake is thousands of tiny files and scans are dominated by file opens and
+footer reads. `compact-lake` rewrites it into a read-optimized copy:
+
+    data/lake/bls_compact/<version>/year=2020/data_0.parquet
+    data/lake/bls_compact/<version>/manifest.json
+    data/lake/bls_compact/CURRENT            -> "<version>"
+
+Rows are sorted by (cbsa_code, year, quarter, agglvl_code), so per-row-group min/max
+statistics prune metro and quarter filters. Files are zstd compressed with
+dictionary encoding and capped at a target size. The version directory is renamed
+into place and CURRENT is swapped with os.replace, so readers see either the old
+or the new compacted lake, never a partial one.
+
+The small-file layout stays the ingest layer. `build_bls_parquet` touches
+`data/lake/bls/_last_write` whenever it adds files, and `lake_glob()` only returns the
+compacted copy while it is newer than that marker.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+
+from bls_housing.pipeline.duck import fetch_scalar, managed_connection
+from bls_housing.settings import lake_root
+
+logger = logging.getLogger(__name__)
+
+LAKE_ROOT = lake_root() / "bls"
+COMPACT_ROOT = lake_root() / "bls_compact"
+LAST_WRITE_MARKER = "_last_write"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+SORT_KEYS = ("cbsa_code", "year", "quarter", "agglvl_code")
+ROW_GROUP_SIZE = 100_000
+TARGET_FILE_SIZE = "256MB"
+ZSTD_LEVEL = 6
+KEEP_VERSIONS = 2
+
+
+@dataclass(frozen=True)
+class LayoutStats:
+    files: int
+    bytes: int
+    scan_seconds: float
+
+
+def _sql_str(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def raw_glob(lake_root: Path = LAKE_ROOT) -> str:
+    return str(lake_root / "cbsa_code=*" / "year=*" / "quarter=*" / "data.parquet")
+
+
+def current_version(compact_root: Path = COMPACT_ROOT) -> str | None:
+    try:
+        return (compact_root / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def touch_last_write(lake_root: Path = LAKE_ROOT) -> None:
+    """Mark the ingest layer as changed (called by build_bls_parquet)."""
+    marker = lake_root / LAST_WRITE_MARKER
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.write_text(datetime.now().isoformat(), encoding="utf-8")
+
+
+def _last_write_ns(lake_root: Path) -> int:
+    try:
+        return (lake_root / LAST_WRITE_MARKER).stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def compact_is_fresh(lake_root: Path = LAKE_ROOT, compact_root: Path = COMPACT_ROOT) -> bool:
+    version = current_version(compact_root)
+    if version is None:
+        return False
+    try:
+        manifest = json.loads((compact_root / version / MANIFEST_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return False
+    return _last_write_ns(lake_root) <= manifest.get("source_last_write_ns", -1)
+
+
+def lake_glob(prefer_compact: bool = True, lake_root: Path = LAKE_ROOT,
+              compact_root: Path = COMPACT_ROOT) -> str:
+    """Parquet glob to scan: the current compacted lake while it is fresh, else the
+    small-file ingest layer. Both carry hive partition columns."""
+    version = current_version(compact_root)
+    if prefer_compact and version is not None and compact_is_fresh(lake_root, compact_root):
+        return str(compact_root / version / "year=*" / "*.parquet")
+    return raw_glob(lake_root)
+
+
+def layout_stats(con: duckdb.DuckDBPyConnection, glob: str) -> LayoutStats:
+    """File count, bytes and the time of a representative scan (metro totals)."""
+    files = [Path(r[0]) for r in con.execute("SELECT file FROM glob(?)", [glob]).fetchall()]
+    size = sum(p.stat().st_size for p in files)
+    if not files:
+        return LayoutStats(0, 0, 0.0)
+    t0 = perf_counter()
+    con.execute(f"""
+        SELECT cbsa_code, year, sum(total_qtrly_wages)
+        FROM read_parquet({_sql_str(glob)}, hive_partitioning=true, union_by_name=true)
+        WHERE agglvl_code = 40
+        GROUP BY ALL
+        """).fetchall()
+    return LayoutStats(len(files), size, perf_counter() - t0)
+
+
+def _prune(compact_root: Path, keep: int) -> None:
+    current = current_version(compact_root)
+    versions = sorted(p for p in compact_root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in versions[:-keep] if keep > 0 else []:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def compact_lake(
+    con: duckdb.DuckDBPyConnection,
+    lake_root: Path = LAKE_ROOT,
+    compact_root: Path = COMPACT_ROOT,
+    row_group_size: int = ROW_GROUP_SIZE,
+    target_file_size: str = TARGET_FILE_SIZE,
+    zstd_level: int = ZSTD_LEVEL,
+    keep: int = KEEP_VERSIONS,
+) -> str | None:
+    """Write a new compacted version of the lake and make it current. Returns the
+    version id, or None if the ingest layer is empty."""
+    source_last_write = _last_write_ns(lake_root)
+    src = raw_glob(lake_root)
+    years = [r[0] for r in con.execute(f"""
+        SELECT DISTINCT year FROM read_parquet({_sql_str(src)}, hive_partitioning=true, union_by_name=true)
+        ORDER BY 1
+        """).fetchall()] if fetch_scalar(con, "SELECT count(*) FROM glob(?)", [src]) else []
+    if not years:
+        logger.info("No lake files under %s", lake_root)
+        return None
+
+    compact_root.mkdir(parents=True, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    staging = compact_root / f".{version}.tmp"
+    staging.mkdir()
+    rows = 0
+    # the build profile turns insertion order off, which may let COPY write the
+    # sorted result out of order
+    preserve = fetch_scalar(con, "SELECT current_setting('preserve_insertion_order')")
+    con.execute("SET preserve_insertion_order = true")
+    try:
+        # COPY cannot combine PARTITION_BY with FILE_SIZE_BYTES, so one COPY per year;
+        # each reads only that year's partitions.
+        for year in years:
+            year_glob = str(lake_root / "cbsa_code=*" / f"year={year}" / "quarter=*" / "data.parquet")
+            out_dir = staging / f"year={year}"
+            out_dir.mkdir()
+            rows += fetch_scalar(con, f"""
+                COPY (
+                    SELECT * EXCLUDE (year)
+                    FROM read_parquet({_sql_str(year_glob)}, hive_partitioning=true, union_by_name=true)
+                    ORDER BY {', '.join(SORT_KEYS)}
+                )
+                TO {_sql_str(out_dir)}
+                (FORMAT PARQUET, COMPRESSION zstd, COMPRESSION_LEVEL {int(zstd_level)},
+                 ROW_GROUP_SIZE {int(row_group_size)}, FILE_SIZE_BYTES {_sql_str(target_file_size)},
+                 FILENAME_PATTERN 'data_{{i}}')
+                """)
+        manifest = {
+            "version": version,
+            "rows": int(rows),
+            "years": [int(y) for y in years],
+            "sort_keys": list(SORT_KEYS),
+            "row_group_size": row_group_size,
+            "source_last_write_ns": source_last_write,
+        }
+        (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(staging, compact_root / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        con.execute(f"SET preserve_insertion_order = {'true' if preserve else 'false'}")
+
+    tmp = compact_root / f".{CURRENT_FILE}.{os.getpid()}"
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, compact_root / CURRENT_FILE)
+    _prune(compact_root, keep)
+    logger.info("Compacted lake version %s: %d rows, %d years", version, rows, len(years))
+    return version
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compact the QCEW parquet lake into right-sized files")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    ap.add_argument("--target-file-size", default=TARGET_FILE_SIZE, help="e.g. 128MB, 256MB")
+    ap.add_argument("--zstd-level", type=int, default=ZSTD_LEVEL)
+    ap.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="compacted versions to keep")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[compact-lake] starting...")
+    with managed_connection(profile="build") as con:
+        before = layout_stats(con, raw_glob())
+        version = compact_lake(con, row_group_size=args.row_group_size,
+                               target_file_size=args.target_file_size,
+                               zstd_level=args.zstd_level, keep=args.keep)
+        if version is None:
+            print("[compact-lake] no lake files found; run build-parquet-lake first.")
+            return 0
+        after = layout_stats(con, lake_glob())
+    for label, s in (("before", before), ("after", after)):
+        print(f"[compact-lake] {label:<6} files: {s.files:>6}  bytes: {s.bytes:>12,}  scan: {s.scan_seconds:.3f}s")
+    print(f"[compact-lake] current={version} done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,319 @@
+# bls_housing/pipeline/county.py
+"""County-level BPS permits and county -> CBSA / CSA rollups.
+
+Inputs are local files (nothing is downloaded):
+- BPS monthly county files, e.g. data/raw/bps_county/co2401c.txt
+  (two header lines, then Survey Date, FIPS State, FIPS County, Region, Division,
+  County Name and Bldgs/Units/Value for 1-unit, 2-unit, 3-4 unit and 5+ unit buildings)
+- OMB delineation files ("list1"), one per vintage, e.g.
+  data/raw/delineations/list1_2015.xls (the July 2015 vintage summarised in
+  docs/gtcbsa_gtco_aug_2015.pdf). CSV, XLS or XLSX; the header row is located
+  automatically.
+
+Tables:
+- permits_county_monthly  (County_FIPS, Year, Month, units by size class, Total_Units)
+- dim_county_cbsa         (Vintage, County_FIPS, CBSA / division / CSA codes and titles)
+- permits_geo_rollup      (Vintage, Level, Geo_Code, Geo_Name, Year, Month, Total_Units, ...)
+
+`rollup_permits(con, vintage)` materializes CBSA, metro division and CSA totals with
+one GROUPING SETS aggregation over the county facts, so switching delineation
+vintages (or adding a custom county grouping) is a re-rollup, not a re-download.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import re
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import pandas as pd
+
+from bls_housing.pipeline.duck import fetch_scalar, managed_connection, mark_built
+from bls_housing.settings import data_root
+
+logger = logging.getLogger(__name__)
+
+COUNTY_RAW_DIR = data_root() / "raw" / "bps_county"
+DELINEATION_DIR = data_root() / "raw" / "delineations"
+
+COUNTY_FILE_GLOB = "co[0-9][0-9][0-9][0-9]c.txt"
+VINTAGE_RE = re.compile(r"(\d{4})")
+
+# delineation header -> dim_county_cbsa column
+DELINEATION_COLUMNS = {
+    "CBSA Code": "CBSA_Code",
+    "Metropolitan Division Code": "Division_Code",
+    "Metro Division Code": "Division_Code",
+    "CSA Code": "CSA_Code",
+    "CBSA Title": "CBSA_Title",
+    "Metropolitan/Micropolitan Statistical Area": "Metro_Micro",
+    "Metropolitan Division Title": "Division_Title",
+    "CSA Title": "CSA_Title",
+    "County/County Equivalent": "County_Name",
+    "State Name": "State_Name",
+    "FIPS State Code": "State_FIPS",
+    "FIPS County Code": "County_FIPS3",
+    "Central/Outlying County": "Central_Outlying",
+}
+
+
+def _sql_str(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# ---- county permits ------------------------------------------------------------------
+
+def ensure_county_tables(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS permits_county_monthly (
+          County_FIPS VARCHAR,      -- 5 digit state + county
+          State_FIPS VARCHAR,
+          County_Name VARCHAR,
+          Year BIGINT,
+          Month BIGINT,
+          Units_1 BIGINT,
+          Units_2 BIGINT,
+          Units_3_4 BIGINT,
+          Units_5_Plus BIGINT,
+          Total_Units BIGINT,
+          Total_Buildings BIGINT,
+          Total_Value BIGINT
+        );
+        CREATE TABLE IF NOT EXISTS dim_county_cbsa (
+          Vintage BIGINT,
+          County_FIPS VARCHAR,
+          State_FIPS VARCHAR,
+          County_Name VARCHAR,
+          State_Name VARCHAR,
+          CBSA_Code BIGINT,
+          CBSA_Title VARCHAR,
+          Metro_Micro VARCHAR,
+          Division_Code BIGINT,
+          Division_Title VARCHAR,
+          CSA_Code BIGINT,
+          CSA_Title VARCHAR,
+          Central_Outlying VARCHAR
+        );
+        CREATE TABLE IF NOT EXISTS permits_geo_rollup (
+          Vintage BIGINT,
+          Level VARCHAR,            -- cbsa | division | csa | <custom grouping name>
+          Geo_Code VARCHAR,
+          Geo_Name VARCHAR,
+          Year BIGINT,
+          Month BIGINT,
+          Total_Units BIGINT,
+          Units_1 BIGINT,
+          Units_5_Plus BIGINT,
+          Counties BIGINT
+        );
+        """)
+
+
+def ingest_county_permits(
+    con: duckdb.DuckDBPyConnection,
+    raw_dir: Path = COUNTY_RAW_DIR,
+    pattern: str = COUNTY_FILE_GLOB,
+) -> int:
+    """Load every monthly county file under `raw_dir` in one scan and upsert by
+    (Year, Month). Returns the number of county-month rows loaded."""
+    files = sorted(raw_dir.glob(pattern))
+    if not files:
+        logger.info("No BPS county files matching %s under %s", pattern, raw_dir)
+        return 0
+    ensure_county_tables(con)
+    file_list = ", ".join(_sql_str(p) for p in files)
+    # positional columns: 0 date, 1 state, 2 county, 3 region, 4 division, 5 name,
+    # then (bldgs, units, value) for 1, 2, 3-4 and 5+ unit buildings
+    units = lambda i: f"TRY_CAST(trim(column{i:02d}) AS BIGINT)"  # noqa: E731
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _county_stage AS
+        SELECT
+          lpad(trim(column01), 2, '0') || lpad(trim(column02), 3, '0') AS County_FIPS,
+          lpad(trim(column01), 2, '0') AS State_FIPS,
+          trim(column05) AS County_Name,
+          CAST(substr(trim(column00), 1, 4) AS BIGINT) AS Year,
+          CAST(substr(trim(column00), 5, 2) AS BIGINT) AS Month,
+          {units(7)} AS Units_1,
+          {units(10)} AS Units_2,
+          {units(13)} AS Units_3_4,
+          {units(16)} AS Units_5_Plus,
+          coalesce({units(7)}, 0) + coalesce({units(10)}, 0)
+            + coalesce({units(13)}, 0) + coalesce({units(16)}, 0) AS Total_Units,
+          coalesce({units(6)}, 0) + coalesce({units(9)}, 0)
+            + coalesce({units(12)}, 0) + coalesce({units(15)}, 0) AS Total_Buildings,
+          coalesce({units(8)}, 0) + coalesce({units(11)}, 0)
+            + coalesce({units(14)}, 0) + coalesce({units(17)}, 0) AS Total_Value
+        FROM read_csv([{file_list}], header=false, skip=2, all_varchar=true,
+                      null_padding=true, auto_detect=true)
+        WHERE regexp_full_match(trim(column00), '\\d{{6}}')
+        """)
+    con.execute("""
+        DELETE FROM permits_county_monthly
+        WHERE (Year, Month) IN (SELECT DISTINCT (Year, Month) FROM _county_stage)
+        """)
+    con.execute("INSERT INTO permits_county_monthly BY NAME SELECT * FROM _county_stage")
+    n = fetch_scalar(con, "SELECT count(*) FROM _county_stage")
+    con.execute("DROP TABLE _county_stage")
+    mark_built(con, ["permits_county_monthly"])
+    logger.info("Loaded %d county-month rows from %d files", n, len(files))
+    return int(n)
+
+
+# ---- delineation crosswalk -----------------------------------------------------------
+
+def _read_table_any(path: Path) -> pd.DataFrame:
+    if path.suffix.lower() == ".csv":
+        # title rows above the header have fewer fields, so read rows as lists
+        with open(path, newline="", encoding="latin1") as fh:
+            rows = list(csv.reader(fh))
+        width = max(map(len, rows), default=0)
+        return pd.DataFrame([r + [None] * (width - len(r)) for r in rows], dtype=str)
+    return pd.read_excel(path, header=None, dtype=str)
+
+
+def read_delineation(path: Path) -> pd.DataFrame:
+    """OMB list1 delineation file -> dim_county_cbsa rows (without Vintage)."""
+    raw = _read_table_any(path)
+    header_rows = raw.index[raw.iloc[:, 0].astype(str).str.strip() == "CBSA Code"]
+    if len(header_rows) == 0:
+        raise ValueError(f"No 'CBSA Code' header row found in delineation file {path}")
+    h = header_rows[0]
+    df = raw.iloc[h + 1:].copy()
+    df.columns = [str(c).strip() for c in raw.iloc[h]]
+    df = df.rename(columns=DELINEATION_COLUMNS)
+    df = df.apply(lambda s: s.str.strip()).replace({"": None})
+    missing = {"CBSA_Code", "State_FIPS", "County_FIPS3"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Delineation file {path} is missing columns {sorted(missing)}")
+
+    # footnote rows at the bottom have no county code
+    df = df[df["County_FIPS3"].notna() & df["CBSA_Code"].fillna("").str.isdigit()].copy()
+    df["State_FIPS"] = df["State_FIPS"].str.zfill(2)
+    df["County_FIPS"] = df["State_FIPS"] + df["County_FIPS3"].str.zfill(3)
+    for col in ("CBSA_Code", "Division_Code", "CSA_Code"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64") if col in df else pd.NA
+    for col in ("CBSA_Title", "Metro_Micro", "Division_Title", "CSA_Title",
+                "County_Name", "State_Name", "Central_Outlying"):
+        if col not in df:
+            df[col] = None
+    return df[["County_FIPS", "State_FIPS", "County_Name", "State_Name", "CBSA_Code", "CBSA_Title",
+               "Metro_Micro", "Division_Code", "Division_Title", "CSA_Code", "CSA_Title",
+               "Central_Outlying"]].reset_index(drop=True)
+
+
+def load_delineation(con: duckdb.DuckDBPyConnection, path: Path, vintage: int | None = None) -> int:
+    """Replace the crosswalk rows of one vintage (default: the year in the file name)."""
+    if vintage is None:
+        m = VINTAGE_RE.search(path.stem)
+        if not m:
+            raise ValueError(f"Cannot infer the delineation vintage from {path.name}; pass vintage=")
+        vintage = int(m.group(1))
+    ensure_county_tables(con)
+    xwalk = read_delineation(path)
+    xwalk.insert(0, "Vintage", int(vintage))
+    con.execute("DELETE FROM dim_county_cbsa WHERE Vintage = ?", [int(vintage)])
+    con.execute("INSERT INTO dim_county_cbsa BY NAME SELECT * FROM xwalk")
+    mark_built(con, ["dim_county_cbsa"])
+    logger.info("Loaded delineation vintage %d: %d counties from %s", vintage, len(xwalk), path.name)
+    return len(xwalk)
+
+
+def list_vintages(con: duckdb.DuckDBPyConnection) -> list[int]:
+    return [r[0] for r in con.execute("SELECT DISTINCT Vintage FROM dim_county_cbsa ORDER BY 1").fetchall()]
+
+
+# ---- rollups -------------------------------------------------------------------------
+
+def rollup_permits(
+    con: duckdb.DuckDBPyConnection,
+    vintage: int,
+    groups: pd.DataFrame | None = None,
+    group_name: str = "custom",
+) -> int:
+    """Materialize CBSA, metro division and CSA permit totals for one delineation
+    vintage in a single GROUPING SETS aggregation, replacing that vintage's rows in
+    permits_geo_rollup.
+
+    `groups` optionally adds a custom geography: a frame of (County_FIPS, Geo_Code,
+    Geo_Name) stored under Level=`group_name`.
+    """
+    ensure_county_tables(con)
+    con.execute("DELETE FROM permits_geo_rollup WHERE Vintage = ?", [int(vintage)])
+    con.execute("""
+        INSERT INTO permits_geo_rollup
+        SELECT
+          ? AS Vintage,
+          CASE WHEN GROUPING(x.CBSA_Code) = 0 THEN 'cbsa'
+               WHEN GROUPING(x.Division_Code) = 0 THEN 'division'
+               ELSE 'csa' END AS Level,
+          CAST(coalesce(x.CBSA_Code, x.Division_Code, x.CSA_Code) AS VARCHAR) AS Geo_Code,
+          CASE WHEN GROUPING(x.CBSA_Code) = 0 THEN any_value(x.CBSA_Title)
+               WHEN GROUPING(x.Division_Code) = 0 THEN any_value(x.Division_Title)
+               ELSE any_value(x.CSA_Title) END AS Geo_Name,
+          p.Year, p.Month,
+          sum(p.Total_Units) AS Total_Units,
+          sum(p.Units_1) AS Units_1,
+          sum(p.Units_5_Plus) AS Units_5_Plus,
+          count(DISTINCT p.County_FIPS) AS Counties
+        FROM permits_county_monthly p
+        JOIN dim_county_cbsa x ON x.County_FIPS = p.County_FIPS AND x.Vintage = ?
+        GROUP BY GROUPING SETS (
+          (x.CBSA_Code, p.Year, p.Month),
+          (x.Division_Code, p.Year, p.Month),
+          (x.CSA_Code, p.Year, p.Month)
+        )
+        HAVING coalesce(x.CBSA_Code, x.Division_Code, x.CSA_Code) IS NOT NULL
+        """, [int(vintage), int(vintage)])
+
+    if groups is not None and not groups.empty:
+        custom = groups[["County_FIPS", "Geo_Code", "Geo_Name"]].astype(str)
+        con.execute("""
+            INSERT INTO permits_geo_rollup
+            SELECT ?, ?, g.Geo_Code, any_value(g.Geo_Name), p.Year, p.Month,
+                   sum(p.Total_Units), sum(p.Units_1), sum(p.Units_5_Plus),
+                   count(DISTINCT p.County_FIPS)
+            FROM permits_county_monthly p JOIN custom g USING (County_FIPS)
+            GROUP BY g.Geo_Code, p.Year, p.Month
+            """, [int(vintage), group_name])
+
+    mark_built(con, ["permits_geo_rollup"])
+    n = fetch_scalar(con, "SELECT count(*) FROM permits_geo_rollup WHERE Vintage = ?", [int(vintage)])
+    logger.info("Rolled up county permits for vintage %d: %d rows", vintage, n)
+    return int(n)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Load county BPS permits and roll them up to CBSA / CSA")
+    ap.add_argument("--counties", type=Path, default=COUNTY_RAW_DIR, help="directory of coYYMMc.txt files")
+    ap.add_argument("--delineation", type=Path, action="append", default=[],
+                    help="OMB list1 delineation file (repeatable; vintage taken from the file name)")
+    ap.add_argument("--vintage", type=int, help="vintage to roll up (default: every loaded vintage)")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-county-permits] starting...")
+    delineations = args.delineation or sorted(DELINEATION_DIR.glob("list1_*.*"))
+    with managed_connection(profile="build") as con:
+        rows = ingest_county_permits(con, args.counties)
+        print(f"[build-county-permits] county-month rows loaded: {rows}")
+        for path in delineations:
+            n = load_delineation(con, path)
+            print(f"[build-county-permits] delineation {path.name}: {n} counties")
+        ensure_county_tables(con)
+        vintages = [args.vintage] if args.vintage else list_vintages(con)
+        for v in vintages:
+            n = rollup_permits(con, v)
+            print(f"[build-county-permits] vintage {v}: {n} rollup rows")
+    print(f"[build-county-permits] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,274 @@
+# bls_housing/pipeline/cube.py
+"""Dense metro x year x sub-period cubes for wages and permits.
+
+A `MetroCube` holds one measure as a contiguous float64 array of shape
+(n_metros, n_years, n_sub) -- sub-periods are quarters (4) for QCEW wages, months (12)
+for BPS permits, or 1 for annual data -- plus a boolean mask of observed cells and the
+axis labels. Metrics are computed by slicing and broadcasting over all metros at once
+instead of long-format groupby / merge / pct_change.
+
+Conversions:
+- `MetroCube.from_frame(df, "Total_Wages", sub_col="Quarter")` / `.to_frame()`
+- `MetroCube.from_duckdb(con, "wages_metrics", "Total_Wages", sub_col="Quarter")` / `.to_duckdb()`
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from bls_housing.helper import CPI_U
+
+
+@dataclass(frozen=True)
+class MetroCube:
+    codes: np.ndarray      # (n_metros,) int64, sorted
+    areas: np.ndarray      # (n_metros,) object
+    years: np.ndarray      # (n_years,) int64, contiguous and sorted
+    subs: np.ndarray       # (n_sub,) int64, e.g. [1, 2, 3, 4] or [0] for annual
+    values: np.ndarray     # (n_metros, n_years, n_sub) float64, NaN where missing
+    mask: np.ndarray       # (n_metros, n_years, n_sub) bool, True where observed
+    name: str = "value"
+    sub_col: str | None = None
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.values.shape
+
+    def code_index(self, codes) -> np.ndarray:
+        """Row positions of `codes` (vectorized searchsorted, raises on unknown codes)."""
+        codes = np.asarray(codes, dtype="int64")
+        pos = np.searchsorted(self.codes, codes)
+        if (pos >= len(self.codes)).any() or (self.codes[np.minimum(pos, len(self.codes) - 1)] != codes).any():
+            raise KeyError(f"Unknown metro codes: {sorted(set(codes) - set(self.codes))}")
+        return pos
+
+    def year_index(self, year: int) -> int:
+        i = int(year) - int(self.years[0])
+        if not 0 <= i < len(self.years):
+            raise KeyError(f"Year {year} outside cube range {self.years[0]}-{self.years[-1]}")
+        return i
+
+    # ---- construction / conversion -------------------------------------------------
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        value_col: str,
+        sub_col: str | None = None,
+        years: list[int] | None = None,
+        subs: list[int] | None = None,
+    ) -> "MetroCube":
+        """Scatter a long frame (Area, Code, Year[, sub_col], value_col) into a cube.
+
+        `years` must be contiguous and sorted; rows outside it are dropped. Raises
+        ValueError on sub-period values not in `subs` and on duplicate cells, which
+        would otherwise land in the wrong slot or silently overwrite each other.
+        """
+        codes, code_pos = np.unique(df["Code"].to_numpy(dtype="int64"), return_inverse=True)
+        areas = (
+            df[["Code", "Area"]].drop_duplicates("Code").set_index("Code")["Area"]
+            .reindex(codes).to_numpy(dtype=object)
+        ) if "Area" in df.columns else np.full(len(codes), None, dtype=object)
+
+        yr = df["Year"].to_numpy(dtype="int64")
+        if years is None:
+            y0, y1 = (int(yr.min()), int(yr.max())) if len(yr) else (0, -1)
+            years = list(range(y0, y1 + 1))
+        year_arr = np.asarray(years, dtype="int64")
+        if (np.diff(year_arr) != 1).any():
+            raise ValueError(f"Cube years must be contiguous and sorted, got {year_arr.tolist()}")
+
+        if sub_col is None:
+            sub_arr = np.array([0], dtype="int64")
+            sub_pos = np.zeros(len(df), dtype="int64")
+        else:
+            sv = df[sub_col].to_numpy(dtype="int64")
+            sub_arr = np.asarray(subs if subs is not None else np.unique(sv), dtype="int64")
+            if (np.diff(sub_arr) <= 0).any():
+                raise ValueError(f"Cube {sub_col} values must be unique and sorted, got {sub_arr.tolist()}")
+            sub_pos = np.searchsorted(sub_arr, sv)
+            unknown = (sub_pos >= len(sub_arr)) | (sub_arr[np.minimum(sub_pos, len(sub_arr) - 1)] != sv)
+            if unknown.any():
+                raise ValueError(f"{sub_col} values {sorted(set(sv[unknown].tolist()))} "
+                                 f"not in cube {sub_col}s {sub_arr.tolist()}")
+
+        year_pos = yr - (year_arr[0] if len(year_arr) else 0)
+        keep = (year_pos >= 0) & (year_pos < len(year_arr))
+
+        shape = (len(codes), len(year_arr), len(sub_arr))
+        cells = np.ravel_multi_index((code_pos[keep], year_pos[keep], sub_pos[keep]), shape)
+        if len(np.unique(cells)) != len(cells):
+            raise ValueError(f"Duplicate (Code, Year{', ' + sub_col if sub_col else ''}) rows for {value_col}")
+
+        values = np.full(shape, np.nan, dtype="float64")
+        vals = pd.to_numeric(df[value_col], errors="coerce").to_numpy(dtype="float64")
+        values[code_pos[keep], year_pos[keep], sub_pos[keep]] = vals[keep]
+        return cls(codes, areas, year_arr, sub_arr, values, ~np.isnan(values), value_col, sub_col)
+
+    def to_frame(self, dropna: bool = True) -> pd.DataFrame:
+        """Long frame (Area, Code, Year[, sub_col], name) in Code, Year, sub order."""
+        m, y, s = self.shape
+        out = {
+            "Area": np.repeat(self.areas, y * s),
+            "Code": np.repeat(self.codes, y * s),
+            "Year": np.tile(np.repeat(self.years, s), m),
+        }
+        if self.sub_col is not None:
+            out[self.sub_col] = np.tile(self.subs, m * y)
+        out[self.name] = self.values.reshape(-1)
+        df = pd.DataFrame(out)
+        if dropna:
+            df = df[self.mask.reshape(-1)].reset_index(drop=True)
+        return df
+
+    @classmethod
+    def from_duckdb(
+        cls,
+        con: duckdb.DuckDBPyConnection,
+        table: str,
+        value_col: str,
+        sub_col: str | None = None,
+        codes: list[int] | None = None,
+        subs: list[int] | None = None,
+    ) -> "MetroCube":
+        cols = ["Area", "Code", "Year"] + ([sub_col] if sub_col else []) + [value_col]
+        sql = f"SELECT {', '.join(cols)} FROM {table}"
+        args: list = []
+        if codes:
+            sql += " WHERE Code IN (SELECT * FROM UNNEST(?))"
+            args.append(codes)
+        return cls.from_frame(con.execute(sql, args).df(), value_col, sub_col, subs=subs)
+
+    def to_duckdb(self, con: duckdb.DuckDBPyConnection, table: str) -> None:
+        """CREATE OR REPLACE `table` from the observed cells."""
+        cube_df = self.to_frame()
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM cube_df")
+
+    # ---- metrics -------------------------------------------------------------------
+
+    def with_values(self, values: np.ndarray, name: str | None = None,
+                    mask: np.ndarray | None = None, annual: bool = False) -> "MetroCube":
+        values = np.ascontiguousarray(values, dtype="float64")
+        if mask is None:
+            mask = ~np.isnan(values)
+        subs = np.array([0], dtype="int64") if annual else self.subs
+        return MetroCube(self.codes, self.areas, self.years, subs, values, mask,
+                         name or self.name, None if annual else self.sub_col)
+
+    def annual(self, min_count: int = 1) -> "MetroCube":
+        """Sum over sub-periods, skipping missing cells. A year with fewer than
+        `min_count` observed sub-periods is NaN; min_count=0 reproduces pandas
+        groupby().sum() (all-missing year -> 0)."""
+        total = np.where(self.mask, self.values, 0.0).sum(axis=2, keepdims=True)
+        observed = self.mask.sum(axis=2, keepdims=True)
+        return self.with_values(np.where(observed >= min_count, total, np.nan), annual=True)
+
+    def real(self, target_year: str = "2024") -> "MetroCube":
+        """Deflate to `target_year` dollars with CPI_U (years without CPI are kept nominal)."""
+        factor = np.array(
+            [CPI_U[target_year] / CPI_U[str(y)] if str(y) in CPI_U else 1.0 for y in self.years]
+        )
+        return self.with_values(self.values * factor[None, :, None], name=f"Real_{self.name}")
+
+    def yoy_growth(self) -> "MetroCube":
+        """Year-over-year % change along the year axis (first year NaN)."""
+        out = np.full_like(self.values, np.nan)
+        prev = self.values[:, :-1, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[:, 1:, :] = (self.values[:, 1:, :] / prev - 1.0) * 100.0
+        return self.with_values(out, name=f"Change_{self.name}")
+
+    def base_index(self, base_year: int) -> "MetroCube":
+        """Index every year to `base_year` (=1.0); years before the base are NaN."""
+        b = self.year_index(base_year)
+        base = self.values[:, b:b + 1, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = self.values / base
+        out[:, :b, :] = np.nan
+        return self.with_values(out, name=f"Cumul_{self.name}_Index")
+
+
+def _align(a: MetroCube, b: MetroCube) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Intersect two annual cubes on metros and years; returns (codes, rows_a, rows_b, cols_a, cols_b)."""
+    codes, ia, ib = np.intersect1d(a.codes, b.codes, assume_unique=True, return_indices=True)
+    years, ya, yb = np.intersect1d(a.years, b.years, assume_unique=True, return_indices=True)
+    return (codes, np.asarray(ia, dtype=np.intp), np.asarray(ib, dtype=np.intp),
+            np.asarray(ya, dtype=np.intp), np.asarray(yb, dtype=np.intp))
+
+
+def zoning_pressure(wages: MetroCube, permits: MetroCube) -> pd.DataFrame:
+    """Annual metrics frame equivalent to marts.build_annual_metrics, computed from
+    annual (n_sub == 1) wage and permit cubes."""
+    real = wages.real()
+    wage_chg = real.yoy_growth()
+    permit_chg = permits.yoy_growth()
+    codes, ia, ib, ya, yb = _align(wages, permits)
+
+    sub = np.zeros(1, dtype=np.intp)  # annual cubes have a single sub-period
+    sel_w = np.ix_(ia, ya, sub)
+    sel_p = np.ix_(ib, yb, sub)
+    wage_index = 1 + wage_chg.values[sel_w] / 100
+    permit_index = 1 + permit_chg.values[sel_p] / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pressure = wage_index / permit_index
+
+    observed = (wages.mask[sel_w] & permits.mask[sel_p]).reshape(-1)
+    n_m, n_y = len(codes), len(ya)
+    df = pd.DataFrame({
+        "Area": np.repeat(wages.areas[ia], n_y),
+        "Code": np.repeat(codes, n_y),
+        "Year": np.tile(wages.years[ya], n_m),
+        "Total_Wages": wages.values[sel_w].reshape(-1),
+        "Real_Total_Wages": real.values[sel_w].reshape(-1),
+        "Change_Real_Wage": wage_chg.values[sel_w].reshape(-1),
+        "Total_Permits": permits.values[sel_p].reshape(-1),
+        "Change_Permit": permit_chg.values[sel_p].reshape(-1),
+        "Wage_Index": wage_index.reshape(-1),
+        "Permit_Index": permit_index.reshape(-1),
+        "Zoning_Pressure": pressure.reshape(-1),
+    })
+    return df[observed].reset_index(drop=True)
+
+
+def structural_gap(wages: MetroCube, permits: MetroCube, base_year: int) -> pd.DataFrame:
+    """Cumulative metrics frame equivalent to marts.build_cumulative_metrics, computed
+    from annual wage and permit cubes."""
+    real = wages.real()
+    codes, ia, ib, ya, yb = _align(wages, permits)
+    years = wages.years[ya]
+    if base_year not in years:
+        raise KeyError(f"Base year {base_year} not in cube years {years.tolist()}")
+
+    sel_w = np.ix_(ia, ya, np.zeros(1, dtype=np.intp))
+    sel_p = np.ix_(ib, yb, np.zeros(1, dtype=np.intp))
+    w = real.values[sel_w][:, :, 0]
+    p = permits.values[sel_p][:, :, 0]
+    observed = wages.mask[sel_w][:, :, 0] & permits.mask[sel_p][:, :, 0]
+
+    b = int(np.flatnonzero(years == base_year)[0])
+    base_w, base_p = w[:, b:b + 1], p[:, b:b + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wi = w / base_w
+        pi = p / base_p
+        gap = wi / pi
+
+    keep = observed & (years >= base_year)[None, :]
+    n_m, n_y = keep.shape
+    df = pd.DataFrame({
+        "Area": np.repeat(wages.areas[ia], n_y),
+        "Code": np.repeat(codes, n_y),
+        "Year": np.tile(years, n_m),
+        "Real_Total_Wages": w.reshape(-1),
+        "Total_Permits": p.reshape(-1),
+        "Base_Wage": np.broadcast_to(base_w, w.shape).reshape(-1),
+        "Base_Permits": np.broadcast_to(base_p, p.shape).reshape(-1),
+        "Cumul_Wage_Index": wi.reshape(-1),
+        "Cumul_Permit_Index": pi.reshape(-1),
+        "Structural_Gap": gap.reshape(-1),
+    })
+    return df[keep.reshape(-1)].reset_index(drop=True)
@@ -1,14 +1,174 @@
-# • helper: duck_con(db_path), register_parquet_views(con) etc.
-from typing import List
+# • helper: connect(db_path, profile), register_parquet_views(con) etc.
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from typing import Iterator, List
 from pathlib import Path
+import logging
+import os
 import duckdb
 import pandas as pd
 
-PROJECT_ROOT = Path(__file__).parents[3].resolve()  # adjust to your layout
-DBPATH = PROJECT_ROOT / "data" / "analysis.duckdb" 
+from bls_housing.settings import data_root, db_path, env_value, get_section, parse_bool
 
-def get_analysis_db_connection(dbpath: str | Path = DBPATH):
-    return duckdb.connect(Path(dbpath))
+logger = logging.getLogger(__name__)
+
+DBPATH = db_path()
+DUCKDB_TMP_DIR = data_root() / "tmp" / "duckdb"
+
+# mart tables served and snapshotted for readers -> ORDER BY columns
+MART_TABLES: dict[str, list[str]] = {
+    "annual_metrics": ["Code", "Year"],
+    "cumulative_metrics": ["Code", "Year"],
+    "wages_metrics": ["Code", "Year", "Quarter"],
+    "permits_metrics": ["Code", "Year", "Quarter", "Month"],
+}
+
+
+@dataclass(frozen=True)
+class DuckDBProfile:
+    """DuckDB settings applied at connect time. None means "DuckDB default"."""
+    threads: int | None = None
+    memory_limit: str | None = None
+    temp_directory: str | None = None
+    preserve_insertion_order: bool | None = None
+    read_only: bool = False
+
+
+# build: writers / large lake scans, allowed to reorder and spill to local scratch
+# query: read-only analysis and serving, never takes the write lock
+PROFILES: dict[str, DuckDBProfile] = {
+    "build": DuckDBProfile(
+        temp_directory=str(DUCKDB_TMP_DIR),
+        preserve_insertion_order=False,
+    ),
+    "query": DuckDBProfile(read_only=True),
+}
+
+
+def resolve_profile(name: str = "build", **overrides) -> DuckDBProfile:
+    """Profile defaults <- config `[duckdb.<name>]` <- env <- explicit overrides.
+
+    Env vars: BLS_DUCKDB_<SETTING> for every profile, BLS_DUCKDB_<PROFILE>_<SETTING>
+    for one profile, e.g. BLS_DUCKDB_THREADS=4, BLS_DUCKDB_BUILD_MEMORY_LIMIT=24GB.
+    """
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DuckDB profile {name!r}; expected one of {sorted(PROFILES)}")
+    profile = PROFILES[name]
+
+    values: dict = dict(get_section("duckdb", name))
+    for f in fields(DuckDBProfile):
+        env = (env_value(f"BLS_DUCKDB_{name.upper()}_{f.name.upper()}")
+               or env_value(f"BLS_DUCKDB_{f.name.upper()}"))
+        if env is not None:
+            values[f.name] = env
+    values.update({k: v for k, v in overrides.items() if v is not None})
+
+    unknown = set(values) - {f.name for f in fields(DuckDBProfile)}
+    if unknown:
+        raise ValueError(f"Unknown DuckDB settings for profile {name!r}: {sorted(unknown)}")
+    if "threads" in values:
+        values["threads"] = int(values["threads"])
+    for key in ("preserve_insertion_order", "read_only"):
+        if key in values:
+            values[key] = parse_bool(values[key])
+    return replace(profile, **values)
+
+
+def connect(dbpath: str | Path = DBPATH, profile: str = "build", **overrides) -> duckdb.DuckDBPyConnection:
+    """Open a DuckDB connection with the settings of `profile` (see resolve_profile)."""
+    p = resolve_profile(profile, **overrides)
+    config: dict = {}
+    if p.threads is not None:
+        config["threads"] = p.threads
+    if p.memory_limit is not None:
+        config["memory_limit"] = p.memory_limit
+    if p.temp_directory is not None:
+        Path(p.temp_directory).mkdir(parents=True, exist_ok=True)
+        config["temp_directory"] = p.temp_directory
+    if p.preserve_insertion_order is not None:
+        config["preserve_insertion_order"] = p.preserve_insertion_order
+
+    database = str(dbpath)
+    logger.debug("duckdb.connect(%s, profile=%s, read_only=%s, config=%s)", database, profile, p.read_only, config)
+    return duckdb.connect(database, read_only=p.read_only, config=config)
+
+
+@contextmanager
+def managed_connection(
+    dbpath: str | Path = DBPATH, profile: str = "build", **overrides
+) -> Iterator[duckdb.DuckDBPyConnection]:
+    """Context manager that always closes the connection, also on errors."""
+    con = connect(dbpath, profile, **overrides)
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+_process_connections: dict[tuple[int, str, str], duckdb.DuckDBPyConnection] = {}
+
+
+def get_process_connection(dbpath: str | Path = DBPATH, profile: str = "query") -> duckdb.DuckDBPyConnection:
+    """One reusable connection per (process, database, profile).
+
+    Keyed by pid so forked pool workers open their own connection instead of
+    inheriting the parent's. Threads should call `.cursor()` on the result.
+    """
+    key = (os.getpid(), str(Path(dbpath).resolve()), profile)
+    con = _process_connections.get(key)
+    if con is None:
+        con = connect(dbpath, profile)
+        _process_connections[key] = con
+    return con
+
+
+def attach_read_only(con: duckdb.DuckDBPyConnection, dbpath: str | Path = DBPATH, alias: str = "analysis") -> str:
+    """ATTACH `dbpath` read-only under `alias` (no-op if already attached); returns alias.
+
+    Lets workers with their own (e.g. in-memory) connection read the analysis
+    database without taking its write lock.
+    """
+    attached = {r[0] for r in con.execute("SELECT database_name FROM duckdb_databases()").fetchall()}
+    if alias not in attached:
+        path = str(dbpath).replace("'", "''")
+        con.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+    return alias
+
+
+def get_analysis_db_connection(dbpath: str | Path = DBPATH, profile: str = "build"):
+    return connect(dbpath, profile)
+
+
+def register_parquet_views(con: duckdb.DuckDBPyConnection, prefer_compact: bool = True) -> List[str]:
+    """Create views over the parquet lake (compacted copy when fresh, else the
+    per-partition files) and return their names:
+
+    - qcew_lake            every QCEW row, with cbsa_code / year / quarter partition columns
+    - qcew_msa_quarterly   agglvl 40 metro totals as (Code, Year, Quarter, Total_Wages)
+    - qcew_sector_facts    industry-sector facts, if build-sector-facts has run
+    """
+    # imported here: both modules build on this one
+    from bls_housing.pipeline.compact import lake_glob
+    from bls_housing.pipeline.sectors import SECTOR_DIR, SECTOR_VIEW, register_sector_view
+
+    glob = lake_glob(prefer_compact).replace("'", "''")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW qcew_lake AS
+        SELECT * FROM read_parquet('{glob}', hive_partitioning=true, union_by_name=true)
+        """)
+    con.execute("""
+        CREATE OR REPLACE VIEW qcew_msa_quarterly AS
+        SELECT cbsa_code AS Code, year AS Year, quarter AS Quarter,
+               first(total_qtrly_wages) AS Total_Wages
+        FROM qcew_lake
+        WHERE agglvl_code = 40
+        GROUP BY ALL
+        """)
+    views = ["qcew_lake", "qcew_msa_quarterly"]
+    if any(SECTOR_DIR.glob("Year=*")):
+        register_sector_view(con)
+        views.append(SECTOR_VIEW)
+    return views
 
 
 def list_metros(con: duckdb.DuckDBPyConnection, codes: List[int]) -> pd.DataFrame:
@@ -25,7 +185,8 @@ def update_db(con: duckdb.DuckDBPyConnection,
               cumulative_df: pd.DataFrame, 
               wages_df: pd.DataFrame, 
               permits_df: pd.DataFrame):
-    con.execute("""
+    if(final_df.size>0):
+        con.execute("""
             CREATE OR REPLACE TABLE annual_metrics_stage AS SELECT * FROM final_df;
             BEGIN TRANSACTION;
             DELETE FROM annual_metrics t
@@ -41,7 +202,8 @@ def update_db(con: duckdb.DuckDBPyConnection,
             FROM annual_metrics_stage;
             COMMIT;
             """)
-    con.execute("""
+    if(cumulative_df.size>0):
+        con.execute("""
             CREATE OR REPLACE TABLE cumulative_metrics_stage AS SELECT * FROM cumulative_df;
             BEGIN TRANSACTION;
             DELETE FROM cumulative_metrics t
@@ -100,6 +262,107 @@ CREATE TABLE IF NOT EXISTS build_meta (
   last_built TIMESTAMP
 );
 """)
+    touched = []
+    if(final_df.size>0):
+        touched.append("annual_metrics")
+    if(cumulative_df.size>0):
+        touched.append("cumulative_metrics")
+    if(wages_df.size>0):
+        touched.append("wages_metrics")
+    if(permits_df.size>0):
+        touched.append("permits_metrics")
+    mark_built(con, touched)
+
+    # keep the CSA / national rollups in step with the upserted years
+    from bls_housing.pipeline.rollups import refresh_rollups
+    refresh_rollups(
+        con,
+        annual_years=final_df["Year"].unique() if final_df.size>0 else [],
+        cumulative_years=cumulative_df["Year"].unique() if cumulative_df.size>0 else [],
+    )
+
+    # and the swept cumulative_metrics_by_base rows of the metros whose annual rows moved
+    if(final_df.size>0):
+        from bls_housing.pipeline.marts import refresh_cumulative_by_base
+        codes = sorted({int(c) for c in final_df["Code"]})
+        annual = con.execute("""
+            SELECT Area, Code, Year, Real_Total_Wages, Total_Permits FROM annual_metrics
+            WHERE Code IN (SELECT * FROM UNNEST(?))
+            """, [codes]).df()
+        refresh_cumulative_by_base(con, annual, annual, codes=codes)
+
+    # notebooks memory-map the snapshot, so publish the new data version
+    from bls_housing.pipeline.snapshot import publish_snapshots
+    publish_snapshots(con)
+
+
+def update_cumulative_by_base(con: duckdb.DuckDBPyConnection, sweep_df: pd.DataFrame) -> None:
+    """Upsert the output of marts.build_cumulative_metrics_sweep by (Base_Year, Code, Year)."""
+    if(sweep_df.size==0):
+        return
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS cumulative_metrics_by_base (
+              Base_Year BIGINT,
+              Area VARCHAR,
+              Code BIGINT,
+              Year BIGINT,
+              Real_Total_Wages DOUBLE,
+              Total_Permits DOUBLE,
+              Base_Wage DOUBLE,
+              Base_Permits DOUBLE,
+              Cumul_Wage_Index DOUBLE,
+              Cumul_Permit_Index DOUBLE,
+              Structural_Gap DOUBLE
+            );
+            CREATE OR REPLACE TABLE cumulative_metrics_by_base_stage AS SELECT * FROM sweep_df;
+            BEGIN TRANSACTION;
+            DELETE FROM cumulative_metrics_by_base t
+            USING cumulative_metrics_by_base_stage s
+            WHERE t.Base_Year = s.Base_Year AND t.Code = s.Code AND t.Year = s.Year;
+            INSERT INTO cumulative_metrics_by_base (
+                Base_Year, Area, Code, Year, Real_Total_Wages, Total_Permits, Base_Wage,
+                Base_Permits, Cumul_Wage_Index, Cumul_Permit_Index, Structural_Gap
+            )
+            SELECT
+                Base_Year, Area, Code, Year, Real_Total_Wages, Total_Permits, Base_Wage,
+                Base_Permits, Cumul_Wage_Index, Cumul_Permit_Index, Structural_Gap
+            FROM cumulative_metrics_by_base_stage;
+            COMMIT;
+            """)
+    mark_built(con, ["cumulative_metrics_by_base"])
+
+
+def mark_built(con: duckdb.DuckDBPyConnection, tables: List[str]) -> None:
+    """Record `now()` as the last build time of each table in build_meta.
+    Readers (e.g. the query service) use max(last_built) as the data version."""
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS build_meta (
+          table_name VARCHAR,
+          last_built TIMESTAMP
+        );
+        """)
+    con.execute("DELETE FROM build_meta WHERE table_name IN (SELECT * FROM UNNEST(?))", [tables])
+    con.execute("""
+        INSERT INTO build_meta
+        SELECT t, now()::TIMESTAMP FROM (SELECT UNNEST(?) AS t)
+        """, [tables])
+
+
+def fetch_scalar(con: duckdb.DuckDBPyConnection, sql: str, params: list | None = None):
+    """First column of the first row of `sql`. Raises if the query returns no rows."""
+    row = con.execute(sql, params).fetchone()
+    if row is None:
+        raise RuntimeError(f"Query returned no rows: {sql.strip()[:80]}")
+    return row[0]
+
+
+def get_data_version(con: duckdb.DuckDBPyConnection) -> str | None:
+    """Latest build_meta timestamp as an ISO string, or None if nothing was built yet."""
+    try:
+        row = con.execute("SELECT max(last_built) FROM build_meta").fetchone()
+    except duckdb.CatalogException:
+        return None
+    return None if row is None or row[0] is None else row[0].isoformat()
 
 
 # def list_metros_2(con, title_like: str | None = None):
@@ -8,11 +8,14 @@ from typing import Iterable
 
 import pandas as pd
 
+from bls_housing.helper import pct_change_unfilled
+from bls_housing.pipeline.checkpoint import RunJournal
 from bls_housing.pipeline.wages import build_annual_wages
 from bls_housing.pipeline.permits import build_annual_permits
+from bls_housing.settings import derived_root
 
 
-DERIVED_DIR = Path(__file__).resolve().parents[3] / "data" / "derived"
+DERIVED_DIR = derived_root()
 DERIVED_DIR.mkdir(parents=True, exist_ok=True)
 
 
@@ -20,6 +23,7 @@ DERIVED_DIR.mkdir(parents=True, exist_ok=True)
 class EnsureResult:
     df_tuple: tuple[pd.DataFrame, pd.DataFrame]
     missing_keys: set[tuple[int, int]]  # (Code, Year)
+    resumed_keys: int = 0  # missing keys restored from an interrupted run's checkpoint
 
 
 def _read_parquet_if_exists(path: Path) -> pd.DataFrame:
@@ -33,20 +37,30 @@ def _expected_keys(metros: pd.DataFrame, years: Iterable[int]) -> set[tuple[int,
     return {(int(c), int(y)) for c in codes for y in years}
 
 
-def _existing_keys(df: pd.DataFrame) -> set[tuple[int, int]]:
+def _existing_keys(df: pd.DataFrame, value_col: str | None = None) -> set[tuple[int, int]]:
+    """(Code, Year) keys stored in `df`. Rows whose `value_col` is NaN (a year with a
+    missing quarter or month) do not count as built, so the next run retries them."""
     if df.empty:
         return set()
-    
+    if value_col is not None:
+        df = df[df[value_col].notna()]
     return set(map(tuple, df[["Code", "Year"]].astype("int64").to_numpy()))
 
 
-def _upsert_parquet(path: Path, df_new: pd.DataFrame, key_cols: list[str]) -> pd.DataFrame:
+def _upsert_parquet(
+    path: Path,
+    df_new: pd.DataFrame,
+    key_cols: list[str],
+    change: tuple[str, str] | None = None,
+) -> pd.DataFrame:
     """
     Upsert by key into a single parquet file:
       - read old (if exists)
       - concat new
       - drop duplicates on key (keep last)
       - sort and write back
+    With `change=(value_col, change_col)` the percent change is recomputed per Code
+    over every stored year, so a rebuilt year also fixes the change of the year after.
     Returns the full updated dataframe.
     """
     if path.exists():
@@ -61,39 +75,68 @@ def _upsert_parquet(path: Path, df_new: pd.DataFrame, key_cols: list[str]) -> pd
 
     df_all = df_all.drop_duplicates(subset=key_cols, keep="last")
     df_all = df_all.sort_values(key_cols).reset_index(drop=True)
+    if change is not None:
+        value_col, change_col = change
+        df_all[change_col] = pct_change_unfilled(df_all, value_col) * 100
     df_all.to_parquet(path, index=False)
     return df_all
 
 
+def _record_lineage(target: str, df_new: pd.DataFrame, quarters: Iterable[int] = (1, 2, 3, 4)) -> None:
+    # imported here: lineage builds on this module's parquet helpers
+    from bls_housing.pipeline.lineage import record_lineage
+
+    keys = set(map(tuple, df_new[["Code", "Year"]].astype("int64").to_numpy()))
+    record_lineage(target, keys, quarters)
+
+
 def ensure_annual_wages(
     metros: pd.DataFrame,
     years: list[int],
     quarters: list[int] = [1, 2, 3, 4],
     parquet_name: str = "annual_wages.parquet",
+    engine: str = "pandas",
+    source: str = "cache",
+    derived_dir: Path = DERIVED_DIR,
+    lineage: bool = True,
+    checkpoint: bool = True,
 ) -> EnsureResult:
     """
     Ensure derived annual wages data exists for all (Code, Year) keys in metros x years.
-    Rebuilds missing keys using build_annual_wages and upserts to parquet.
+    Rebuilds missing keys, and keys stored with a NaN total, using build_annual_wages
+    and upserts to parquet.
+    `derived_dir` and `lineage=False` let shard builds write to their own store.
+    With `checkpoint` the per-file build journals finished units under
+    derived_dir/checkpoints, so an interrupted run resumes where it stopped.
     """
-    path = DERIVED_DIR / parquet_name
+    path = derived_dir / parquet_name
 
     df_existing = _read_parquet_if_exists(path)
     expected = _expected_keys(metros, years)
-    existing = _existing_keys(df_existing)
+    existing = _existing_keys(df_existing, "Total_Wages")
     missing = expected - existing
 
     (wages_df, df_new) = (pd.DataFrame(), pd.DataFrame())
     missing_codes = sorted({code for code, _ in missing})
+    journal = None
 
     if missing_codes:
         metros_missing = metros[metros["Code"].isin(missing_codes)]
-        (wages_df, df_new) = build_annual_wages(metros_missing, years, quarters)
+        if checkpoint and engine == "pandas" and source == "cache":
+            journal = RunJournal("annual_wages", missing_codes, years, quarters, root=derived_dir / "checkpoints")
+        (wages_df, df_new) = build_annual_wages(metros_missing, years, quarters, engine=engine, source=source,
+                                                journal=journal)
 
         # sanity: ensure key columns exist
         if not {"Code", "Year"}.issubset(df_new.columns):
             raise ValueError(f"build_annual_wages output missing Code/Year columns: {df_new.columns}")
 
-        df_updated = _upsert_parquet(path, df_new, key_cols=["Code", "Year"])
+        df_updated = _upsert_parquet(path, df_new, key_cols=["Code", "Year"],
+                                     change=("Real_Total_Wages", "Change_Real_Wage"))
+        if lineage:
+            _record_lineage("annual_wages", df_new, quarters)
+        if journal:
+            journal.finish()
     else:
         df_updated = df_existing
 
@@ -104,35 +147,51 @@ def ensure_annual_wages(
         & df_updated["Year"].astype("int64").isin([int(y) for y in years])
     ].copy()
 
-    return EnsureResult((wages_df, df_subset), missing_keys=missing)
+    return EnsureResult((wages_df, df_subset), missing_keys=missing,
+                        resumed_keys=journal.skipped if journal else 0)
 
 
 def ensure_annual_permits(
     metros: pd.DataFrame,
     years: list[int],
     parquet_name: str = "annual_permits.parquet",
+    engine: str = "pandas",
+    derived_dir: Path = DERIVED_DIR,
+    lineage: bool = True,
+    checkpoint: bool = True,
 ) -> EnsureResult:
     """
     Ensure derived annual permits data exists for all (Code, Year) keys in metros x years.
-    Rebuilds missing keys using build_annual_permits and upserts to parquet.
+    Rebuilds missing keys, and keys stored with a NaN total, using build_annual_permits
+    and upserts to parquet.
+    `derived_dir` and `lineage=False` let shard builds write to their own store.
+    `checkpoint` works as in ensure_annual_wages.
     """
-    path = DERIVED_DIR / parquet_name
+    path = derived_dir / parquet_name
 
     df_existing = _read_parquet_if_exists(path)
     expected = _expected_keys(metros, years)
-    existing = _existing_keys(df_existing)
-    
+    existing = _existing_keys(df_existing, "Total_Permits")
+
     (permits_df, df_new) = (pd.DataFrame(), pd.DataFrame())
     missing = expected - existing
     missing_codes = sorted({code for code, _ in missing})
+    journal = None
     if missing_codes:
         metros_missing = metros[metros["Code"].isin(missing_codes)]
-        (permits_df, df_new) = build_annual_permits(metros_missing, years)
+        if checkpoint and engine == "pandas":
+            journal = RunJournal("annual_permits", missing_codes, years, root=derived_dir / "checkpoints")
+        (permits_df, df_new) = build_annual_permits(metros_missing, years, engine=engine, journal=journal)
     
         if not {"Code", "Year"}.issubset(df_new.columns):
             raise ValueError(f"build_annual_permits output missing Code/Year columns: {df_new.columns}")
 
-        df_updated = _upsert_parquet(path, df_new, key_cols=["Code", "Year"])
+        df_updated = _upsert_parquet(path, df_new, key_cols=["Code", "Year"],
+                                     change=("Total_Permits", "Change_Permit"))
+        if lineage:
+            _record_lineage("annual_permits", df_new)
+        if journal:
+            journal.finish()
     else:
         df_updated = df_existing
 
@@ -142,4 +201,5 @@ def ensure_annual_permits(
         & df_updated["Year"].astype("int64").isin([int(y) for y in years])
     ].copy()
 
-    return EnsureResult((permits_df, df_subset), missing_keys=missing)
\ No newline at end of file
+    return EnsureResult((permits_df, df_subset), missing_keys=missing,
+                        resumed_keys=journal.skipped if journal else 0)
\ No newline at end of file
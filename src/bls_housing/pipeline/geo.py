@@ -0,0 +1,353 @@
+# bls_housing/pipeline/geo.py
+"""ZIP / point -> CBSA lookup on top of `dim_metro_full`.
+
+Containment first (point inside a CBSA polygon), nearest-CBSA distance fallback.
+
+Inputs are local files:
+- CBSA boundaries: Census TIGER / cartographic boundary file (shapefile, zip or GeoJSON)
+  with a `CBSAFP` (or `GEOID`) code column.
+- ZIP centroids: Census Gazetteer ZCTA file (`GEOID`, `INTPTLAT`, `INTPTLONG`) or any
+  CSV with `zip`, `lat`, `lon` columns.
+
+Boundaries are projected once to an equal-area CRS and cached as WKB in parquet, so
+later runs rebuild the STRtree straight from the cache without geopandas. The resolved
+ZIP crosswalk is cached as parquet and loaded into DuckDB as `dim_zip_cbsa`, so joins
+against it need no geometry work at all. Both caches store the inputs they were built
+from (source file, metro set, `max_distance_km`) in the parquet metadata and are rebuilt
+when those differ.
+
+INDEX_CRS only covers the contiguous US well, so `Distance_km` is measured on the
+ellipsoid from the nearest polygon point instead of in projected metres. For points in
+Hawaii or Alaska the choice of nearest CBSA is still made in INDEX_CRS.
+
+Requires the optional `geo` extra (geopandas, shapely>=2, pyproj).
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from bls_housing.pipeline.duck import managed_connection
+from bls_housing.settings import data_root, derived_root
+
+logger = logging.getLogger(__name__)
+
+GEO_RAW_DIR = data_root() / "raw" / "geo"
+GEO_DERIVED_DIR = derived_root() / "geo"
+
+BOUNDARIES_CACHE = GEO_DERIVED_DIR / "cbsa_boundaries.parquet"
+CROSSWALK_CACHE = GEO_DERIVED_DIR / "zip_cbsa_crosswalk.parquet"
+
+SOURCE_CRS = "EPSG:4269"   # NAD83, used by TIGER files and the Gazetteer
+INDEX_CRS = "EPSG:5070"    # CONUS Albers equal-area, metres
+
+DEFAULT_BATCH_SIZE = 500_000
+CACHE_KEY = b"bls_housing.cache_key"
+
+
+def _require_geo():
+    try:
+        import shapely  # noqa: F401
+        import pyproj  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "ZIP -> CBSA lookup needs the optional geo dependencies: "
+            "pip install 'bls_housing[geo]'"
+        ) from e
+
+
+def _metro_codes(con: duckdb.DuckDBPyConnection) -> set[int]:
+    rows = con.execute("SELECT Code FROM dim_metro_full").fetchall()
+    return {int(r[0]) for r in rows}
+
+
+def _boundaries_key(boundaries_path: str | Path, con: duckdb.DuckDBPyConnection | None) -> dict:
+    """What the boundaries cache depends on besides file mtimes."""
+    metros = None
+    if con is not None:
+        codes = ",".join(str(c) for c in sorted(_metro_codes(con)))
+        metros = hashlib.sha256(codes.encode()).hexdigest()
+    return {"source": str(Path(boundaries_path).resolve()), "metros": metros}
+
+
+def _write_keyed(df: pd.DataFrame, path: Path, key: dict) -> None:
+    """Write `df` as parquet with `key` in the schema metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = {**(table.schema.metadata or {}), CACHE_KEY: json.dumps(key, sort_keys=True).encode()}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table.replace_schema_metadata(meta), path)
+
+
+def _stored_key(path: Path) -> dict | None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        raw = (pq.read_schema(path).metadata or {}).get(CACHE_KEY)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return json.loads(raw) if raw else None
+
+
+def cache_cbsa_boundaries(
+    boundaries_path: str | Path,
+    con: duckdb.DuckDBPyConnection | None = None,
+    cache_path: Path = BOUNDARIES_CACHE,
+) -> pd.DataFrame:
+    """Read a CBSA boundary file, keep metros present in `dim_metro_full` (when `con`
+    is given), project to INDEX_CRS and cache as parquet (Code, geometry WKB), keyed
+    on the source file and metro set."""
+    try:
+        import geopandas as gpd
+    except ImportError as e:
+        raise ImportError(
+            "Reading boundary files needs geopandas: pip install 'bls_housing[geo]'"
+        ) from e
+
+    gdf = gpd.read_file(boundaries_path)
+    code_col = next((c for c in ("CBSAFP", "GEOID", "CBSA", "Code") if c in gdf.columns), None)
+    if code_col is None:
+        raise ValueError(f"No CBSA code column found in {boundaries_path}: {list(gdf.columns)}")
+
+    gdf = gdf[[code_col, "geometry"]].rename(columns={code_col: "Code"})
+    gdf["Code"] = gdf["Code"].astype("int64")
+    if con is not None:
+        known = _metro_codes(con)
+        dropped = int((~gdf["Code"].isin(known)).sum())
+        gdf = gdf[gdf["Code"].isin(known)]
+        logger.info("CBSA boundaries: kept %d, dropped %d not in dim_metro_full", len(gdf), dropped)
+
+    if gdf.crs is None:
+        gdf = gdf.set_crs(SOURCE_CRS)
+    gdf = gdf.to_crs(INDEX_CRS)
+
+    out = pd.DataFrame({
+        "Code": gdf["Code"].to_numpy(),
+        "geometry": gdf.geometry.to_wkb().to_numpy(),
+    }).sort_values("Code").reset_index(drop=True)
+
+    _write_keyed(out, cache_path, _boundaries_key(boundaries_path, con))
+    return out
+
+
+def load_zip_centroids(path: str | Path) -> pd.DataFrame:
+    """Load ZIP centroids as (ZIP, lat, lon). Accepts the Census Gazetteer ZCTA file
+    (tab-delimited) or a CSV with zip/lat/lon columns."""
+    path = Path(path)
+    sep = "\t" if path.suffix.lower() == ".txt" else ","
+    df = pd.read_csv(path, sep=sep, dtype=str)
+    df.columns = [c.strip() for c in df.columns]  # Gazetteer pads the last header
+
+    lower = {c.lower(): c for c in df.columns}
+    zip_col = lower.get("geoid") or lower.get("zip") or lower.get("zcta")
+    lat_col = lower.get("intptlat") or lower.get("lat") or lower.get("latitude")
+    lon_col = lower.get("intptlong") or lower.get("lon") or lower.get("longitude")
+    if not (zip_col and lat_col and lon_col):
+        raise ValueError(f"Missing ZIP/lat/lon columns in {path}: {list(df.columns)}")
+
+    return pd.DataFrame({
+        "ZIP": df[zip_col].str.strip().str.zfill(5),
+        "lat": pd.to_numeric(df[lat_col], errors="coerce"),
+        "lon": pd.to_numeric(df[lon_col], errors="coerce"),
+    })
+
+
+class CbsaIndex:
+    """STRtree over projected CBSA polygons, answering batched point lookups."""
+
+    def __init__(self, codes: np.ndarray, geoms: np.ndarray):
+        _require_geo()
+        import pyproj
+        import shapely
+
+        self.codes = np.asarray(codes, dtype="int64")
+        self.geoms = geoms
+        self.tree = shapely.STRtree(geoms)
+        self._to_index_crs = pyproj.Transformer.from_crs(SOURCE_CRS, INDEX_CRS, always_xy=True)
+        self._to_source_crs = pyproj.Transformer.from_crs(INDEX_CRS, SOURCE_CRS, always_xy=True)
+        self._geod = pyproj.Geod(ellps="GRS80")  # the NAD83 ellipsoid
+
+    @classmethod
+    def from_parquet(cls, cache_path: Path = BOUNDARIES_CACHE) -> "CbsaIndex":
+        _require_geo()
+        import shapely
+
+        df = pd.read_parquet(cache_path)
+        return cls(df["Code"].to_numpy(), shapely.from_wkb(df["geometry"].to_numpy()))
+
+    def lookup(
+        self,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        max_distance_km: float | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (Code, Match, Distance_km) arrays for each input point.
+
+        Match is "contains" for points inside a CBSA, "nearest" for the distance
+        fallback and "none" when the nearest CBSA is beyond `max_distance_km` or
+        the coordinates are missing. Distances are geodesic.
+        """
+        import shapely
+
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        n = len(lon)
+
+        codes = np.full(n, -1, dtype="int64")
+        match = np.full(n, "none", dtype=object)
+        dist_km = np.full(n, np.nan, dtype="float64")
+
+        valid = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+        if valid.size == 0:
+            return codes, match, dist_km
+
+        x, y = self._to_index_crs.transform(lon[valid], lat[valid])
+        points = shapely.points(x, y)
+
+        # 1) containment: (point idx, polygon idx) pairs; keep first polygon per point
+        pt_idx, poly_idx = self.tree.query(points, predicate="within")
+        pt_idx, first = np.unique(pt_idx, return_index=True)
+        poly_idx = poly_idx[first]
+        codes[valid[pt_idx]] = self.codes[poly_idx]
+        match[valid[pt_idx]] = "contains"
+        dist_km[valid[pt_idx]] = 0.0
+
+        # 2) nearest-neighbour fallback for everything not contained
+        outside = np.ones(valid.size, dtype=bool)
+        outside[pt_idx] = False
+        rest = np.flatnonzero(outside)
+        if rest.size:
+            near_pt, near_poly = self.tree.query_nearest(points[rest], all_matches=False)
+            target = valid[rest[near_pt]]
+            # projected distances are off outside CONUS; measure point -> nearest
+            # polygon point on the ellipsoid instead
+            lines = shapely.shortest_line(points[rest[near_pt]], self.geoms[near_poly])
+            ends = shapely.get_coordinates(lines).reshape(-1, 2, 2)[:, 1]
+            end_lon, end_lat = self._to_source_crs.transform(ends[:, 0], ends[:, 1])
+            _, _, d = self._geod.inv(lon[target], lat[target], end_lon, end_lat)
+            d_km = np.asarray(d, dtype="float64") / 1000.0
+            keep = np.ones(d_km.size, dtype=bool) if max_distance_km is None else d_km <= max_distance_km
+            codes[target[keep]] = self.codes[near_poly[keep]]
+            match[target[keep]] = "nearest"
+            dist_km[target[keep]] = d_km[keep]
+
+        return codes, match, dist_km
+
+
+def map_points_to_cbsa(
+    df: pd.DataFrame,
+    index: CbsaIndex,
+    lat_col: str = "lat",
+    lon_col: str = "lon",
+    max_distance_km: float | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> pd.DataFrame:
+    """Attach Code, Match and Distance_km to every row of `df`, in fixed-size batches."""
+    parts = []
+    for start in range(0, len(df), batch_size):
+        chunk = df.iloc[start:start + batch_size]
+        codes, match, dist = index.lookup(
+            chunk[lon_col].to_numpy(), chunk[lat_col].to_numpy(), max_distance_km
+        )
+        parts.append(pd.DataFrame(
+            {"Code": codes, "Match": match, "Distance_km": dist}, index=chunk.index
+        ))
+    if not parts:
+        return df.assign(Code=pd.Series(dtype="Int64"), Match=pd.Series(dtype=object),
+                         Distance_km=pd.Series(dtype="float64"))
+
+    out = df.join(pd.concat(parts))
+    out["Code"] = out["Code"].astype("Int64").mask(out["Code"] < 0)
+    return out
+
+
+def _is_stale(cache_path: Path, *sources: Path, key: dict | None = None) -> bool:
+    if not cache_path.exists():
+        return True
+    if key is not None and _stored_key(cache_path) != key:
+        return True
+    mtime = cache_path.stat().st_mtime
+    return any(Path(s).stat().st_mtime > mtime for s in sources)
+
+
+def ensure_zip_cbsa_crosswalk(
+    con: duckdb.DuckDBPyConnection,
+    boundaries_path: str | Path,
+    zips_path: str | Path,
+    max_distance_km: float | None = None,
+    force: bool = False,
+) -> pd.DataFrame:
+    """Resolve every ZIP centroid to a CBSA and publish it as `dim_zip_cbsa`.
+
+    Reuses the cached boundaries / crosswalk parquet unless the source files are newer,
+    the inputs recorded in the cache differ (other file, metro set or `max_distance_km`)
+    or `force` is set; only the stale stage is rebuilt.
+    """
+    boundaries_path, zips_path = Path(boundaries_path), Path(zips_path)
+    boundaries_key = _boundaries_key(boundaries_path, con)
+    crosswalk_key = {"zips": str(zips_path.resolve()), "max_distance_km": max_distance_km,
+                     "boundaries": boundaries_key}
+
+    if force or _is_stale(BOUNDARIES_CACHE, boundaries_path, key=boundaries_key):
+        t0 = perf_counter()
+        cache_cbsa_boundaries(boundaries_path, con, cache_path=BOUNDARIES_CACHE)
+        logger.info("Cached CBSA boundaries in %.2fs", perf_counter() - t0)
+        force = True  # boundaries changed -> crosswalk must be rebuilt
+
+    if force or _is_stale(CROSSWALK_CACHE, zips_path, BOUNDARIES_CACHE, key=crosswalk_key):
+        t0 = perf_counter()
+        index = CbsaIndex.from_parquet(BOUNDARIES_CACHE)
+        zips = load_zip_centroids(zips_path)
+        crosswalk = map_points_to_cbsa(zips, index, max_distance_km=max_distance_km)
+        _write_keyed(crosswalk, CROSSWALK_CACHE, crosswalk_key)
+        logger.info("Resolved %d ZIPs to CBSAs in %.2fs", len(crosswalk), perf_counter() - t0)
+    else:
+        logger.info("ZIP crosswalk cache hit: %s", CROSSWALK_CACHE)
+
+    con.execute(f"""
+        CREATE OR REPLACE TABLE dim_zip_cbsa AS
+        SELECT z.ZIP, z.Code, m.Area, m.Title, z.Match, z.Distance_km, z.lat, z.lon
+        FROM read_parquet('{str(CROSSWALK_CACHE).replace("'", "''")}') z
+        LEFT JOIN dim_metro_full m ON m.Code = z.Code
+    """)
+    return con.execute("SELECT * FROM dim_zip_cbsa ORDER BY ZIP").df()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Build the ZIP -> CBSA crosswalk (dim_zip_cbsa)")
+    ap.add_argument("--boundaries", default=str(GEO_RAW_DIR / "cb_us_cbsa_500k.zip"),
+                    help="CBSA boundary file (shapefile, zip or GeoJSON)")
+    ap.add_argument("--zips", default=str(GEO_RAW_DIR / "gaz_zcta_national.txt"),
+                    help="ZIP centroid file (Gazetteer ZCTA .txt or zip/lat/lon CSV)")
+    ap.add_argument("--max-distance-km", type=float, default=None,
+                    help="leave ZIPs farther than this from any CBSA unmatched")
+    ap.add_argument("--force", action="store_true", help="ignore cached parquet")
+    args = ap.parse_args()
+
+    t0 = perf_counter()
+    print("[build-zip-crosswalk] starting...")
+    with managed_connection(profile="build") as con:
+        df = ensure_zip_cbsa_crosswalk(
+            con, args.boundaries, args.zips,
+            max_distance_km=args.max_distance_km, force=args.force,
+        )
+    counts = df["Match"].value_counts().to_dict()
+    print(f"[build-zip-crosswalk] rows: {len(df)}, by match: {counts}")
+    print(f"[build-zip-crosswalk] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,327 @@
+# bls_housing/pipeline/lineage.py
+"""Source-file lineage and revision-aware recompute.
+
+Every raw cache file feeding the derived tables is recorded with its content hash,
+together with the (Code, Year) rows it feeds:
+
+- QCEW  data/cache/bls/C1234_2020_1.csv        -> annual_wages   (12340, 2020)
+- BPS   data/cache/census/{xls,txt}/...202001  -> annual_permits (every metro, 2020)
+
+`refresh_revised` rehashes the recorded files (only those whose size/mtime moved),
+and for each file whose content changed recomputes just the affected annual rows,
+the `pct_change` of the following year, the annual_metrics rows for both, and the
+cumulative rows of the affected metros. Everything else is left untouched.
+
+Lineage is kept as parquet next to the derived data so `ensure_*` can record it
+without a database connection. Derived rows built before lineage existed have no
+edges; `backfill_lineage` (`refresh-revisions --backfill`) records them from the
+current cache files, which then count as the unrevised baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable
+
+import duckdb
+import pandas as pd
+
+from bls_housing.census_cache import convert_cached_raw, get_raw_path
+from bls_housing.helper import QUARTER_TO_MONTH
+from bls_housing.pipeline.duck import managed_connection, update_db
+from bls_housing.pipeline.ensure import DERIVED_DIR, _read_parquet_if_exists, _upsert_parquet
+from bls_housing.pipeline.marts import build_annual_metrics, build_cumulative_metrics
+from bls_housing.pipeline.permits import build_annual_permits
+from bls_housing.pipeline.wages import _to_qcew, build_annual_wages
+from bls_housing.qcew_cache import get_cache_path
+from bls_housing.tiered_cache import resolve_cached
+
+logger = logging.getLogger(__name__)
+
+LINEAGE_DIR = DERIVED_DIR / "lineage"
+SOURCE_FILES_PATH = LINEAGE_DIR / "source_files.parquet"
+SOURCE_LINEAGE_PATH = LINEAGE_DIR / "source_lineage.parquet"
+
+# derived target -> (parquet name, value column, change column)
+TARGETS = {
+    "annual_wages": ("annual_wages.parquet", "Real_Total_Wages", "Change_Real_Wage"),
+    "annual_permits": ("annual_permits.parquet", "Total_Permits", "Change_Permit"),
+}
+
+
+@dataclass
+class RefreshResult:
+    changed_files: list[str] = field(default_factory=list)
+    wages_keys: set[tuple[int, int]] = field(default_factory=set)
+    permits_keys: set[tuple[int, int]] = field(default_factory=set)
+    annual_rows: int = 0
+    cumulative_codes: set[int] = field(default_factory=set)
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_row(path: Path, source: str, sha: str | None = None) -> dict:
+    """Stat/hash row keyed by the hot-tier `path`, read from whichever tier holds it."""
+    src = resolve_cached(path)
+    if src is None:
+        raise FileNotFoundError(f"{path} is in neither cache tier")
+    st = src.stat()
+    return {
+        "src_path": str(path),
+        "source": source,
+        "size": int(st.st_size),
+        "mtime_ns": int(st.st_mtime_ns),
+        "sha256": sha or file_sha256(src),
+    }
+
+
+def source_paths(target: str, code: int, year: int, quarters: Iterable[int] = (1, 2, 3, 4)) -> list[tuple[str, Path]]:
+    """(source, path) of every raw cache file feeding one (Code, Year) of `target`."""
+    if target == "annual_wages":
+        return [("qcew", get_cache_path(_to_qcew(code), str(year), str(q))) for q in quarters]
+    if target == "annual_permits":
+        return [
+            ("bps", get_raw_path(str(year), mon))
+            for q in quarters for mon in QUARTER_TO_MONTH[str(q)]
+        ]
+    raise ValueError(f"Unknown lineage target {target!r}")
+
+
+def record_lineage(target: str, keys: Iterable[tuple[int, int]], quarters: Iterable[int] = (1, 2, 3, 4)) -> int:
+    """Record which raw files fed `keys` of `target` and hash files not seen before.
+    Returns the number of lineage edges written."""
+    quarters = list(quarters)
+    edges: list[dict] = []
+    for code, year in keys:
+        for source, path in source_paths(target, int(code), int(year), quarters):
+            if resolve_cached(path) is not None:
+                edges.append({"src_path": str(path), "source": source,
+                              "target": target, "Code": int(code), "Year": int(year)})
+    if not edges:
+        return 0
+
+    LINEAGE_DIR.mkdir(parents=True, exist_ok=True)
+    lineage = pd.concat([_read_parquet_if_exists(SOURCE_LINEAGE_PATH), pd.DataFrame(edges)], ignore_index=True)
+    lineage = lineage.drop_duplicates(["src_path", "target", "Code", "Year"]).reset_index(drop=True)
+    lineage.to_parquet(SOURCE_LINEAGE_PATH, index=False)
+
+    files = _read_parquet_if_exists(SOURCE_FILES_PATH)
+    known = set(files["src_path"]) if not files.empty else set()
+    new_files = {(e["src_path"], e["source"]) for e in edges if e["src_path"] not in known}
+    if new_files:
+        rows = [_stat_row(Path(p), src) for p, src in sorted(new_files)]
+        files = pd.concat([files, pd.DataFrame(rows)], ignore_index=True)
+        files.to_parquet(SOURCE_FILES_PATH, index=False)
+    return len(edges)
+
+
+def backfill_lineage(derived_dir: Path = DERIVED_DIR) -> dict[str, int]:
+    """Record lineage for every (Code, Year) already in the derived parquet.
+
+    Source paths are derived from the keys the same way `ensure_*` records them.
+    Files are hashed as they are now, so a revision that landed before the backfill
+    is not detected; rebuild those years first if that matters. Returns edges
+    written per target.
+    """
+    written = {}
+    for target, (parquet_name, _, _) in TARGETS.items():
+        df = _read_parquet_if_exists(derived_dir / parquet_name)
+        if df.empty:
+            continue
+        keys = df[["Code", "Year"]].drop_duplicates().itertuples(index=False, name=None)
+        written[target] = record_lineage(target, keys)
+    return written
+
+
+def detect_changed_sources() -> pd.DataFrame:
+    """Recorded source files whose content hash changed, with their new stat/hash.
+    Files with unchanged size and mtime are not rehashed. Files that were touched
+    but kept their hash (e.g. a refetch) get their new size/mtime stored, so they
+    are not rehashed again. Evicted files are checked through their cold-tier copy."""
+    files = _read_parquet_if_exists(SOURCE_FILES_PATH)
+    if files.empty:
+        return pd.DataFrame(columns=["src_path", "source", "size", "mtime_ns", "sha256"])
+
+    changed, touched = [], []
+    for r in files.itertuples(index=False):
+        path = Path(str(r.src_path))
+        src = resolve_cached(path)
+        if src is None:
+            continue
+        st = src.stat()
+        if st.st_size == r.size and st.st_mtime_ns == r.mtime_ns:
+            continue
+        sha = file_sha256(src)
+        if sha != r.sha256:
+            changed.append(_stat_row(path, str(r.source), sha))
+        else:
+            logger.debug("Touched but unchanged: %s", path)
+            touched.append(_stat_row(path, str(r.source), sha))
+    if touched:
+        fresh = pd.DataFrame(touched)
+        files = pd.concat([files[~files["src_path"].isin(fresh["src_path"])], fresh], ignore_index=True)
+        files.to_parquet(SOURCE_FILES_PATH, index=False)
+    return pd.DataFrame(changed, columns=["src_path", "source", "size", "mtime_ns", "sha256"])
+
+
+def affected_keys(changed_paths: Iterable[str]) -> dict[str, set[tuple[int, int]]]:
+    """target -> (Code, Year) keys fed by any of `changed_paths`."""
+    lineage = _read_parquet_if_exists(SOURCE_LINEAGE_PATH)
+    out: dict[str, set[tuple[int, int]]] = {t: set() for t in TARGETS}
+    if lineage.empty:
+        return out
+    hit = lineage[lineage["src_path"].isin(set(changed_paths))]
+    for target, grp in hit.groupby("target"):
+        out[str(target)] = {(int(c), int(y)) for c, y in zip(grp["Code"], grp["Year"])}
+    return out
+
+
+def _rebuild_target(target: str, keys: set[tuple[int, int]]) -> tuple[pd.DataFrame, pd.DataFrame, set[tuple[int, int]]]:
+    """Rebuild `keys` of a derived target and upsert them.
+
+    Returns (fine-grained fact rows, full updated annual frame, touched keys), where
+    touched keys are the rebuilt rows plus the next year, whose pct_change moved.
+    """
+    parquet_name, value_col, change_col = TARGETS[target]
+    path = DERIVED_DIR / parquet_name
+    existing = _read_parquet_if_exists(path)
+    if existing.empty or not keys:
+        return pd.DataFrame(), existing, set()
+
+    metros_all = existing[["Area", "Code"]].drop_duplicates("Code")
+    builder = build_annual_wages if target == "annual_wages" else build_annual_permits
+
+    facts, rebuilt = [], []
+    by_year: dict[int, list[int]] = {}
+    for code, year in keys:
+        by_year.setdefault(year, []).append(code)
+    for year, codes in sorted(by_year.items()):
+        metros = metros_all[metros_all["Code"].isin(codes)]
+        if metros.empty:
+            continue
+        (fact_df, annual_df) = builder(metros, [year])
+        facts.append(fact_df)
+        rebuilt.append(annual_df.drop(columns=[change_col]))
+    if not rebuilt:
+        return pd.DataFrame(), existing, set()
+
+    # replace the levels of the rebuilt rows, keep every other row as stored
+    new_rows = pd.concat(rebuilt, ignore_index=True)
+    merged = existing.merge(new_rows[["Code", "Year"]], on=["Code", "Year"], how="left", indicator=True)
+    untouched = existing[(merged["_merge"] == "left_only").to_numpy()]
+    updated = pd.concat([untouched, new_rows], ignore_index=True).sort_values(["Code", "Year"])
+
+    # pct_change only moves for the rebuilt year and the year after it
+    touched = set(keys) | {(c, y + 1) for c, y in keys}
+    recomputed = updated.groupby("Code")[value_col].pct_change() * 100
+    is_touched = pd.Series(
+        [(int(c), int(y)) in touched for c, y in zip(updated["Code"], updated["Year"])],
+        index=updated.index,
+    )
+    updated[change_col] = updated[change_col].where(~is_touched, recomputed)
+    updated = _upsert_parquet(path, updated, key_cols=["Code", "Year"])
+
+    stored = {(int(c), int(y)) for c, y in zip(updated["Code"], updated["Year"])}
+    return pd.concat(facts, ignore_index=True), updated, touched & stored
+
+
+def _cumulative_base_years(con: duckdb.DuckDBPyConnection, codes: list[int]) -> dict[int, int]:
+    rows = con.execute("""
+        SELECT Code, min(Year) FROM cumulative_metrics
+        WHERE Code IN (SELECT * FROM UNNEST(?))
+        GROUP BY Code
+        """, [codes]).fetchall()
+    return {int(c): int(y) for c, y in rows}
+
+
+def refresh_revised(con: duckdb.DuckDBPyConnection) -> RefreshResult:
+    """Propagate revised raw files into the derived parquet and the marts."""
+    result = RefreshResult()
+    changed = detect_changed_sources()
+    if changed.empty:
+        return result
+    result.changed_files = changed["src_path"].tolist()
+    logger.info("%d source files changed content", len(changed))
+
+    # BPS raw changed -> its cleaned CSV is stale
+    for src in changed.loc[changed["source"] == "bps", "src_path"]:
+        stem = Path(src).stem  # tb3u201901 / cbsamonthly_202001
+        ym = stem[-6:]
+        convert_cached_raw(ym[:4], ym[4:])
+
+    keys = affected_keys(result.changed_files)
+    result.wages_keys = keys["annual_wages"]
+    result.permits_keys = keys["annual_permits"]
+
+    wages_q, wages_annual, wages_touched = _rebuild_target("annual_wages", result.wages_keys)
+    permits_m, permits_annual, permits_touched = _rebuild_target("annual_permits", result.permits_keys)
+    touched = wages_touched | permits_touched
+
+    final_df = pd.DataFrame()
+    cumulative_df = pd.DataFrame()
+    if touched and not wages_annual.empty and not permits_annual.empty:
+        codes = sorted({c for c, _ in touched})
+        w = wages_annual[wages_annual["Code"].isin(codes)]
+        p = permits_annual[permits_annual["Code"].isin(codes)]
+
+        annual = build_annual_metrics(w, p)
+        is_touched = [(int(c), int(y)) in touched for c, y in zip(annual["Code"], annual["Year"])]
+        final_df = annual[is_touched]
+        result.annual_rows = len(final_df)
+
+        parts = []
+        base_years = _cumulative_base_years(con, codes)
+        for base_year in sorted(set(base_years.values())):
+            base_codes = [c for c, b in base_years.items() if b == base_year]
+            parts.append(build_cumulative_metrics(
+                w[w["Code"].isin(base_codes)], p[p["Code"].isin(base_codes)], base_year
+            ))
+        if parts:
+            cumulative_df = pd.concat(parts, ignore_index=True)
+            result.cumulative_codes = set(cumulative_df["Code"].astype("int64"))
+
+    # update_db also refreshes the rollups and cumulative_metrics_by_base
+    update_db(con, final_df, cumulative_df, wages_q, permits_m)
+
+    # the new content is now reflected downstream
+    files = _read_parquet_if_exists(SOURCE_FILES_PATH)
+    files = pd.concat([files[~files["src_path"].isin(changed["src_path"])], changed], ignore_index=True)
+    files.to_parquet(SOURCE_FILES_PATH, index=False)
+    return result
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Recompute derived rows and marts fed by revised raw cache files"
+    )
+    ap.add_argument("--backfill", action="store_true",
+                    help="first record lineage for derived rows built before lineage existed")
+    args = ap.parse_args()
+
+    t0 = perf_counter()
+    if args.backfill:
+        for target, n in backfill_lineage().items():
+            print(f"[refresh-revisions] backfilled {target}: {n} lineage edges")
+    print("[refresh-revisions] checking source hashes...")
+    with managed_connection(profile="build") as con:
+        res = refresh_revised(con)
+    print(f"[refresh-revisions] changed files: {len(res.changed_files)}, "
+          f"wage keys: {len(res.wages_keys)}, permit keys: {len(res.permits_keys)}, "
+          f"annual rows: {res.annual_rows}, cumulative metros: {len(res.cumulative_codes)}")
+    print(f"[refresh-revisions] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,24 @@
+import argparse
+import numpy as np
 import pandas as pd
 import logging
+from time import perf_counter
+
+import duckdb
+
+from bls_housing.pipeline import polars_engine
+from bls_housing.pipeline.cube import MetroCube
+from bls_housing.pipeline.duck import managed_connection, update_cumulative_by_base
+from bls_housing.pipeline.ensure import DERIVED_DIR, _read_parquet_if_exists
+from bls_housing.pipeline.polars_engine import check_engine
 
 logger = logging.getLogger(__name__)
 
-def build_annual_metrics(annual_wages_df, annual_permits) -> pd.DataFrame:
+def build_annual_metrics(annual_wages_df, annual_permits, engine: str = "pandas") -> pd.DataFrame:
     """Build derived annual metrics, and Zoning pressure calculation, 
     adjusting for inflation."""
+    if check_engine(engine) == "polars":
+        return polars_engine.build_annual_metrics(annual_wages_df, annual_permits)
 
     final_df = pd.merge(
         annual_wages_df,
@@ -22,9 +35,12 @@ def build_annual_metrics(annual_wages_df, annual_permits) -> pd.DataFrame:
 
 def build_cumulative_metrics(annual_wages_df: pd.DataFrame,
                              annual_permits: pd.DataFrame,
-                             base_year: int) -> pd.DataFrame:
+                             base_year: int,
+                             engine: str = "pandas") -> pd.DataFrame:
     """Build derived cumulative metrics, adjusting for inflation.
     Note: use base year as start year + 1 for cumulative indices."""
+    if check_engine(engine) == "polars":
+        return polars_engine.build_cumulative_metrics(annual_wages_df, annual_permits, base_year)
     # 1) merge raw totals
     cumulative_df = (
         annual_wages_df[["Area", "Code", "Year", "Real_Total_Wages"]]
@@ -34,13 +50,13 @@ def build_cumulative_metrics(annual_wages_df: pd.DataFrame,
             how="inner",
         )
     )
-    logger.debug(f"Cumulative DF head:\n{cumulative_df.head()}")
+    logger.debug("Cumulative DF head:\n%s", cumulative_df.head())
     base_year_check = (
         cumulative_df[cumulative_df["Year"] == base_year]
         .groupby("Code").size()
     )
 
-    logger.debug(f"Base year check: {base_year_check} ")
+    logger.debug("Base year check: %s ", base_year_check)
 
     # keep types sane (Year as int is cleaner than string comparisons)
     cumulative_df["Year"] = cumulative_df["Year"].astype(int)
@@ -65,4 +81,125 @@ def build_cumulative_metrics(annual_wages_df: pd.DataFrame,
     # 5) structural gap (guard divide-by-zero / missing base)
     cumulative_df["Structural_Gap"] = cumulative_df["Cumul_Wage_Index"] / cumulative_df["Cumul_Permit_Index"]
 
-    return cumulative_df
\ No newline at end of file
+    return cumulative_df
+
+def build_cumulative_metrics_sweep(annual_wages_df: pd.DataFrame,
+                                   annual_permits: pd.DataFrame,
+                                   base_years: list[int]) -> pd.DataFrame:
+    """Cumulative metrics for every candidate base year in one vectorized pass.
+
+    Same rows and columns as concatenating build_cumulative_metrics(..., b) for each
+    b in base_years, plus a leading Base_Year column. Base-year totals are broadcast
+    over a (base_year, metro, year) grid instead of re-running the merges per base."""
+    wages = MetroCube.from_frame(annual_wages_df, "Real_Total_Wages")
+    permits = MetroCube.from_frame(annual_permits, "Total_Permits")
+
+    codes, ia, ib = np.intersect1d(wages.codes, permits.codes, assume_unique=True, return_indices=True)
+    years, ya, yb = np.intersect1d(wages.years, permits.years, assume_unique=True, return_indices=True)
+    bases = np.asarray(sorted(int(b) for b in base_years), dtype="int64")
+    missing = set(bases.tolist()) - set(years.tolist())
+    if missing:
+        raise ValueError(f"Base years {sorted(missing)} not present in both wages and permits")
+
+    w = wages.values[np.ix_(ia, ya)][:, :, 0]            # (M, Y)
+    p = permits.values[np.ix_(ib, yb)][:, :, 0]
+    observed = wages.mask[np.ix_(ia, ya)][:, :, 0] & permits.mask[np.ix_(ib, yb)][:, :, 0]
+
+    bi = np.searchsorted(years, bases)                   # (B,)
+    base_w = w[:, bi].T[:, :, None]                      # (B, M, 1)
+    base_p = p[:, bi].T[:, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wage_index = w[None, :, :] / base_w              # (B, M, Y)
+        permit_index = p[None, :, :] / base_p
+        gap = wage_index / permit_index
+
+    keep = observed[None, :, :] & (years[None, None, :] >= bases[:, None, None])
+    shape = keep.shape
+    grid = lambda a: np.broadcast_to(a, shape)[keep]  # noqa: E731
+
+    logger.debug("Cumulative sweep grid %s, rows kept %d", shape, int(keep.sum()))
+    return pd.DataFrame({
+        "Base_Year": grid(bases[:, None, None]),
+        "Area": grid(wages.areas[ia][None, :, None]),
+        "Code": grid(codes[None, :, None]),
+        "Year": grid(years[None, None, :]),
+        "Real_Total_Wages": grid(w[None]),
+        "Total_Permits": grid(p[None]),
+        "Base_Wage": grid(base_w),
+        "Base_Permits": grid(base_p),
+        "Cumul_Wage_Index": wage_index[keep],
+        "Cumul_Permit_Index": permit_index[keep],
+        "Structural_Gap": gap[keep],
+    })
+
+
+def _swept_base_years(con: duckdb.DuckDBPyConnection) -> list[int]:
+    try:
+        rows = con.execute("SELECT DISTINCT Base_Year FROM cumulative_metrics_by_base ORDER BY 1").fetchall()
+    except duckdb.CatalogException:
+        return []
+    return [int(r[0]) for r in rows]
+
+
+def refresh_cumulative_by_base(con: duckdb.DuckDBPyConnection,
+                               annual_wages_df: pd.DataFrame,
+                               annual_permits: pd.DataFrame,
+                               base_years: list[int] | None = None,
+                               codes: list[int] | None = None) -> int:
+    """Sweep `base_years` (default: the base years already in cumulative_metrics_by_base)
+    for `codes` (default: every metro) and upsert the rows. Base years missing from the
+    data are skipped. Returns rows written; 0 if the table was never seeded."""
+    bases = _swept_base_years(con) if base_years is None else sorted({int(b) for b in base_years})
+    if not bases or annual_wages_df.empty or annual_permits.empty:
+        return 0
+    if codes is not None:
+        annual_wages_df = annual_wages_df[annual_wages_df["Code"].isin(codes)]
+        annual_permits = annual_permits[annual_permits["Code"].isin(codes)]
+    common = set(annual_wages_df["Year"].astype(int)) & set(annual_permits["Year"].astype(int))
+    bases = [b for b in bases if b in common]
+    if not bases:
+        return 0
+    sweep_df = build_cumulative_metrics_sweep(annual_wages_df, annual_permits, bases)
+    update_cumulative_by_base(con, sweep_df)
+    return len(sweep_df)
+
+
+def _years(spec: str) -> list[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Fill cumulative_metrics_by_base from the derived annual wages and permits"
+    )
+    ap.add_argument("--base-years", default=None,
+                    help="e.g. 2015-2020 (default: every year in both wages and permits)")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-cumulative-sweep] starting...")
+    wages = _read_parquet_if_exists(DERIVED_DIR / "annual_wages.parquet")
+    permits = _read_parquet_if_exists(DERIVED_DIR / "annual_permits.parquet")
+    if wages.empty or permits.empty:
+        print(f"[build-cumulative-sweep] no derived annual wages/permits under {DERIVED_DIR}")
+        return 1
+    if args.base_years:
+        bases = _years(args.base_years)
+    else:
+        bases = sorted(set(wages["Year"].astype(int)) & set(permits["Year"].astype(int)))
+    if not bases:
+        print("[build-cumulative-sweep] no base years to sweep")
+        return 1
+    with managed_connection(profile="build") as con:
+        n = refresh_cumulative_by_base(con, wages, permits, bases)
+    print(f"[build-cumulative-sweep] base years {bases[0]}-{bases[-1]}: {n} rows")
+    print(f"[build-cumulative-sweep] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,20 +1,21 @@
 # bls_housing/pipeline/parquetify.py
 
-from pathlib import Path
-from bls_housing.pipeline.duck import get_analysis_db_connection
+from bls_housing.pipeline.compact import touch_last_write
+from bls_housing.pipeline.duck import managed_connection
+from bls_housing.settings import cache_root, lake_root
+from bls_housing.tiered_cache import readable_files
 import re
 from time import perf_counter
 
-
-PROJECT_ROOT = Path(__file__).parents[3].resolve()  # adjust to your layout
-bls_dir = PROJECT_ROOT / "data" / "cache" / "bls"
+bls_dir = cache_root() / "bls"
 
 def build_bls_manifest(con):
 
     pat = re.compile(r"C(\d{4})_(\d{4})_([1-4])\.csv$")
     
     rows = []
-    for p in bls_dir.glob("C????_????_?.csv"):
+    # evicted files are read straight from the cold tier
+    for p in readable_files(bls_dir, "C????_????_?.csv"):
         m = pat.search(p.name)
         if not m:
             continue
@@ -40,7 +41,7 @@ def build_bls_manifest(con):
     return df['rows'].iloc[0]
 
 
-LAKE_ROOT = PROJECT_ROOT / "data" / "lake" / "bls"
+LAKE_ROOT = lake_root() / "bls"
 
 def build_bls_parquet(con, force: bool = False) -> tuple[int,int]:
     (written, skipped) = (0,0)
@@ -72,6 +73,10 @@ def build_bls_parquet(con, force: bool = False) -> tuple[int,int]:
             (FORMAT PARQUET);
         """)
         written+=1
+
+    if written:
+        # the compacted lake (compact-lake) is stale from here on
+        touch_last_write(LAKE_ROOT)
     return (written, skipped)
 
 
@@ -79,7 +84,7 @@ def main() -> int:
     t0 = perf_counter()
     print("[build-parquet-lake] starting...")
 
-    with get_analysis_db_connection() as con:
+    with managed_connection(profile="build") as con:
         manifest_count = build_bls_manifest(con)  # return int
         print(f"[build-parquet-lake] manifest rows: {manifest_count} in {perf_counter() - t0:.2f}s")
 
@@ -0,0 +1,235 @@
+# bls_housing/pipeline/peers.py
+"""Metro peer groups: "which metros behave like Austin?".
+
+`build_features` turns the marts into one metros x features matrix:
+
+- wage_growth_<year>   Change_Real_Wage   (annual_metrics)
+- permit_growth_<year> Change_Permit      (annual_metrics)
+- gap_<year>           Structural_Gap     (cumulative_metrics)
+- single_unit_share, five_plus_share      permit mix summed over the cached BPS files
+
+Columns are z-scored across metros, with missing or non-finite values set to the
+column mean (0). Each group is scaled by 1/sqrt(columns) so the short mix group
+weighs as much as a decade of growth rates. The pairwise distance matrix is computed
+with one matrix product: 1 - Pearson correlation of the rows, or euclidean distance.
+It is cached under data/derived/peers/ keyed by the database's data version, so a
+`top_peers` query is a single argpartition over one row.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from bls_housing.census_cache import CSV_DIR
+from bls_housing.pipeline.duck import get_data_version, managed_connection
+from bls_housing.settings import derived_root
+from bls_housing.tiered_cache import readable_files
+
+logger = logging.getLogger(__name__)
+
+PEER_DIR = derived_root() / "peers"
+METRICS = ("correlation", "euclidean")
+KEEP_FILES = 8
+
+# feature group -> (table, value column)
+SERIES_FEATURES = {
+    "wage_growth": ("annual_metrics", "Change_Real_Wage"),
+    "permit_growth": ("annual_metrics", "Change_Permit"),
+    "gap": ("cumulative_metrics", "Structural_Gap"),
+}
+MIX_COLUMNS = {"single_unit_share": "1 Unit", "five_plus_share": "5 Units or More"}
+
+
+@dataclass(frozen=True)
+class PeerIndex:
+    codes: np.ndarray          # (metros,)
+    areas: np.ndarray          # (metros,)
+    feature_names: list[str]
+    features: np.ndarray       # (metros, features) standardized
+    distances: np.ndarray      # (metros, metros) float32
+    metric: str
+    data_version: str | None
+
+    def top_peers(self, code: int, k: int = 10) -> pd.DataFrame:
+        """The k metros closest to `code` (excluding itself), nearest first."""
+        hits = np.flatnonzero(self.codes == int(code))
+        if not len(hits):
+            raise KeyError(f"Metro {code} is not in the peer index")
+        row = self.distances[hits[0]].astype("float64")
+        row[hits[0]] = np.inf
+        k = min(k, len(row) - 1)
+        if k <= 0:
+            return pd.DataFrame(columns=["Rank", "Code", "Area", "Distance"])
+        idx = np.argpartition(row, k - 1)[:k]
+        idx = idx[np.argsort(row[idx], kind="stable")]
+        return pd.DataFrame({
+            "Rank": np.arange(1, k + 1),
+            "Code": self.codes[idx],
+            "Area": self.areas[idx],
+            "Distance": row[idx],
+        })
+
+
+def _permit_mix(con: duckdb.DuckDBPyConnection, csv_dir: Path = CSV_DIR) -> pd.DataFrame:
+    """Share of single-unit and 5+ unit permits per CBSA over every cached BPS month."""
+    files = readable_files(csv_dir, "CBSA_*.csv")
+    if not files:
+        return pd.DataFrame(columns=["Code", *MIX_COLUMNS])
+    file_list = ", ".join("'" + str(p).replace("'", "''") + "'" for p in files)
+    source = f"read_csv([{file_list}], union_by_name=true, all_varchar=true)"
+    present = {r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    if not set(MIX_COLUMNS.values()) <= present:
+        logger.info("Cached BPS files have no unit-size columns; permit mix features skipped")
+        return pd.DataFrame(columns=["Code", *MIX_COLUMNS])
+    shares = ", ".join(
+        f'sum(TRY_CAST("{col}" AS DOUBLE)) / nullif(sum(TRY_CAST("Total" AS DOUBLE)), 0) AS {name}'
+        for name, col in MIX_COLUMNS.items()
+    )
+    return con.execute(f"""
+        SELECT TRY_CAST(CBSA AS BIGINT) AS Code, {shares}
+        FROM {source}
+        WHERE TRY_CAST(CBSA AS BIGINT) IS NOT NULL
+        GROUP BY 1
+        """).df()
+
+
+def _standardize(block: np.ndarray) -> np.ndarray:
+    block = np.where(np.isfinite(block), block, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(block, axis=0)
+        std = np.nanstd(block, axis=0)
+        z = (block - mean) / np.where(std > 0, std, 1.0)
+    z = np.nan_to_num(z, nan=0.0)
+    return z / np.sqrt(block.shape[1])
+
+
+def build_features(con: duckdb.DuckDBPyConnection, years: list[int] | None = None,
+                   csv_dir: Path = CSV_DIR) -> tuple[pd.DataFrame, np.ndarray, list[str]]:
+    """(metros [Code, Area], standardized feature matrix, feature names)."""
+    metros = con.execute("SELECT Code, any_value(Area) AS Area FROM annual_metrics GROUP BY Code ORDER BY Code").df()
+    blocks, names = [], []
+    for group, (table, col) in SERIES_FEATURES.items():
+        long = con.execute(f"SELECT Code, Year, {col} AS v FROM {table}").df()
+        if years:
+            long = long[long["Year"].isin(years)]
+        if long.empty:
+            continue
+        wide = long.pivot_table(index="Code", columns="Year", values="v", aggfunc="first", dropna=False)
+        wide = wide.reindex(metros["Code"])
+        values = wide.to_numpy(dtype="float64")
+        keep = np.isfinite(values).any(axis=0)   # e.g. the first year has no growth rate
+        if not keep.any():
+            continue
+        blocks.append(_standardize(values[:, keep]))
+        names += [f"{group}_{int(y)}" for y in wide.columns[keep]]
+
+    mix = _permit_mix(con, csv_dir)
+    if not mix.empty:
+        mix = mix.set_index("Code").reindex(metros["Code"])
+        blocks.append(_standardize(mix[list(MIX_COLUMNS)].to_numpy(dtype="float64")))
+        names += list(MIX_COLUMNS)
+
+    features = np.hstack(blocks) if blocks else np.zeros((len(metros), 0))
+    return metros, features, names
+
+
+def pairwise_distances(features: np.ndarray, metric: str = "correlation") -> np.ndarray:
+    """All-pairs distance matrix from one matrix product."""
+    if metric == "correlation":
+        centered = features - features.mean(axis=1, keepdims=True)
+        norm = np.linalg.norm(centered, axis=1, keepdims=True)
+        unit = centered / np.where(norm > 0, norm, 1.0)
+        dist = 1.0 - unit @ unit.T
+    elif metric == "euclidean":
+        sq = np.einsum("ij,ij->i", features, features)
+        dist = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * features @ features.T, 0.0))
+    else:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+    np.fill_diagonal(dist, 0.0)
+    return dist.astype("float32")
+
+
+def _cache_path(root: Path, data_version: str | None, metric: str, years: list[int] | None) -> Path:
+    spec = f"{data_version}|{metric}|{sorted(years) if years else 'all'}"
+    return root / f"peers-{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:16]}.npz"
+
+
+def build_peer_index(
+    con: duckdb.DuckDBPyConnection,
+    metric: str = "correlation",
+    years: list[int] | None = None,
+    root: Path = PEER_DIR,
+    force: bool = False,
+) -> PeerIndex:
+    """Load the cached index for the current data version, or build and cache it."""
+    data_version = get_data_version(con)
+    path = _cache_path(root, data_version, metric, years)
+    if data_version is not None and path.exists() and not force:
+        return _load_index(str(path), path.stat().st_mtime_ns)
+
+    t0 = perf_counter()
+    metros, features, names = build_features(con, years)
+    dist = pairwise_distances(features, metric)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, codes=metros["Code"].to_numpy(dtype="int64"), areas=metros["Area"].to_numpy(dtype=str),
+             feature_names=np.array(names, dtype=str), features=features, distances=dist,
+             metric=np.array(metric), data_version=np.array(data_version or ""))
+    tmp.replace(path)
+    for old in sorted(root.glob("peers-*.npz"), key=lambda p: p.stat().st_mtime_ns)[:-KEEP_FILES]:
+        old.unlink(missing_ok=True)
+    logger.info("Peer index: %d metros x %d features (%s) in %.2fs",
+                len(metros), len(names), metric, perf_counter() - t0)
+    return _load_index(str(path), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _load_index(path: str, mtime_ns: int) -> PeerIndex:
+    with np.load(path) as z:
+        return PeerIndex(
+            codes=z["codes"], areas=z["areas"], feature_names=z["feature_names"].tolist(),
+            features=z["features"], distances=z["distances"], metric=str(z["metric"]),
+            data_version=str(z["data_version"]) or None,
+        )
+
+
+def top_peers(con: duckdb.DuckDBPyConnection, code: int, k: int = 10,
+              metric: str = "correlation", years: list[int] | None = None) -> pd.DataFrame:
+    return build_peer_index(con, metric, years).top_peers(code, k)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Nearest peer metros by wage / permit trajectories")
+    ap.add_argument("--code", type=int, required=True, help="CBSA code, e.g. 12420 (Austin)")
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--metric", default="correlation", choices=METRICS)
+    ap.add_argument("--force", action="store_true", help="rebuild the cached index")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    with managed_connection(profile="query") as con:
+        t0 = perf_counter()
+        index = build_peer_index(con, args.metric, force=args.force)
+        t1 = perf_counter()
+        peers = index.top_peers(args.code, args.k)
+        t2 = perf_counter()
+    print(f"[find-peers] index {len(index.codes)} metros x {len(index.feature_names)} features "
+          f"in {t1 - t0:.3f}s, query {1000 * (t2 - t1):.2f}ms")
+    print(peers.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
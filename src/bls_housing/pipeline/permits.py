@@ -4,13 +4,19 @@
 
 # Load cleaned CBSA CSV from cache instead of manual XLS parsing
 from bls_housing.census_cache import load_cbsa_df
-from bls_housing.helper import QUARTER_TO_MONTH
+from bls_housing.helper import QUARTER_TO_MONTH, pct_change_unfilled
+from bls_housing.pipeline.checkpoint import RunJournal
+from bls_housing.pipeline import polars_engine
+from bls_housing.pipeline.polars_engine import check_engine
 from typing import cast
 from typing import List
+import logging
 import pandas as pd
 
 from collections import defaultdict
 
+logger = logging.getLogger(__name__)
+
 
 def safe_scalar(df: pd.DataFrame, col: str):
     if df.empty:
@@ -19,37 +25,66 @@ def safe_scalar(df: pd.DataFrame, col: str):
 
 def build_annual_permits(metros, 
                          years: List[int], 
-                         quarters = [1, 2, 3, 4]) -> tuple[pd.DataFrame, pd.DataFrame]:
+                         quarters = [1, 2, 3, 4],
+                         engine: str = "pandas",
+                         journal: RunJournal | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Monthly and annual permits per metro. With a `journal` finished (Code, Year)
+    units are checkpointed and those done by an interrupted earlier run are skipped."""
+    if check_engine(engine) == "polars":
+        return polars_engine.build_annual_permits(metros, years, quarters)
+
     total_permits = defaultdict(int)
     data_list = []
+    missing = 0
 
-    for m in metros.itertuples(index=False):
-        for year in years:
-            total_permits[year] = 0
-            for qtr in quarters:
-                for mon in QUARTER_TO_MONTH[str(qtr)]:  # months in quarter
-                    df = load_cbsa_df(str(year), str(mon))
-                    df_current_area = df[df['CBSA'] == m.Code]  # filter for CBSA
+    try:
+        for m in metros.itertuples(index=False):
+            for year in years:
+                done = journal.done(cast(int, m.Code), year) if journal else None
+                if done is not None:
+                    data_list.extend(done)
+                    continue
+                unit = []
+                total_permits[year] = 0
+                for qtr in quarters:
+                    for mon in QUARTER_TO_MONTH[str(qtr)]:  # months in quarter
+                        df = load_cbsa_df(str(year), str(mon))
+                        df_current_area = df[df['CBSA'] == m.Code]  # filter for CBSA
                 
-                # get Total_Permits for CBSA
-                    if df_current_area.empty:
-                        print(
-                            f"Missing permits: Code={m.Code}, Year={year}, Month={mon}"
-                        )
-                    total_permits_current_month = safe_scalar(df_current_area, 'Total')
-
-                    data_list.append({
-                    "Area": m.Area,
-                    "Code": cast(int, m.Code),
-                    "Year": int(year),
-                    "Quarter": qtr,
-                    "Month": int(mon),
-                    "Total_Permits": total_permits_current_month
-                })
+                    # get Total_Permits for CBSA
+                        if df_current_area.empty:
+                            missing += 1
+                            logger.debug("Missing permits: Code=%s, Year=%s, Month=%s", m.Code, year, mon)
+                        total_permits_current_month = safe_scalar(df_current_area, 'Total')
+
+                        unit.append({
+                        "Area": m.Area,
+                        "Code": cast(int, m.Code),
+                        "Year": int(year),
+                        "Quarter": qtr,
+                        "Month": int(mon),
+                        "Total_Permits": total_permits_current_month
+                    })
+                data_list.extend(unit)
+                if journal:
+                    journal.add(cast(int, m.Code), year, unit)
+    finally:
+        if journal:
+            journal.flush()   # completed units survive an interrupt or error
                 
+    if missing:
+        logger.warning("Missing permits for %d metro-months (see dq_issues / DEBUG log)", missing)
+    if journal and journal.skipped:
+        logger.info("Skipped %d permit units already checkpointed", journal.skipped)
     permits_df = pd.DataFrame(data_list)
     
-    # Calculate annual total permits and percentage change
-    annual_permits = permits_df.groupby(["Area", "Code", "Year"])["Total_Permits"].sum().reset_index()
-    annual_permits["Change_Permit"] = annual_permits.groupby("Code")["Total_Permits"].pct_change() * 100
+    # Calculate annual total permits and percentage change.
+    # A year missing any month is NaN, not the sum of the months it has
+    n_months = sum(len(QUARTER_TO_MONTH[str(q)]) for q in quarters)
+    annual_permits = (
+        permits_df.groupby(["Area", "Code", "Year"])["Total_Permits"].sum(min_count=n_months).reset_index()
+    )
+    annual_permits["Change_Permit"] = (
+        pct_change_unfilled(annual_permits, "Total_Permits") * 100
+    )
     return (permits_df, annual_permits)
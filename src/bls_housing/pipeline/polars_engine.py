@@ -0,0 +1,266 @@
+# bls_housing/pipeline/polars_engine.py
+"""Polars lazy-query implementations of the wage / permit builders and the marts.
+
+Same inputs and outputs (pandas frames, same rows, columns, order and dtypes) as the
+pandas versions in wages.py, permits.py and marts.py, which dispatch here with
+`engine="polars"`. Each cached source file becomes one lazy scan that only parses the
+needed columns (projection pushdown) and keeps the needed rows (predicate pushdown);
+all scans are concatenated into one plan and collected on all cores, optionally with
+the streaming engine.
+
+Wage sources:
+- "cache": QCEW area CSVs in data/cache/bls (downloaded on a miss, like the pandas path)
+- "lake":  parquet partitions written by `build-parquet-lake`
+           (data/lake/bls/cbsa_code=/year=/quarter=/data.parquet)
+
+Requires the optional `polars` extra.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+from bls_housing.census_cache import fetch_cbsa_csv
+from bls_housing.helper import CPI_U, QUARTER_TO_MONTH
+from bls_housing.qcew_cache import fetch_area_csv
+from bls_housing.settings import lake_root
+
+logger = logging.getLogger(__name__)
+
+LAKE_ROOT = lake_root() / "bls"
+WAGE_SOURCES = ("cache", "lake")
+ENGINES = ("pandas", "polars")
+
+
+def check_engine(engine: str) -> str:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    return engine
+
+
+def _require_polars():
+    try:
+        import polars as pl
+    except ImportError as e:
+        raise ImportError(
+            "The polars engine needs the optional polars dependency: "
+            "pip install 'bls_housing[polars]'"
+        ) from e
+    return pl
+
+
+def _pandas_like(df: pd.DataFrame, col: str, had_nulls: bool) -> pd.DataFrame:
+    """pandas builds these columns from python scalars and None, so they are int64
+    when complete and float64 as soon as one value is missing."""
+    if had_nulls:
+        df[col] = df[col].astype("float64")
+    return df
+
+
+def _cpi_factor(pl, target_year: str = "2024"):
+    factors = {int(y): CPI_U[target_year] / cpi for y, cpi in CPI_U.items()}
+    return pl.col("Year").replace_strict(factors, default=1.0, return_dtype=pl.Float64)
+
+
+def _complete_sum(pl, col: str):
+    """Group sum that is null when any value is missing, like pandas sum(min_count=n):
+    a year with a missing quarter or month is unknown, not smaller."""
+    return pl.when(pl.col(col).null_count() == 0).then(pl.col(col).sum()).otherwise(None).alias(col)
+
+
+def _pct_change(pl, col: str):
+    return (pl.col(col) / pl.col(col).shift(1).over("Code") - 1) * 100
+
+
+# ---- sources -------------------------------------------------------------------------
+
+def _qcew_file(pl, path: Path, code: int, year: int, qtr: int, parquet: bool):
+    lf = pl.scan_parquet(path) if parquet else pl.scan_csv(path, infer_schema=False)
+    return (
+        lf.select(
+            pl.col("agglvl_code").cast(pl.Int64, strict=False),
+            pl.col("total_qtrly_wages").cast(pl.Int64, strict=False).alias("Total_Wages"),
+        )
+        .filter(pl.col("agglvl_code") == 40)
+        .head(1)   # pandas takes the first agglvl 40 row
+        .select(
+            pl.lit(code, pl.Int64).alias("Code"),
+            pl.lit(year, pl.Int64).alias("Year"),
+            pl.lit(qtr, pl.Int64).alias("Quarter"),
+            "Total_Wages",
+        )
+    )
+
+
+def qcew_wages_lazy(metros: pd.DataFrame, years: List[int], quarters=[1, 2, 3, 4], source: str = "cache"):
+    """Lazy (Code, Year, Quarter, Total_Wages) for every metro-quarter found in `source`.
+    Quarters missing from a partly built lake are read from the QCEW cache instead."""
+    pl = _require_polars()
+    if source not in WAGE_SOURCES:
+        raise ValueError(f"Unknown wage source {source!r}, expected one of {WAGE_SOURCES}")
+    frames = []
+    for code in dict.fromkeys(int(c) for c in metros["Code"]):
+        for year in years:
+            for qtr in quarters:
+                path = LAKE_ROOT / f"cbsa_code={code // 10 * 10}" / f"year={year}" / f"quarter={qtr}" / "data.parquet"
+                parquet = source == "lake" and path.exists()
+                if not parquet:
+                    # cache source, or a quarter the lake does not have yet
+                    path = fetch_area_csv(f"C{code // 10:04d}", str(year), str(qtr))
+                frames.append(_qcew_file(pl, path, code, int(year), int(qtr), parquet=parquet))
+    if not frames:
+        return pl.LazyFrame(schema={"Code": pl.Int64, "Year": pl.Int64, "Quarter": pl.Int64, "Total_Wages": pl.Int64})
+    return pl.concat(frames, how="vertical")
+
+
+def bps_permits_lazy(metros: pd.DataFrame, years: List[int], quarters=[1, 2, 3, 4]):
+    """Lazy (Code, Year, Month, Total_Permits) for every metro-month found in the BPS CSVs."""
+    pl = _require_polars()
+    codes = sorted({int(c) for c in metros["Code"]})
+    frames = []
+    for year in years:
+        for qtr in quarters:
+            for mon in QUARTER_TO_MONTH[str(qtr)]:
+                path = fetch_cbsa_csv(str(year), str(mon))
+                frames.append(
+                    pl.scan_csv(path, infer_schema=False)
+                    .select(
+                        pl.col("CBSA").cast(pl.Int64, strict=False).alias("Code"),
+                        pl.col("Total").cast(pl.Float64, strict=False).alias("Total_Permits"),
+                    )
+                    .filter(pl.col("Code").is_in(codes))
+                    .unique(subset="Code", keep="first", maintain_order=True)
+                    .with_columns(
+                        pl.lit(int(year), pl.Int64).alias("Year"),
+                        pl.lit(int(mon), pl.Int64).alias("Month"),
+                    )
+                )
+    if not frames:
+        return pl.LazyFrame(schema={"Code": pl.Int64, "Total_Permits": pl.Float64, "Year": pl.Int64, "Month": pl.Int64})
+    return pl.concat(frames, how="vertical")
+
+
+# ---- builders ------------------------------------------------------------------------
+
+def build_annual_wages(metros: pd.DataFrame,
+                       years: List[int],
+                       quarters=[1, 2, 3, 4],
+                       source: str = "cache",
+                       streaming: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
+    pl = _require_polars()
+    grid = pl.LazyFrame(
+        {
+            "Area": [m.Area for m in metros.itertuples(index=False) for _ in years for _ in quarters],
+            "Code": [int(code) for code in metros["Code"] for _ in years for _ in quarters],
+            "Year": [int(y) for _ in range(len(metros)) for y in years for _ in quarters],
+            "Quarter": [int(q) for _ in range(len(metros)) for _ in years for q in quarters],
+        },
+        schema={"Area": pl.String, "Code": pl.Int64, "Year": pl.Int64, "Quarter": pl.Int64},
+    )
+    found = qcew_wages_lazy(metros, years, quarters, source)
+    quarterly = grid.join(found, on=["Code", "Year", "Quarter"], how="left", maintain_order="left")
+    annual = (
+        quarterly.group_by(["Area", "Code", "Year"]).agg(_complete_sum(pl, "Total_Wages"))
+        .sort(["Area", "Code", "Year"])
+        .with_columns((pl.col("Total_Wages").cast(pl.Float64) * _cpi_factor(pl)).alias("Real_Total_Wages"))
+        .with_columns(_pct_change(pl, "Real_Total_Wages").alias("Change_Real_Wage"))
+    )
+    wages_pl, annual_pl = pl.collect_all([quarterly, annual], engine="streaming" if streaming else "auto")
+
+    missing = wages_pl["Total_Wages"].null_count()
+    if missing:
+        logger.warning("Missing agglvl 40 wages for %d metro-quarters (see dq_issues / DEBUG log)", missing)
+    wages_df = _pandas_like(wages_pl.to_pandas(), "Total_Wages", missing > 0)
+    annual_df = _pandas_like(annual_pl.to_pandas(), "Total_Wages", missing > 0)
+    return (wages_df, annual_df)
+
+
+def build_annual_permits(metros: pd.DataFrame,
+                         years: List[int],
+                         quarters=[1, 2, 3, 4],
+                         streaming: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
+    pl = _require_polars()
+    months = [(int(q), int(mon)) for q in quarters for mon in QUARTER_TO_MONTH[str(q)]]
+    n = len(years) * len(months)
+    grid = pl.LazyFrame(
+        {
+            "Area": [m.Area for m in metros.itertuples(index=False) for _ in range(n)],
+            "Code": [int(code) for code in metros["Code"] for _ in range(n)],
+            "Year": [int(y) for _ in range(len(metros)) for y in years for _ in months],
+            "Quarter": [q for _ in range(len(metros)) for _ in years for q, _ in months],
+            "Month": [mon for _ in range(len(metros)) for _ in years for _, mon in months],
+        },
+        schema={"Area": pl.String, "Code": pl.Int64, "Year": pl.Int64, "Quarter": pl.Int64, "Month": pl.Int64},
+    )
+    found = bps_permits_lazy(metros, years, quarters)
+    monthly = grid.join(found, on=["Code", "Year", "Month"], how="left", maintain_order="left")
+    annual = (
+        monthly.group_by(["Area", "Code", "Year"]).agg(_complete_sum(pl, "Total_Permits"))
+        .sort(["Area", "Code", "Year"])
+        .with_columns(_pct_change(pl, "Total_Permits").alias("Change_Permit"))
+    )
+    permits_pl, annual_pl = pl.collect_all([monthly, annual], engine="streaming" if streaming else "auto")
+
+    missing = permits_pl["Total_Permits"].null_count()
+    if missing:
+        logger.warning("Missing permits for %d metro-months (see dq_issues / DEBUG log)", missing)
+    permits_df = permits_pl.to_pandas()
+    if not missing and (permits_df["Total_Permits"] % 1 == 0).all():
+        # whole-number counts parse as int64 in pandas
+        permits_df["Total_Permits"] = permits_df["Total_Permits"].astype("int64")
+    annual_df = annual_pl.to_pandas()
+    annual_df["Total_Permits"] = annual_df["Total_Permits"].astype(permits_df["Total_Permits"].dtype)
+    return (permits_df, annual_df)
+
+
+# ---- marts ---------------------------------------------------------------------------
+
+def build_annual_metrics(annual_wages_df: pd.DataFrame, annual_permits: pd.DataFrame) -> pd.DataFrame:
+    pl = _require_polars()
+    w = pl.from_pandas(annual_wages_df, nan_to_null=False).lazy()
+    p = pl.from_pandas(annual_permits, nan_to_null=False).lazy()
+    return (
+        w.join(p, on=["Area", "Code", "Year"], how="inner", maintain_order="left")
+        .with_columns(
+            (1 + pl.col("Change_Real_Wage") / 100).alias("Wage_Index"),
+            (1 + pl.col("Change_Permit") / 100).alias("Permit_Index"),
+        )
+        .with_columns((pl.col("Wage_Index") / pl.col("Permit_Index")).alias("Zoning_Pressure"))
+        .collect()
+        .to_pandas()
+    )
+
+
+def build_cumulative_metrics(annual_wages_df: pd.DataFrame,
+                             annual_permits: pd.DataFrame,
+                             base_year: int) -> pd.DataFrame:
+    pl = _require_polars()
+    w = pl.from_pandas(annual_wages_df[["Area", "Code", "Year", "Real_Total_Wages"]], nan_to_null=False).lazy()
+    p = pl.from_pandas(annual_permits[["Code", "Year", "Total_Permits"]], nan_to_null=False).lazy()
+    merged = (
+        w.join(p, on=["Code", "Year"], how="inner", maintain_order="left")
+        .with_columns(pl.col("Year").cast(pl.Int64))
+        .filter(pl.col("Year") >= base_year)
+    )
+    base = (
+        merged.filter(pl.col("Year") == base_year)
+        .select("Code", pl.col("Real_Total_Wages").alias("Base_Wage"), pl.col("Total_Permits").alias("Base_Permits"))
+    )
+    merged_df, base_df = pl.collect_all([merged, base])
+    dupes = base_df["Code"].is_duplicated().sum()
+    assert dupes == 0, f"Base year has duplicate codes: {dupes}"
+    return (
+        merged_df.lazy()
+        .join(base_df.lazy(), on="Code", how="left", maintain_order="left")
+        .with_columns(
+            (pl.col("Real_Total_Wages") / pl.col("Base_Wage")).alias("Cumul_Wage_Index"),
+            (pl.col("Total_Permits") / pl.col("Base_Permits")).alias("Cumul_Permit_Index"),
+        )
+        .with_columns((pl.col("Cumul_Wage_Index") / pl.col("Cumul_Permit_Index")).alias("Structural_Gap"))
+        .collect()
+        .to_pandas()
+    )
@@ -0,0 +1,205 @@
+# bls_housing/pipeline/quality.py
+"""Declarative data-quality checks over the facts and marts.
+
+Each `Check` is a SELECT that returns offending rows as
+(Code, Year, Period, Value, Detail). All checks whose input table exists are
+combined into one UNION ALL query, so the whole stage is a single vectorized
+DuckDB pass. Results replace the `dq_issues` table and are summarised in the log,
+one line per check.
+
+Checks:
+- permits_null_month / permits_incomplete_year   (BPS months missing)
+- wages_null_quarter / wages_incomplete_year     (QCEW quarters missing, e.g. no agglvl 40)
+- zero_base_permits / tiny_base_permits          (unstable cumulative indices)
+- nonfinite_zoning_pressure / nonfinite_structural_gap   (inf / NaN ratios)
+- low_bps_coverage                               (BPS monthly coverage percent, TXT era)
+- duplicate_keys_<table>                         (upsert key violated)
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import pandas as pd
+
+from bls_housing.census_cache import CSV_DIR
+from bls_housing.pipeline.duck import mark_built, managed_connection
+from bls_housing.tiered_cache import readable_files
+
+logger = logging.getLogger(__name__)
+
+TINY_BASE_PERMITS = 50
+MIN_COVERAGE_PCT = 50.0
+COVERAGE_COL = "Monthly Coverage Percent*"
+
+# table -> upsert key, mirrors update_db
+TABLE_KEYS: dict[str, list[str]] = {
+    "annual_metrics": ["Code", "Year"],
+    "cumulative_metrics": ["Code", "Year"],
+    "wages_metrics": ["Code", "Year", "Quarter"],
+    "permits_metrics": ["Code", "Year", "Quarter", "Month"],
+    "cumulative_metrics_by_base": ["Base_Year", "Code", "Year"],
+}
+
+
+@dataclass(frozen=True)
+class Check:
+    name: str
+    severity: str   # "error" | "warn" | "info"
+    table: str      # input table; the check is skipped when it does not exist
+    sql: str        # SELECT Code, Year, Period, Value, Detail
+
+
+def default_checks(
+    tiny_base_permits: int = TINY_BASE_PERMITS,
+) -> list[Check]:
+    checks = [
+        Check("permits_null_month", "warn", "permits_metrics", """
+            SELECT Code, Year, Month AS Period, NULL AS Value, 'no BPS row for metro' AS Detail
+            FROM permits_metrics WHERE Total_Permits IS NULL"""),
+        Check("permits_incomplete_year", "warn", "permits_metrics", """
+            SELECT Code, Year, NULL AS Period, count(Total_Permits) AS Value,
+                   'months with permits < 12' AS Detail
+            FROM permits_metrics GROUP BY Code, Year HAVING count(Total_Permits) < 12"""),
+        Check("wages_null_quarter", "warn", "wages_metrics", """
+            SELECT Code, Year, Quarter AS Period, NULL AS Value, 'no agglvl 40 total' AS Detail
+            FROM wages_metrics WHERE Total_Wages IS NULL"""),
+        Check("wages_incomplete_year", "warn", "wages_metrics", """
+            SELECT Code, Year, NULL AS Period, count(Total_Wages) AS Value,
+                   'quarters with wages < 4' AS Detail
+            FROM wages_metrics GROUP BY Code, Year HAVING count(Total_Wages) < 4"""),
+        Check("zero_base_permits", "error", "cumulative_metrics", """
+            SELECT Code, min(Year) AS Year, NULL AS Period, any_value(Base_Permits) AS Value,
+                   'base-year permits are 0 or missing' AS Detail
+            FROM cumulative_metrics GROUP BY Code
+            HAVING coalesce(any_value(Base_Permits), 0) = 0"""),
+        Check("tiny_base_permits", "warn", "cumulative_metrics", f"""
+            SELECT Code, min(Year) AS Year, NULL AS Period, any_value(Base_Permits) AS Value,
+                   'base-year permits < {tiny_base_permits}' AS Detail
+            FROM cumulative_metrics GROUP BY Code
+            HAVING any_value(Base_Permits) > 0 AND any_value(Base_Permits) < {tiny_base_permits}"""),
+        Check("nonfinite_zoning_pressure", "error", "annual_metrics", """
+            SELECT Code, Year, NULL AS Period, Zoning_Pressure AS Value,
+                   'Total_Permits=' || coalesce(Total_Permits::VARCHAR, 'NULL') AS Detail
+            FROM annual_metrics WHERE isinf(Zoning_Pressure) OR isnan(Zoning_Pressure)"""),
+        Check("nonfinite_structural_gap", "error", "cumulative_metrics", """
+            SELECT Code, Year, NULL AS Period, Structural_Gap AS Value,
+                   'Total_Permits=' || coalesce(Total_Permits::VARCHAR, 'NULL') AS Detail
+            FROM cumulative_metrics WHERE isinf(Structural_Gap) OR isnan(Structural_Gap)"""),
+    ]
+    for table, keys in TABLE_KEYS.items():
+        key_list = ", ".join(keys)
+        period = "Quarter" if "Quarter" in keys else "NULL"
+        checks.append(Check(f"duplicate_keys_{table}", "error", table, f"""
+            SELECT Code, Year, any_value({period}) AS Period, count(*) AS Value,
+                   'duplicate key ({key_list})' AS Detail
+            FROM {table} GROUP BY {key_list} HAVING count(*) > 1"""))
+    return checks
+
+
+def _coverage_check(con: duckdb.DuckDBPyConnection, csv_dir: Path, min_pct: float) -> Check | None:
+    """BPS coverage is only published in the TXT-era files; build the check if any
+    cached CSV carries the column."""
+    files = readable_files(csv_dir, "CBSA_*.csv")
+    if not files:
+        return None
+    file_list = ", ".join("'" + str(p).replace("'", "''") + "'" for p in files)
+    src = f"read_csv([{file_list}], union_by_name=true, filename=true, all_varchar=true)"
+    cols = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {src}").fetchall()]
+    if COVERAGE_COL not in cols:
+        return None
+    return Check("low_bps_coverage", "warn", "permits_metrics", f"""
+        SELECT TRY_CAST(c.CBSA AS BIGINT) AS Code,
+               TRY_CAST(regexp_extract(c.filename, 'CBSA_(\\d{{4}})_', 1) AS BIGINT) AS Year,
+               TRY_CAST(regexp_extract(c.filename, 'CBSA_\\d{{4}}_(\\d{{2}})', 1) AS BIGINT) AS Period,
+               TRY_CAST(c."{COVERAGE_COL}" AS DOUBLE) AS Value,
+               'BPS monthly coverage percent < {min_pct:g}' AS Detail
+        FROM {src} c
+        WHERE TRY_CAST(c."{COVERAGE_COL}" AS DOUBLE) < {min_pct}
+          AND TRY_CAST(c.CBSA AS BIGINT) IN (SELECT DISTINCT Code FROM permits_metrics)""")
+
+
+def _existing_tables(con: duckdb.DuckDBPyConnection) -> set[str]:
+    return {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+
+
+def run_checks(
+    con: duckdb.DuckDBPyConnection,
+    checks: list[Check] | None = None,
+    csv_dir: Path = CSV_DIR,
+    min_coverage_pct: float = MIN_COVERAGE_PCT,
+) -> pd.DataFrame:
+    """Run all checks in one pass, replace `dq_issues`, log and return the summary
+    (check_name, severity, issues)."""
+    t0 = perf_counter()
+    checks = list(checks if checks is not None else default_checks())
+    tables = _existing_tables(con)
+    if "permits_metrics" in tables:
+        coverage = _coverage_check(con, csv_dir, min_coverage_pct)
+        if coverage is not None:
+            checks.append(coverage)
+
+    active = [c for c in checks if c.table in tables]
+    for c in checks:
+        if c.table not in tables:
+            logger.info("DQ check %s skipped: table %s does not exist", c.name, c.table)
+
+    parts = [
+        f"""SELECT '{c.name}' AS check_name, '{c.severity}' AS severity, '{c.table}' AS table_name,
+               CAST(Code AS BIGINT) AS Code, CAST(Year AS BIGINT) AS Year,
+               CAST(Period AS BIGINT) AS Period, CAST(Value AS DOUBLE) AS Value,
+               CAST(Detail AS VARCHAR) AS Detail
+            FROM ({c.sql}) q"""
+        for c in active
+    ]
+    body = "\nUNION ALL\n".join(parts) if parts else """
+        SELECT NULL::VARCHAR AS check_name, NULL::VARCHAR AS severity, NULL::VARCHAR AS table_name,
+               NULL::BIGINT AS Code, NULL::BIGINT AS Year, NULL::BIGINT AS Period,
+               NULL::DOUBLE AS Value, NULL::VARCHAR AS Detail
+        WHERE false"""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE dq_issues AS
+        SELECT now()::TIMESTAMP AS run_at, *
+        FROM ({body})
+        ORDER BY severity, check_name, Code, Year, Period
+        """)
+    mark_built(con, ["dq_issues"])
+
+    summary = con.execute("""
+        SELECT check_name, severity, count(*) AS issues, count(DISTINCT Code) AS metros
+        FROM dq_issues GROUP BY ALL ORDER BY severity, check_name
+        """).df()
+    for r in summary.itertuples(index=False):
+        log = logger.error if r.severity == "error" else logger.warning
+        log("DQ %s [%s]: %d issues across %d metros", r.check_name, r.severity, r.issues, r.metros)
+    logger.info("DQ ran %d checks in %.3fs: %d issues",
+                len(active), perf_counter() - t0, int(summary["issues"].sum()) if len(summary) else 0)
+    return summary
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Run data-quality checks and write dq_issues")
+    ap.add_argument("--fail-on-error", action="store_true",
+                    help="exit with status 1 if any error-severity issue is found")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[check-data] starting...")
+    with managed_connection(profile="build") as con:
+        summary = run_checks(con)
+    errors = int(summary.loc[summary["severity"] == "error", "issues"].sum())
+    print(f"[check-data] checks with issues: {len(summary)}, error issues: {errors}")
+    print(f"[check-data] done in {perf_counter() - t0:.2f}s")
+    return 1 if args.fail_on_error and errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
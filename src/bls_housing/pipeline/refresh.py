@@ -0,0 +1,199 @@
+# bls_housing/pipeline/refresh.py
+"""Release-calendar-aware refresh of the raw cache.
+
+`force_download=True` refetches the whole history, but only the latest releases of
+either source can still change:
+
+- QCEW: a quarter is first published about five months after it ends. It is revised
+  with each later release of the same year and is final once the first quarter of
+  the next year is published. So only the quarters of the current and previous
+  year that are not final yet can change.
+- BPS: each monthly file revises the previous month (and the year-to-date columns,
+  which the pipeline does not read). Only the latest published month and the month
+  before it can change. Because of this, the closed `tb3u` (TXT, to Oct 2019) and
+  `msamonthly` (XLS, Nov 2019-2023) eras never come up in a plan made today. Only
+  `cbsamonthly` files do.
+
+`plan_refresh(as_of)` lists the cached files inside those windows. `apply_plan`
+refetches just those files, and then `refresh_revised` rebuilds the (Code, Year)
+rows whose files really changed content (see lineage.py):
+
+    poetry run refresh-sources --as-of 2025-06-20 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+
+from bls_housing.census_cache import (
+    RAW_TXT_DIR,
+    XLS_DIR,
+    _is_txt_era,
+    fetch_cbsa_xls,
+    fetch_census_txt,
+    get_raw_path,
+)
+from bls_housing.pipeline.duck import managed_connection
+from bls_housing.pipeline.lineage import RefreshResult, refresh_revised
+from bls_housing.qcew_cache import CACHE_DIR as QCEW_CACHE_DIR
+from bls_housing.qcew_cache import fetch_area_csv
+from bls_housing.tiered_cache import cached_files, resolve_cached
+
+logger = logging.getLogger(__name__)
+
+# days from the end of a quarter to its QCEW release (Q1 ends Mar 31, out early Sept)
+QCEW_RELEASE_LAG_DAYS = 160
+# BPS monthly files come out around the 12th working day of the following month
+BPS_RELEASE_DAY = 18
+# latest published month plus the month it revises
+BPS_REVISABLE_MONTHS = 2
+
+
+@dataclass(frozen=True)
+class RefreshEntry:
+    source: str      # qcew | bps
+    era: str         # qcew | tb3u | msamonthly | cbsamonthly
+    year: int
+    period: int      # quarter (qcew) or month (bps)
+    path: Path
+    area: str | None = None
+
+
+@dataclass
+class RefreshPlan:
+    as_of: date
+    entries: list[RefreshEntry] = field(default_factory=list)
+    cached_files: int = 0
+
+    @property
+    def share(self) -> float:
+        return len(self.entries) / self.cached_files if self.cached_files else 0.0
+
+
+def bps_era(year: int, mon: int) -> str:
+    if _is_txt_era(str(year), str(mon)):
+        return "tb3u"
+    return "msamonthly" if year < 2024 else "cbsamonthly"
+
+
+def _quarter_end(year: int, qtr: int) -> date:
+    if qtr == 4:
+        return date(year, 12, 31)
+    return date(year, 3 * qtr + 1, 1) - timedelta(days=1)
+
+
+def qcew_release_date(year: int, qtr: int) -> date:
+    return _quarter_end(year, qtr) + timedelta(days=QCEW_RELEASE_LAG_DAYS)
+
+
+def qcew_revisable(as_of: date) -> list[tuple[int, int]]:
+    """(year, quarter) already published and not yet final on `as_of`."""
+    out = []
+    for year in (as_of.year - 2, as_of.year - 1, as_of.year):
+        final = qcew_release_date(year + 1, 1)
+        out += [(year, q) for q in (1, 2, 3, 4) if qcew_release_date(year, q) <= as_of < final]
+    return out
+
+
+def bps_latest_month(as_of: date) -> tuple[int, int]:
+    """(year, month) of the newest BPS monthly file published on `as_of`."""
+    back = 1 if as_of.day >= BPS_RELEASE_DAY else 2
+    idx = as_of.year * 12 + as_of.month - 1 - back
+    return idx // 12, idx % 12 + 1
+
+
+def bps_revisable(as_of: date, months: int = BPS_REVISABLE_MONTHS) -> list[tuple[int, int]]:
+    year, mon = bps_latest_month(as_of)
+    idx = year * 12 + mon - 1
+    return [((idx - k) // 12, (idx - k) % 12 + 1) for k in range(months)]
+
+
+def _qcew_cached(qcew_dir: Path) -> dict[tuple[int, int], list[tuple[str, Path]]]:
+    """(year, quarter) -> [(area, path)] of the cached QCEW area files, evicted ones included."""
+    out: dict[tuple[int, int], list[tuple[str, Path]]] = {}
+    for path in cached_files(qcew_dir, "*_*_*.csv"):
+        area, year, qtr = path.stem.rsplit("_", 2)
+        if year.isdigit() and qtr.isdigit():
+            out.setdefault((int(year), int(qtr)), []).append((area, path))
+    return out
+
+
+def plan_refresh(as_of: date | None = None, qcew_dir: Path = QCEW_CACHE_DIR) -> RefreshPlan:
+    """Cached raw files that can have been revised as of `as_of` (default: today)."""
+    plan = RefreshPlan(as_of=as_of or date.today())
+
+    qcew = _qcew_cached(qcew_dir)
+    plan.cached_files += sum(len(v) for v in qcew.values())
+    for year, qtr in qcew_revisable(plan.as_of):
+        for area, path in sorted(qcew.get((year, qtr), [])):
+            plan.entries.append(RefreshEntry("qcew", "qcew", year, qtr, path, area))
+
+    plan.cached_files += len(cached_files(RAW_TXT_DIR, "tb3u*.txt")) + len(cached_files(XLS_DIR, "*.xls"))
+    for year, mon in bps_revisable(plan.as_of):
+        path = get_raw_path(str(year), str(mon))
+        if resolve_cached(path) is not None:
+            plan.entries.append(RefreshEntry("bps", bps_era(year, mon), year, mon, path))
+    return plan
+
+
+def _refetch(entry: RefreshEntry) -> None:
+    if entry.source == "qcew":
+        assert entry.area is not None, "QCEW refresh entries carry their area"
+        fetch_area_csv(entry.area, str(entry.year), str(entry.period),
+                       cache_dir=entry.path.parent, force_download=True)
+    elif entry.era == "tb3u":
+        fetch_census_txt(str(entry.year), str(entry.period), cache_dir=entry.path.parent, force_download=True)
+    else:
+        fetch_cbsa_xls(str(entry.year), str(entry.period), cache_dir=entry.path.parent, force_download=True)
+
+
+def apply_plan(con: duckdb.DuckDBPyConnection, plan: RefreshPlan) -> tuple[int, RefreshResult]:
+    """Refetch the planned files, then rebuild whatever their new content feeds.
+    Returns (files refetched, lineage refresh result)."""
+    fetched = 0
+    for entry in plan.entries:
+        try:
+            _refetch(entry)
+            fetched += 1
+        except RuntimeError as e:
+            # the cached copy stays in place; the next run tries again
+            logger.warning("Refetch of %s failed: %s", entry.path.name, e)
+    return fetched, refresh_revised(con)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Refetch only the cached files still inside a revision window")
+    ap.add_argument("--as-of", type=date.fromisoformat, default=None, help="reference date (default: today)")
+    ap.add_argument("--dry-run", action="store_true", help="print the plan without fetching")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    plan = plan_refresh(args.as_of)
+    print(f"[refresh-sources] as of {plan.as_of}: {len(plan.entries)} of {plan.cached_files} "
+          f"cached files can have changed ({100 * plan.share:.1f}%)")
+    for e in plan.entries:
+        label = f"{e.year} Q{e.period}" if e.source == "qcew" else f"{e.year}-{e.period:02d}"
+        print(f"[refresh-sources]   {e.era:<11} {label:<8} {e.path.name}")
+    if args.dry_run:
+        return 0
+
+    with managed_connection(profile="build") as con:
+        fetched, res = apply_plan(con, plan)
+    print(f"[refresh-sources] refetched {fetched} files, {len(res.changed_files)} changed content, "
+          f"wage keys: {len(res.wages_keys)}, permit keys: {len(res.permits_keys)}")
+    print(f"[refresh-sources] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
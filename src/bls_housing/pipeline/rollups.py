@@ -0,0 +1,293 @@
+# bls_housing/pipeline/rollups.py
+"""CBSA, CSA and national rollups of `annual_metrics` and `cumulative_metrics`.
+
+The BPS files carry the CSA code next to each CBSA. `dim_cbsa_csa` keeps the latest
+mapping found in the cached CSVs (999 / blank = not part of a CSA), with the CSA title
+from the OMB delineations in `dim_county_cbsa` when `build-county-permits` has loaded
+them (NULL otherwise). Each rollup table is filled by one GROUPING SETS aggregation
+over the CBSA rows:
+
+- annual_metrics_rollup      (Level, Geo_Code, Geo_Name, Year, Metros, summed levels,
+                              Change_*, Wage_Index, Permit_Index, Zoning_Pressure)
+- cumulative_metrics_rollup  (Level, Geo_Code, Geo_Name, Year, Metros, summed levels and
+                              bases, Cumul_*_Index, Structural_Gap)
+
+Level is `cbsa`, `csa` or `national` (Geo_Code 'US'). National is the total of the
+metros in the marts, not the QCEW US total, which includes non-metro counties.
+Growth rates and indexes are recomputed from summed levels, never summed themselves,
+and only over matched metros: Change_* of year Y compares the Y and Y-1 levels of the
+metros present with a value in both years, so a metro entering or leaving the marts
+is not counted as growth. Cumulative indexes likewise sum only rows with both a value
+and a base.
+
+`update_db` calls `refresh_rollups` with the years it upserted. Only those years,
+plus the year after each (its Change_* depends on the year before), are recomputed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable
+
+import duckdb
+
+from bls_housing.census_cache import CSV_DIR
+from bls_housing.pipeline.duck import fetch_scalar, managed_connection, mark_built
+from bls_housing.tiered_cache import readable_files
+
+logger = logging.getLogger(__name__)
+
+CSA_DIM = "dim_cbsa_csa"
+ANNUAL_ROLLUP = "annual_metrics_rollup"
+CUMULATIVE_ROLLUP = "cumulative_metrics_rollup"
+NO_CSA = 999
+
+# shared select list: level, geography and member count of each grouping set
+_GROUP_COLUMNS = """
+          CASE WHEN GROUPING(b.Code) = 0 THEN 'cbsa'
+               WHEN GROUPING(b.CSA_Code) = 0 THEN 'csa'
+               ELSE 'national' END AS Level,
+          CASE WHEN GROUPING(b.Code) = 0 THEN CAST(b.Code AS VARCHAR)
+               WHEN GROUPING(b.CSA_Code) = 0 THEN CAST(b.CSA_Code AS VARCHAR)
+               ELSE 'US' END AS Geo_Code,
+          CASE WHEN GROUPING(b.Code) = 0 THEN any_value(b.Area)
+               WHEN GROUPING(b.CSA_Code) = 0 THEN any_value(b.CSA_Title)
+               ELSE 'All metros' END AS Geo_Name,
+          b.Year,
+          count(*) AS Metros"""
+
+_GROUPING = """
+        GROUP BY GROUPING SETS ((b.Code, b.Year), (b.CSA_Code, b.Year), (b.Year))
+        HAVING GROUPING(b.CSA_Code) = 1 OR b.CSA_Code IS NOT NULL"""
+
+
+# cumulative indexes over the rows that have both a value and a base
+_MATCHED_WAGE_INDEX = """sum(b.Real_Total_Wages) FILTER (WHERE b.Base_Wage IS NOT NULL)
+            / sum(b.Base_Wage) FILTER (WHERE b.Real_Total_Wages IS NOT NULL)"""
+_MATCHED_PERMIT_INDEX = """sum(b.Total_Permits) FILTER (WHERE b.Base_Permits IS NOT NULL)
+            / sum(b.Base_Permits) FILTER (WHERE b.Total_Permits IS NOT NULL)"""
+
+
+def ensure_rollup_tables(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CSA_DIM} (
+          Code BIGINT,
+          CSA_Code BIGINT,
+          CSA_Title VARCHAR
+        );
+        ALTER TABLE {CSA_DIM} ADD COLUMN IF NOT EXISTS CSA_Title VARCHAR;
+        CREATE TABLE IF NOT EXISTS {ANNUAL_ROLLUP} (
+          Level VARCHAR,            -- cbsa | csa | national
+          Geo_Code VARCHAR,
+          Geo_Name VARCHAR,
+          Year BIGINT,
+          Metros BIGINT,
+          Total_Wages DOUBLE,
+          Real_Total_Wages DOUBLE,
+          Total_Permits DOUBLE,
+          Change_Real_Wage DOUBLE,
+          Change_Permit DOUBLE,
+          Wage_Index DOUBLE,
+          Permit_Index DOUBLE,
+          Zoning_Pressure DOUBLE
+        );
+        CREATE TABLE IF NOT EXISTS {CUMULATIVE_ROLLUP} (
+          Level VARCHAR,
+          Geo_Code VARCHAR,
+          Geo_Name VARCHAR,
+          Year BIGINT,
+          Metros BIGINT,
+          Real_Total_Wages DOUBLE,
+          Total_Permits DOUBLE,
+          Base_Wage DOUBLE,
+          Base_Permits DOUBLE,
+          Cumul_Wage_Index DOUBLE,
+          Cumul_Permit_Index DOUBLE,
+          Structural_Gap DOUBLE
+        );
+        """)
+
+
+def _csa_titles_sql(con: duckdb.DuckDBPyConnection) -> str:
+    """CSA_Code -> CSA_Title of the newest delineation vintage, or no rows."""
+    if _has_table(con, "dim_county_cbsa"):
+        return """
+            SELECT CSA_Code, arg_max(CSA_Title, Vintage) AS CSA_Title
+            FROM dim_county_cbsa WHERE CSA_Code IS NOT NULL GROUP BY CSA_Code"""
+    return "SELECT NULL::BIGINT AS CSA_Code, NULL::VARCHAR AS CSA_Title WHERE false"
+
+
+def load_csa_map(con: duckdb.DuckDBPyConnection, csv_dir: Path = CSV_DIR) -> int:
+    """Replace `dim_cbsa_csa` with the CBSA -> CSA codes of the newest cached BPS
+    file listing each CBSA, titled from `dim_county_cbsa` when it exists. Returns the
+    number of CBSAs mapped."""
+    ensure_rollup_tables(con)
+    files = readable_files(csv_dir, "CBSA_*.csv")
+    if not files:
+        logger.info("No cached BPS CSVs under %s; CSA mapping left as is", csv_dir)
+        return 0
+    file_list = ", ".join("'" + str(p).replace("'", "''") + "'" for p in files)
+    # file names sort by period: CBSA_2024_01.csv < CBSA_2024_02.csv. Compare names
+    # only, since evicted files are read from the cold tier under another root.
+    con.execute(f"""
+        BEGIN TRANSACTION;
+        DELETE FROM {CSA_DIM};
+        INSERT INTO {CSA_DIM} (Code, CSA_Code, CSA_Title)
+        SELECT m.Code, m.CSA_Code, t.CSA_Title
+        FROM (
+          SELECT Code, nullif(arg_max(CSA_Code, parse_filename(filename)), {NO_CSA}) AS CSA_Code
+          FROM (
+            SELECT TRY_CAST(CBSA AS BIGINT) AS Code, TRY_CAST(CSA AS BIGINT) AS CSA_Code, filename
+            FROM read_csv([{file_list}], union_by_name=true, all_varchar=true, filename=true)
+          )
+          WHERE Code IS NOT NULL
+          GROUP BY Code
+        ) m
+        LEFT JOIN ({_csa_titles_sql(con)}) t USING (CSA_Code);
+        COMMIT;
+        """)
+    mark_built(con, [CSA_DIM])
+    return int(fetch_scalar(con, f"SELECT count(*) FROM {CSA_DIM} WHERE CSA_Code IS NOT NULL"))
+
+
+def _has_table(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return fetch_scalar(con, "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [table]) > 0
+
+
+def _year_filter(years: list[int] | None, column: str = "b.Year") -> tuple[str, list]:
+    if years is None:
+        return "", []
+    return f"WHERE {column} IN (SELECT UNNEST(?))", [years]
+
+
+def _replace_years(con: duckdb.DuckDBPyConnection, table: str, select_sql: str,
+                   args: list, years: list[int] | None) -> int:
+    """Swap the rollup rows of `years` (all rows for None) in one transaction."""
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if years is None:
+            con.execute(f"DELETE FROM {table}")
+        else:
+            con.execute(f"DELETE FROM {table} WHERE Year IN (SELECT UNNEST(?))", [years])
+        n = fetch_scalar(con, f"INSERT INTO {table} {select_sql}", args)
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return int(n)
+
+
+def _rollup_annual(con: duckdb.DuckDBPyConnection, years: list[int] | None) -> int:
+    # a year's Change_* needs the year before it in the same pass
+    calc = None if years is None else sorted(set(years) | {y - 1 for y in years})
+    where, args = _year_filter(calc, "Year")
+    keep, keep_args = _year_filter(years)
+    select_sql = f"""
+        WITH metro AS (
+          SELECT a.*, m.CSA_Code, m.CSA_Title,
+            CASE WHEN lag(Year) OVER w = Year - 1 THEN lag(Real_Total_Wages) OVER w END AS Prev_Real_Wages,
+            CASE WHEN lag(Year) OVER w = Year - 1 THEN lag(Total_Permits) OVER w END AS Prev_Permits
+          FROM annual_metrics a LEFT JOIN {CSA_DIM} m USING (Code)
+          {where}
+          WINDOW w AS (PARTITION BY Code ORDER BY Year)
+        ),
+        grouped AS (
+          SELECT {_GROUP_COLUMNS},
+            sum(b.Total_Wages) AS Total_Wages,
+            sum(b.Real_Total_Wages) AS Real_Total_Wages,
+            sum(b.Total_Permits) AS Total_Permits,
+            -- growth over the metros with a value in both years only
+            (sum(b.Real_Total_Wages) FILTER (WHERE b.Prev_Real_Wages IS NOT NULL)
+              / sum(b.Prev_Real_Wages) FILTER (WHERE b.Real_Total_Wages IS NOT NULL) - 1) * 100
+              AS Change_Real_Wage,
+            (sum(b.Total_Permits) FILTER (WHERE b.Prev_Permits IS NOT NULL)
+              / sum(b.Prev_Permits) FILTER (WHERE b.Total_Permits IS NOT NULL) - 1) * 100
+              AS Change_Permit
+          FROM metro b
+          {keep}
+          {_GROUPING}
+        )
+        SELECT Level, Geo_Code, Geo_Name, Year, Metros, Total_Wages, Real_Total_Wages,
+               Total_Permits, Change_Real_Wage, Change_Permit,
+               1 + Change_Real_Wage / 100 AS Wage_Index,
+               1 + Change_Permit / 100 AS Permit_Index,
+               (1 + Change_Real_Wage / 100) / (1 + Change_Permit / 100) AS Zoning_Pressure
+        FROM grouped
+        ORDER BY Level, Geo_Code, Year
+        """
+    return _replace_years(con, ANNUAL_ROLLUP, select_sql, args + keep_args, years)
+
+
+def _rollup_cumulative(con: duckdb.DuckDBPyConnection, years: list[int] | None) -> int:
+    where, args = _year_filter(years)
+    select_sql = f"""
+        SELECT {_GROUP_COLUMNS},
+          sum(b.Real_Total_Wages) AS Real_Total_Wages,
+          sum(b.Total_Permits) AS Total_Permits,
+          sum(b.Base_Wage) AS Base_Wage,
+          sum(b.Base_Permits) AS Base_Permits,
+          {_MATCHED_WAGE_INDEX} AS Cumul_Wage_Index,
+          {_MATCHED_PERMIT_INDEX} AS Cumul_Permit_Index,
+          ({_MATCHED_WAGE_INDEX}) / ({_MATCHED_PERMIT_INDEX}) AS Structural_Gap
+        FROM (SELECT c.*, m.CSA_Code, m.CSA_Title FROM cumulative_metrics c LEFT JOIN {CSA_DIM} m USING (Code)) b
+        {where}
+        {_GROUPING}
+        ORDER BY Level, Geo_Code, Year
+        """
+    return _replace_years(con, CUMULATIVE_ROLLUP, select_sql, args, years)
+
+
+def refresh_rollups(
+    con: duckdb.DuckDBPyConnection,
+    annual_years: Iterable[int] | None = None,
+    cumulative_years: Iterable[int] | None = None,
+) -> dict[str, int]:
+    """Recompute the rollup rows of the given years (None = every year, [] = skip).
+    Rollup tables that were never built are left alone. Returns rows written per table."""
+    written: dict[str, int] = {}
+    if not (_has_table(con, CSA_DIM) and _has_table(con, ANNUAL_ROLLUP)):
+        return written
+    annual = None if annual_years is None else sorted({int(y) for y in annual_years})
+    cumulative = None if cumulative_years is None else sorted({int(y) for y in cumulative_years})
+    if annual is None or annual:
+        # the year after each upserted year gets a new Change_*
+        years = None if annual is None else sorted(set(annual) | {y + 1 for y in annual})
+        written[ANNUAL_ROLLUP] = _rollup_annual(con, years)
+    if cumulative is None or cumulative:
+        written[CUMULATIVE_ROLLUP] = _rollup_cumulative(con, cumulative)
+    if written:
+        mark_built(con, list(written))
+    return written
+
+
+def build_rollups(con: duckdb.DuckDBPyConnection, csv_dir: Path = CSV_DIR) -> dict[str, int]:
+    """Reload the CSA mapping and rebuild both rollup tables from scratch."""
+    ensure_rollup_tables(con)
+    mapped = load_csa_map(con, csv_dir)
+    logger.info("CSA mapping: %d CBSAs in a CSA", mapped)
+    return refresh_rollups(con)
+
+
+def main() -> int:
+    argparse.ArgumentParser(description="Build CBSA / CSA / national rollups of the metrics tables").parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-rollups] starting...")
+    with managed_connection(profile="build") as con:
+        written = build_rollups(con)
+        levels = con.execute(f"SELECT Level, count(DISTINCT Geo_Code) FROM {ANNUAL_ROLLUP} GROUP BY 1 ORDER BY 1").fetchall()
+    for table, n in written.items():
+        print(f"[build-rollups] {table}: {n} rows")
+    print(f"[build-rollups] geographies: {', '.join(f'{lvl}={n}' for lvl, n in levels)}")
+    print(f"[build-rollups] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
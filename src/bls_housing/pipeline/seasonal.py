@@ -0,0 +1,234 @@
+# bls_housing/pipeline/seasonal.py
+"""Seasonal adjustment and trend of monthly permits, for every metro at once.
+
+Monthly BPS counts are strongly seasonal, and small metros flip between zero and
+non-zero months. A zero year turns into Permit_Index 0 and an infinite Zoning_Pressure
+(see data/TODO). `permits_metrics` is pivoted into one metros x months matrix, and a
+classical multiplicative decomposition runs on the whole matrix with NumPy:
+
+- trend: centered 2x12 moving average. Windows cut off at the series ends or by
+  missing months are renormalised by the weight actually present.
+- seasonal: per metro, the mean ratio of permits to trend for each calendar month,
+  taken over complete windows with a non-zero trend and scaled to average 1.
+- adjusted = permits / seasonal. The trend is then re-estimated from the adjusted
+  series, so the partial windows at the ends are not biased by the season.
+
+Counts are non-negative, so adjusted and trend permits are too, and a zero month stays
+zero after adjustment. A zero year therefore stays zero in the adjusted series. The trend
+borrows from the neighbouring years, which is why it is the default series for the
+marts. Annual totals under `MIN_ANNUAL_PERMITS`, and raw or adjusted years missing a
+month, become NaN instead of a 0 or near-0 denominator.
+
+The result is stored as `permits_seasonal`. `seasonal_annual_permits(con, "trend")`
+returns annual permits shaped like `build_annual_permits` output, and
+`build-shards --permit-series trend` builds the marts from them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass
+from time import perf_counter
+
+import duckdb
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bls_housing.helper import pct_change_unfilled
+from bls_housing.pipeline.duck import managed_connection, mark_built
+
+logger = logging.getLogger(__name__)
+
+SEASONAL_TABLE = "permits_seasonal"
+WINDOW = 12
+SERIES = {"raw": "Total_Permits", "adjusted": "Adjusted_Permits", "trend": "Trend_Permits"}
+DEFAULT_SERIES = "trend"
+# smaller annual totals make Permit_Index and Zoning_Pressure meaningless
+MIN_ANNUAL_PERMITS = 1.0
+
+
+@dataclass(frozen=True)
+class MonthlyMatrix:
+    codes: np.ndarray        # (metros,)
+    periods: np.ndarray      # (months,) months since year 0: Year * 12 + Month - 1
+    values: np.ndarray       # (metros, months) float, NaN where no row exists
+
+    @property
+    def month_of_year(self) -> np.ndarray:
+        return self.periods % 12
+
+
+def monthly_matrix(permits: pd.DataFrame, value: str = "Total_Permits") -> MonthlyMatrix:
+    """Pivot long (Code, Year, Month, value) rows onto a contiguous month axis."""
+    codes, row = np.unique(permits["Code"].to_numpy(dtype="int64"), return_inverse=True)
+    period = permits["Year"].to_numpy(dtype="int64") * 12 + permits["Month"].to_numpy(dtype="int64") - 1
+    start = int(period.min()) if len(period) else 0
+    periods = np.arange(start, int(period.max()) + 1 if len(period) else 0)
+    values = np.full((len(codes), len(periods)), np.nan)
+    values[row, period - start] = permits[value].to_numpy(dtype="float64", na_value=np.nan)
+    return MonthlyMatrix(codes, periods, values)
+
+
+def check_window(window: int) -> int:
+    """Seasonal factors are per calendar month: only a whole number of years of
+    moving average removes the season from the trend."""
+    if window <= 0 or window % 12:
+        raise ValueError(f"window must be a positive multiple of 12 months, got {window}")
+    return window
+
+
+def _weights(window: int) -> np.ndarray:
+    if window % 2:
+        return np.full(window, 1.0 / window)
+    w = np.ones(window + 1)
+    w[[0, -1]] = 0.5
+    return w / window
+
+
+def centered_ma(values: np.ndarray, window: int = WINDOW) -> tuple[np.ndarray, np.ndarray]:
+    """Centered moving average along axis 1 of a (metros, months) matrix.
+    Returns (average, share of the window's weight that was present)."""
+    w = _weights(window)
+    pad = len(w) // 2
+    present = ~np.isnan(values)
+    padded = np.pad(np.where(present, values, 0.0), ((0, 0), (pad, pad)))
+    mask = np.pad(present.astype("float64"), ((0, 0), (pad, pad)))
+    num = sliding_window_view(padded, len(w), axis=1) @ w
+    den = sliding_window_view(mask, len(w), axis=1) @ w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg = np.where(den > 0, num / den, np.nan)
+    return avg, den
+
+
+def decompose(values: np.ndarray, month_of_year: np.ndarray,
+              window: int = WINDOW) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Multiplicative decomposition of every row. Returns (trend, seasonal, adjusted)."""
+    check_window(window)
+    trend, coverage = centered_ma(values, window)
+    complete = coverage > 1 - 1e-9
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(complete & ~np.isnan(values) & (trend > 0), values / trend, np.nan)
+
+    onehot = (month_of_year[:, None] == np.arange(12)).astype("float64")    # (months, 12)
+    sums = np.nan_to_num(ratio) @ onehot
+    counts = (~np.isnan(ratio)).astype("float64") @ onehot
+    estimated = counts > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factors = np.where(estimated, sums / counts, np.nan)
+        n_est = estimated.sum(axis=1, keepdims=True)
+        level = np.where(n_est > 0, np.where(estimated, factors, 0.0).sum(axis=1, keepdims=True) / n_est, 0.0)
+        # months never estimated get the average factor; rows with no season keep 1
+        factors = np.where(level > 0, np.where(estimated, factors, level) / level, 1.0)
+
+    seasonal = factors[:, month_of_year]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        adjusted = np.where(seasonal > 0, values / seasonal, values)
+    trend, _ = centered_ma(adjusted, window)
+    return trend, np.where(np.isnan(values), np.nan, seasonal), adjusted
+
+
+def build_seasonal(permits: pd.DataFrame, window: int = WINDOW) -> pd.DataFrame:
+    """Seasonal factor (multiplicative, averages 1 over the year), adjusted and trend
+    permits for each monthly permits row."""
+    check_window(window)
+    cols = ["Area", "Code", "Year", "Quarter", "Month", "Total_Permits",
+            "Seasonal", "Adjusted_Permits", "Trend_Permits"]
+    if permits.empty:
+        return pd.DataFrame(columns=cols)
+    m = monthly_matrix(permits)
+    trend, seasonal, adjusted = decompose(m.values, m.month_of_year, window)
+
+    out = permits[["Area", "Code", "Year", "Quarter", "Month", "Total_Permits"]].copy()
+    row = np.searchsorted(m.codes, out["Code"].to_numpy(dtype="int64"))
+    col = out["Year"].to_numpy(dtype="int64") * 12 + out["Month"].to_numpy(dtype="int64") - 1 - m.periods[0]
+    out["Seasonal"] = seasonal[row, col]
+    out["Adjusted_Permits"] = adjusted[row, col]
+    out["Trend_Permits"] = trend[row, col]
+    return out.sort_values(["Code", "Year", "Month"]).reset_index(drop=True)[cols]
+
+
+def update_seasonal(con: duckdb.DuckDBPyConnection, window: int = WINDOW) -> int:
+    """Rebuild `permits_seasonal` from `permits_metrics`; returns the row count."""
+    permits = con.execute("""
+        SELECT Area, Code, Year, Quarter, Month, Total_Permits
+        FROM permits_metrics
+        """).df()
+    seasonal_df = build_seasonal(permits, window)
+    con.execute(f"CREATE OR REPLACE TABLE {SEASONAL_TABLE} AS SELECT * FROM seasonal_df")
+    mark_built(con, [SEASONAL_TABLE])
+    return len(seasonal_df)
+
+
+def annual_series(seasonal_df: pd.DataFrame, series: str = DEFAULT_SERIES) -> pd.DataFrame:
+    """Annual permits of one series from `build_seasonal` rows, in the
+    `build_annual_permits` layout (Area, Code, Year, Total_Permits, Change_Permit).
+
+    Raw and adjusted years missing a month are NaN, as in build_annual_permits. The
+    trend covers missing months from their neighbours. Years under MIN_ANNUAL_PERMITS
+    are NaN rather than a near-zero denominator.
+    """
+    if series not in SERIES:
+        raise ValueError(f"Unknown permit series {series!r}; expected one of {sorted(SERIES)}")
+    col = SERIES[series]
+    grouped = seasonal_df.groupby(["Code", "Year"])
+    annual = grouped.agg(Area=("Area", "first"), Total_Permits=(col, "sum"),
+                         Observed=(col, "count"), Months=(col, "size")).reset_index()
+    low = annual["Total_Permits"] < MIN_ANNUAL_PERMITS
+    if low.any():
+        logger.info("%d metro-years with under %g %s permits set to NaN", int(low.sum()), MIN_ANNUAL_PERMITS, series)
+    partial = (annual["Observed"] < 12) | (annual["Months"] < 12)
+    annual["Total_Permits"] = annual["Total_Permits"].where(~(low | partial))
+    annual = annual.sort_values(["Area", "Code", "Year"]).reset_index(drop=True)
+    annual["Change_Permit"] = pct_change_unfilled(annual, "Total_Permits") * 100
+    return annual[["Area", "Code", "Year", "Total_Permits", "Change_Permit"]]
+
+
+def seasonal_annual_permits(
+    con: duckdb.DuckDBPyConnection,
+    series: str = DEFAULT_SERIES,
+    codes: list[int] | None = None,
+) -> pd.DataFrame:
+    """Annual permits from `permits_seasonal` in the `build_annual_permits` layout,
+    for build_annual_metrics / build_cumulative_metrics."""
+    if series not in SERIES:
+        raise ValueError(f"Unknown permit series {series!r}; expected one of {sorted(SERIES)}")
+    where, args = "", []
+    if codes:
+        where, args = "WHERE Code IN (SELECT UNNEST(?))", [[int(c) for c in codes]]
+    seasonal_df = con.execute(f"SELECT Area, Code, Year, Month, {SERIES[series]} FROM {SEASONAL_TABLE} {where}",
+                              args).df()
+    return annual_series(seasonal_df, series)
+
+
+def annual_permits_for_series(permits: pd.DataFrame, series: str = DEFAULT_SERIES,
+                              window: int = WINDOW) -> pd.DataFrame:
+    """Annual permits of `series` straight from monthly permits rows, without going
+    through `permits_seasonal` (e.g. inside a shard build)."""
+    return annual_series(build_seasonal(permits, window), series)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Seasonally adjust monthly permits for every metro")
+    ap.add_argument("--window", type=int, default=WINDOW, help="moving average window in months (multiple of 12)")
+    args = ap.parse_args()
+    try:
+        check_window(args.window)
+    except ValueError as e:
+        ap.error(str(e))
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-seasonal] starting...")
+    with managed_connection(profile="build") as con:
+        rows = update_seasonal(con, args.window)
+    print(f"[build-seasonal] {SEASONAL_TABLE}: {rows} rows")
+    print(f"[build-seasonal] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,237 @@
+# bls_housing/pipeline/sectors.py
+"""Industry-sector QCEW facts, extracted once from the cached area files.
+
+`build_annual_wages` only keeps the agglvl 40 metro total. This module reads every
+cached QCEW area CSV (data/cache/bls/C1234_YYYY_Q.csv) in a single DuckDB scan and
+keeps all MSA aggregation levels (40 total, 41 ownership, 42 domain, 43 supersector,
+44 NAICS sector, 45-48 NAICS 3-6 digit) with typed wage, employment and
+establishment measures:
+
+    data/derived/sector_facts/Year=2020/Quarter=1/data_0.parquet
+
+Only quarters whose source files changed (name, size, mtime) are rewritten. The
+facts are exposed in DuckDB as the `qcew_sector_facts` view, so sector metrics are
+queries, e.g. `annual_sector_wages(con, industries=["1012"])` for construction.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+import shutil
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import pandas as pd
+
+from bls_housing.pipeline.duck import fetch_scalar, managed_connection
+from bls_housing.qcew_cache import CACHE_DIR
+from bls_housing.settings import derived_root
+from bls_housing.tiered_cache import cached_files, resolve_cached
+
+logger = logging.getLogger(__name__)
+
+SECTOR_DIR = derived_root() / "sector_facts"
+SOURCES_MANIFEST = "_sources.parquet"
+SECTOR_VIEW = "qcew_sector_facts"
+
+DEFAULT_AGGLVLS = (40, 41, 42, 43, 44, 45, 46, 47, 48)
+QCEW_FILE_RE = re.compile(r"C(\d{4})_(\d{4})_([1-4])\.csv$")
+
+# QCEW column -> DuckDB type; industry/ownership codes stay text ("31-33", "1012")
+QCEW_TYPES = {
+    "area_fips": "VARCHAR",
+    "own_code": "VARCHAR",
+    "industry_code": "VARCHAR",
+    "agglvl_code": "INTEGER",
+    "size_code": "INTEGER",
+    "year": "INTEGER",
+    "qtr": "INTEGER",
+    "disclosure_code": "VARCHAR",
+    "qtrly_estabs": "BIGINT",
+    "month1_emplvl": "BIGINT",
+    "month2_emplvl": "BIGINT",
+    "month3_emplvl": "BIGINT",
+    "total_qtrly_wages": "BIGINT",
+    "avg_wkly_wage": "BIGINT",
+}
+
+
+def _sql_str(value: str | Path) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def scan_sources(cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    """One row per cached area file: path, Code, Year, Quarter, size, mtime.
+    Files evicted to the cold tier are listed under their hot path, so eviction does
+    not look like a removed source."""
+    rows = []
+    for p in cached_files(cache_dir, "C????_????_?.csv"):
+        m = QCEW_FILE_RE.search(p.name)
+        src = resolve_cached(p)
+        if not m or src is None:
+            continue
+        st = src.stat()
+        rows.append((str(p.resolve()), int(m.group(1)) * 10, int(m.group(2)), int(m.group(3)),
+                     st.st_size, st.st_mtime_ns))
+    return pd.DataFrame(rows, columns=["path", "Code", "Year", "Quarter", "size", "mtime_ns"])
+
+
+def _changed_quarters(sources: pd.DataFrame, out_dir: Path) -> set[tuple[int, int]]:
+    """(Year, Quarter) partitions whose set of source files differs from the last build."""
+    manifest = out_dir / SOURCES_MANIFEST
+    cols = ["path", "size", "mtime_ns"]
+    if not manifest.exists():
+        return set(map(tuple, sources[["Year", "Quarter"]].drop_duplicates().to_numpy().tolist()))
+    old = pd.read_parquet(manifest)
+    merged = sources.merge(old, on=cols + ["Year", "Quarter"], how="outer", indicator=True)
+    diff = merged[merged["_merge"] != "both"]
+    return set(map(tuple, diff[["Year", "Quarter"]].drop_duplicates().astype("int64").to_numpy().tolist()))
+
+
+def extract_sector_facts(
+    con: duckdb.DuckDBPyConnection,
+    cache_dir: Path = CACHE_DIR,
+    out_dir: Path = SECTOR_DIR,
+    agglvls: tuple[int, ...] = DEFAULT_AGGLVLS,
+    force: bool = False,
+) -> tuple[int, int]:
+    """Rewrite the sector fact partitions of every changed quarter in one pass.
+    Returns (partitions written, rows written)."""
+    sources = scan_sources(cache_dir)
+    if sources.empty:
+        logger.info("No cached QCEW area files under %s", cache_dir)
+        return (0, 0)
+
+    quarters = (set(map(tuple, sources[["Year", "Quarter"]].drop_duplicates().to_numpy().tolist()))
+                if force or not out_dir.exists() else _changed_quarters(sources, out_dir))
+    if not quarters:
+        logger.info("Sector facts up to date (%d source files)", len(sources))
+        return (0, 0)
+
+    todo = sources[[(y, q) in quarters for y, q in zip(sources["Year"], sources["Quarter"])]]
+    for year, qtr in quarters:
+        shutil.rmtree(out_dir / f"Year={year}" / f"Quarter={qtr}", ignore_errors=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if todo.empty:
+        # only removals: the stale partitions are gone already
+        sources.to_parquet(out_dir / SOURCES_MANIFEST, index=False)
+        return (len(quarters), 0)
+
+    readable = {p: resolve_cached(Path(p)) for p in todo["path"]}
+    gone = [p for p, r in readable.items() if r is None]
+    if gone:
+        # removed since scan_sources; left out of the manifest so the next run sees it
+        logger.warning("%d source files disappeared during the build, e.g. %s", len(gone), gone[0])
+        sources = sources[~sources["path"].isin(gone)]
+    files = ", ".join(_sql_str(r) for r in readable.values() if r is not None)
+    if not files:
+        sources.to_parquet(out_dir / SOURCES_MANIFEST, index=False)
+        return (len(quarters), 0)
+    types = ", ".join(f"{_sql_str(k)}: {_sql_str(v)}" for k, v in QCEW_TYPES.items())
+    levels = ", ".join(str(int(a)) for a in agglvls)
+    # File names carry the metro, year and quarter, so they are taken from there
+    # instead of trusting per-file columns.
+    rows = fetch_scalar(con, f"""
+        COPY (
+            SELECT
+              CAST(regexp_extract(filename, 'C(\\d{{4}})_', 1) AS BIGINT) * 10 AS Code,
+              CAST(regexp_extract(filename, '_(\\d{{4}})_[1-4]\\.csv$', 1) AS BIGINT) AS Year,
+              CAST(regexp_extract(filename, '_([1-4])\\.csv$', 1) AS BIGINT) AS Quarter,
+              area_fips, own_code, industry_code, agglvl_code, size_code, disclosure_code,
+              qtrly_estabs AS Establishments,
+              month1_emplvl AS Month1_Employment,
+              month2_emplvl AS Month2_Employment,
+              month3_emplvl AS Month3_Employment,
+              (month1_emplvl + month2_emplvl + month3_emplvl) / 3.0 AS Avg_Employment,
+              total_qtrly_wages AS Total_Wages,
+              avg_wkly_wage AS Avg_Weekly_Wage
+            FROM read_csv([{files}], types={{{types}}}, union_by_name=true, filename=true, header=true)
+            WHERE agglvl_code IN ({levels})
+        )
+        TO {_sql_str(out_dir)}
+        (FORMAT PARQUET, PARTITION_BY (Year, Quarter), OVERWRITE_OR_IGNORE)
+        """)
+    sources.to_parquet(out_dir / SOURCES_MANIFEST, index=False)
+    logger.info("Sector facts: rewrote %d quarters from %d files (%d rows)", len(quarters), len(todo), rows)
+    return (len(quarters), int(rows))
+
+
+def register_sector_view(con: duckdb.DuckDBPyConnection, out_dir: Path = SECTOR_DIR) -> None:
+    """CREATE OR REPLACE VIEW qcew_sector_facts over the partitioned parquet."""
+    glob = _sql_str(out_dir / "Year=*" / "Quarter=*" / "*.parquet")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {SECTOR_VIEW} AS
+        SELECT * FROM read_parquet({glob}, hive_partitioning=true)
+        """)
+
+
+def annual_sector_wages(
+    con: duckdb.DuckDBPyConnection,
+    industries: list[str] | None = None,
+    agglvls: list[int] | None = None,
+    codes: list[int] | None = None,
+    own_code: str | None = "5",
+) -> pd.DataFrame:
+    """Annual wages, average employment and establishments per metro and industry, with
+    the industry's share of the metro's total (agglvl 40) wages. Defaults to private
+    ownership (own_code 5)."""
+    where = ["f.agglvl_code <> 40"]
+    args: list[object] = []
+    if industries:
+        where.append("f.industry_code IN (SELECT UNNEST(?))")
+        args.append([str(i) for i in industries])
+    if agglvls:
+        where.append("f.agglvl_code IN (SELECT UNNEST(?))")
+        args.append([int(a) for a in agglvls])
+    if codes:
+        where.append("f.Code IN (SELECT UNNEST(?))")
+        args.append([int(c) for c in codes])
+    if own_code is not None:
+        where.append("f.own_code = ?")
+        args.append(str(own_code))
+    return con.execute(f"""
+        WITH totals AS (
+          SELECT Code, Year, sum(Total_Wages) AS Metro_Wages
+          FROM {SECTOR_VIEW} WHERE agglvl_code = 40 GROUP BY Code, Year
+        )
+        SELECT f.Code, f.Year, f.agglvl_code, f.own_code, f.industry_code,
+               sum(f.Total_Wages) AS Total_Wages,
+               avg(f.Avg_Employment) AS Avg_Employment,
+               avg(f.Establishments) AS Avg_Establishments,
+               count(*) AS Quarters,
+               sum(f.Total_Wages) / any_value(t.Metro_Wages) AS Share_Of_Metro_Wages
+        FROM {SECTOR_VIEW} f
+        LEFT JOIN totals t USING (Code, Year)
+        WHERE {' AND '.join(where)}
+        GROUP BY ALL
+        ORDER BY f.Code, f.industry_code, f.Year
+        """, args).df()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Extract QCEW industry-sector facts from the cached area files")
+    ap.add_argument("--force", action="store_true", help="rewrite every quarter")
+    ap.add_argument("--agglvls", default=",".join(map(str, DEFAULT_AGGLVLS)),
+                    help="comma separated QCEW aggregation levels to keep")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-sector-facts] starting...")
+    agglvls = tuple(int(a) for a in args.agglvls.split(","))
+    with managed_connection(profile="build") as con:
+        quarters, rows = extract_sector_facts(con, agglvls=agglvls, force=args.force)
+        if SECTOR_DIR.exists():
+            register_sector_view(con)
+    print(f"[build-sector-facts] quarters rewritten: {quarters}, rows: {rows}")
+    print(f"[build-sector-facts] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
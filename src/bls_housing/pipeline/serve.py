@@ -0,0 +1,301 @@
+# bls_housing/pipeline/serve.py
+"""Small read-only HTTP/JSON service over the marts in `analysis.duckdb`.
+
+Endpoints:
+- GET /health
+- GET /tables                       -> mart tables, row counts, data version
+- GET /tables/<name>?code=12420&code=42660&year=2020&year_from=2016&year_to=2024
+                    &area=austin&limit=100&format=json|ndjson|arrow
+
+Each request opens its own short-lived read-only connection, so the database file is
+only locked while a query runs and writers (`build-data`, `update_db`, shard merges)
+can work between requests. At most `pool_size` requests query at once; a request
+that cannot get a slot in time, or finds the file locked by a writer, gets a 503.
+Results are cached as Arrow tables keyed by (table, filters) and the cache is
+dropped whenever max(build_meta.last_built) moves. `ndjson` and `arrow` (IPC stream)
+responses are written batch by batch instead of being serialized in one piece.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+import pyarrow as pa
+
+from bls_housing.pipeline.duck import DBPATH, MART_TABLES, connect, fetch_scalar, get_data_version
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_ROWS = 10_000
+
+
+class ServiceBusy(Exception):
+    """No query slot became free in time, or a writer holds the database lock."""
+
+
+class ReadConnections:
+    """Bounded number of concurrent short-lived read-only connections.
+
+    No connection is kept open between requests: holding one would keep DuckDB's
+    file lock and make every writer fail.
+    """
+
+    def __init__(self, dbpath: str | Path = DBPATH, size: int = 4, timeout: float = 30.0):
+        self.dbpath = dbpath
+        self._slots = threading.BoundedSemaphore(size)
+        self._timeout = timeout
+
+    @contextmanager
+    def connection(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        if not self._slots.acquire(timeout=self._timeout):
+            raise ServiceBusy(f"no query slot free after {self._timeout:.0f}s")
+        try:
+            try:
+                con = connect(self.dbpath, "query")
+            except duckdb.IOException as e:
+                # e.g. "Could not set lock on file": a build is writing right now
+                raise ServiceBusy(f"database is being written: {e}") from e
+            try:
+                yield con
+            finally:
+                con.close()
+        finally:
+            self._slots.release()
+
+
+class ResultCache:
+    """LRU of Arrow results, invalidated as a whole when the data version changes."""
+
+    def __init__(self, max_entries: int = 256, max_entry_bytes: int = 64 * 1024 * 1024):
+        self._entries: OrderedDict[tuple, pa.Table] = OrderedDict()
+        self._version: str | None = None
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+
+    def sync_version(self, version: str | None) -> None:
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    logger.info("Data version %s -> %s; dropping %d cached results",
+                                self._version, version, len(self._entries))
+                self._entries.clear()
+                self._version = version
+
+    def get(self, key: tuple) -> pa.Table | None:
+        with self._lock:
+            tbl = self._entries.get(key)
+            if tbl is not None:
+                self._entries.move_to_end(key)
+            return tbl
+
+    def put(self, key: tuple, tbl: pa.Table) -> None:
+        if tbl.nbytes > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._entries[key] = tbl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def build_query(table: str, params: dict[str, list[str]]) -> tuple[str, list]:
+    """Translate query-string filters into a parameterized SELECT on a mart table."""
+    if table not in MART_TABLES:
+        raise KeyError(table)
+
+    where: list[str] = []
+    args: list = []
+
+    codes = [int(c) for v in params.get("code", []) for c in v.split(",") if c]
+    if codes:
+        where.append("Code IN (SELECT * FROM UNNEST(?))")
+        args.append(codes)
+
+    years = [int(y) for v in params.get("year", []) for y in v.split(",") if y]
+    if years:
+        where.append("Year IN (SELECT * FROM UNNEST(?))")
+        args.append(years)
+    if "year_from" in params:
+        where.append("Year >= ?")
+        args.append(int(params["year_from"][0]))
+    if "year_to" in params:
+        where.append("Year <= ?")
+        args.append(int(params["year_to"][0]))
+
+    if "area" in params:
+        where.append("Area ILIKE ?")
+        args.append(f"%{params['area'][0]}%")
+
+    sql = f"SELECT * FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(MART_TABLES[table])
+    if "limit" in params:
+        sql += " LIMIT ?"
+        args.append(int(params["limit"][0]))
+    return sql, args
+
+
+def _json_safe(rows: list[dict]) -> list[dict]:
+    # inf / NaN (e.g. Zoning_Pressure with zero permits) are not valid JSON
+    for row in rows:
+        for k, v in row.items():
+            if isinstance(v, float) and not math.isfinite(v):
+                row[k] = None
+    return rows
+
+
+class MartService:
+    def __init__(self, connections: ReadConnections, cache: ResultCache):
+        self.connections = connections
+        self.cache = cache
+
+    def version(self) -> str | None:
+        with self.connections.connection() as con:
+            return get_data_version(con)
+
+    def query(self, table: str, params: dict[str, list[str]]) -> tuple[pa.Table, str | None]:
+        sql, args = build_query(table, params)
+        key = (sql, json.dumps(args, default=str))
+        with self.connections.connection() as con:
+            version = get_data_version(con)
+            self.cache.sync_version(version)
+            tbl = self.cache.get(key)
+            if tbl is None:
+                tbl = con.execute(sql, args).fetch_arrow_table()
+                self.cache.put(key, tbl)
+        return tbl, version
+
+    def tables(self) -> dict:
+        out = {}
+        with self.connections.connection() as con:
+            for name in MART_TABLES:
+                try:
+                    out[name] = fetch_scalar(con, f"SELECT count(*) FROM {name}")
+                except duckdb.CatalogException:
+                    out[name] = None
+            version = get_data_version(con)
+        return {"version": version, "tables": out}
+
+
+def make_handler(service: MartService) -> type[BaseHTTPRequestHandler]:
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug("%s - " + format, self.address_string(), *args)
+
+        def _send_json(self, status: int, payload, headers: dict[str, str] | None = None) -> None:
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            params = parse_qs(url.query)
+            try:
+                if parts == ["health"]:
+                    return self._send_json(200, {"status": "ok"})
+                if parts == ["tables"]:
+                    return self._send_json(200, service.tables())
+                if len(parts) == 2 and parts[0] == "tables":
+                    return self._send_table(parts[1], params)
+                return self._send_json(404, {"error": f"unknown path {url.path}"})
+            except ServiceBusy as e:
+                return self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            except KeyError as e:
+                return self._send_json(404, {"error": f"unknown table {e}"})
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            except duckdb.Error as e:
+                logger.error("Query failed for %s: %s", self.path, e)
+                return self._send_json(500, {"error": str(e)})
+
+        def _send_table(self, table: str, params: dict[str, list[str]]) -> None:
+            fmt = params.pop("format", ["json"])[0]
+            tbl, version = service.query(table, params)
+
+            if fmt == "json":
+                return self._send_json(200, {
+                    "table": table,
+                    "version": version,
+                    "row_count": tbl.num_rows,
+                    "rows": _json_safe(tbl.to_pylist()),
+                })
+
+            if fmt not in ("ndjson", "arrow"):
+                raise ValueError(f"unsupported format {fmt!r}")
+
+            # no Content-Length: body is streamed and terminated by closing the connection
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson" if fmt == "ndjson"
+                             else "application/vnd.apache.arrow.stream")
+            if version is not None:
+                self.send_header("X-Data-Version", version)
+            self.end_headers()
+
+            batches = tbl.to_batches(max_chunksize=STREAM_BATCH_ROWS)
+            if fmt == "ndjson":
+                for batch in batches:
+                    lines = (json.dumps(r, default=str) for r in _json_safe(batch.to_pylist()))
+                    self.wfile.write(("\n".join(lines) + "\n").encode("utf-8"))
+            else:
+                with pa.ipc.new_stream(self.wfile, tbl.schema) as writer:
+                    for batch in batches:
+                        writer.write_batch(batch)
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, dbpath: str | Path = DBPATH,
+                pool_size: int = 4) -> ThreadingHTTPServer:
+    service = MartService(ReadConnections(dbpath, size=pool_size), ResultCache())
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, dbpath: str | Path = DBPATH,
+          pool_size: int = 4) -> None:
+    httpd = make_server(host, port, dbpath, pool_size)
+    logger.info("Serving %s read-only on http://%s:%d", dbpath, host, port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Read-only HTTP/JSON service over the marts tables")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--db", default=str(DBPATH), help="DuckDB database file")
+    ap.add_argument("--pool-size", type=int, default=4, help="concurrent read-only queries")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+    print(f"[serve-marts] http://{args.host}:{args.port} -> {args.db}")
+    serve(args.host, args.port, args.db, args.pool_size)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,398 @@
+# bls_housing/pipeline/shard.py
+"""Sharded metro builds with a deterministic merge.
+
+`--shard i/N` assigns a metro to shard `crc32(Code) % N`. The hash is stable across
+processes, hosts and Python versions. Each shard builds its metros into its own
+directory:
+
+    data/derived/shards/002-of-008/annual_wages.parquet
+    data/derived/shards/002-of-008/annual_permits.parquet
+    data/derived/shards/002-of-008/stage.duckdb     (annual/cumulative/quarterly rows)
+    data/derived/shards/002-of-008/shard.json       (written last: the shard is complete)
+
+Shards share nothing but the raw caches, so they can run as local worker processes
+or on several hosts over a shared filesystem. `merge_shards` then upserts every
+complete shard into data/derived and analysis.duckdb in one transaction, ordered by
+key. Shards cover disjoint metros, so the merged result does not depend on shard
+completion order, and merging a re-run shard again only replaces its own rows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import pandas as pd
+
+from bls_housing.helper import QUARTER_TO_MONTH
+from bls_housing.pipeline.duck import DBPATH, fetch_scalar, managed_connection, mark_built
+from bls_housing.pipeline.ensure import (
+    DERIVED_DIR,
+    _read_parquet_if_exists,
+    _record_lineage,
+    _upsert_parquet,
+    ensure_annual_permits,
+    ensure_annual_wages,
+)
+from bls_housing.pipeline.marts import (
+    build_annual_metrics,
+    build_cumulative_metrics,
+    refresh_cumulative_by_base,
+)
+from bls_housing.pipeline.rollups import refresh_rollups
+from bls_housing.pipeline.seasonal import SERIES, annual_permits_for_series
+from bls_housing.pipeline.snapshot import publish_snapshots
+
+logger = logging.getLogger(__name__)
+
+SHARD_ROOT = DERIVED_DIR / "shards"
+STAGE_DB = "stage.duckdb"
+SHARD_MANIFEST = "shard.json"
+
+# parquet in the derived store -> key columns
+DERIVED_FILES = {
+    "annual_wages.parquet": ["Code", "Year"],
+    "annual_permits.parquet": ["Code", "Year"],
+}
+# DuckDB mart -> key columns
+MERGE_TABLES = {
+    "annual_metrics": ["Code", "Year"],
+    "cumulative_metrics": ["Code", "Year"],
+    "wages_metrics": ["Code", "Year", "Quarter"],
+    "permits_metrics": ["Code", "Year", "Quarter", "Month"],
+}
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> "ShardSpec":
+        """'i/N' with 0 <= i < N."""
+        i, sep, n = text.partition("/")
+        if not sep or not i.strip().isdigit() or not n.strip().isdigit():
+            raise ValueError(f"Shard must look like i/N, got {text!r}")
+        spec = cls(int(i), int(n))
+        if spec.count < 1 or not 0 <= spec.index < spec.count:
+            raise ValueError(f"Shard index out of range: {text!r}")
+        return spec
+
+    @property
+    def name(self) -> str:
+        return f"{self.index:03d}-of-{self.count:03d}"
+
+
+def shard_of(code: int, count: int) -> int:
+    return zlib.crc32(str(int(code)).encode("ascii")) % count
+
+
+def select_shard(metros: pd.DataFrame, spec: ShardSpec) -> pd.DataFrame:
+    keep = [shard_of(c, spec.count) == spec.index for c in metros["Code"]]
+    return metros[keep].reset_index(drop=True)
+
+
+def shard_dir(spec: ShardSpec, root: Path = SHARD_ROOT) -> Path:
+    return root / spec.name
+
+
+def prefetch_permit_months(years: list[int], quarters: list[int] = [1, 2, 3, 4]) -> None:
+    """Fetch/convert the shared monthly BPS files once, before shards fan out, so
+    workers only read them."""
+    from bls_housing.census_cache import fetch_cbsa_csv
+
+    for year in years:
+        for qtr in quarters:
+            for mon in QUARTER_TO_MONTH[str(qtr)]:
+                fetch_cbsa_csv(str(year), str(mon))
+
+
+def _upsert_table(con: duckdb.DuckDBPyConnection, table: str, source: str, keys: list[str]) -> int:
+    """Replace the rows of `table` whose keys appear in `source`; rows are inserted in
+    key order. Column lists come from `table`."""
+    cols = [r[0] for r in con.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE table_name = ? AND database_name = current_database() "
+        "ORDER BY column_index", [table]).fetchall()]
+    on = " AND ".join(f"t.{k} = s.{k}" for k in keys)
+    con.execute(f"DELETE FROM {table} t USING (SELECT DISTINCT {', '.join(keys)} FROM {source}) s WHERE {on}")
+    return fetch_scalar(con, f"""
+        INSERT INTO {table} ({', '.join(cols)})
+        SELECT {', '.join(cols)} FROM {source} ORDER BY {', '.join(keys)}
+        """)
+
+
+def _stage_frames(stage_path: Path, frames: dict[str, pd.DataFrame]) -> None:
+    # temp_directory per shard: concurrent shards must not share spill files
+    with managed_connection(stage_path, profile="build", temp_directory=str(stage_path.parent / "tmp")) as con:
+        for table, df in frames.items():
+            if df.empty:
+                continue
+            con.register("frame", df)
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM frame WITH NO DATA")
+            con.execute("BEGIN TRANSACTION")
+            _upsert_table(con, table, "frame", MERGE_TABLES[table])
+            con.execute("COMMIT")
+            con.unregister("frame")
+
+
+def build_shard(
+    metros: pd.DataFrame,
+    years: list[int],
+    spec: ShardSpec,
+    base_year: int | None = None,
+    quarters: list[int] = [1, 2, 3, 4],
+    engine: str = "pandas",
+    source: str = "cache",
+    root: Path = SHARD_ROOT,
+    permit_series: str = "raw",
+) -> dict:
+    """Build the metros of one shard into its own directory. Re-running a shard
+    only builds (Code, Year) keys missing from its derived parquet.
+    `permit_series` "adjusted" or "trend" builds the annual and cumulative marts from
+    seasonally adjusted / trend permits (see seasonal.py) instead of the raw counts."""
+    t0 = perf_counter()
+    out = shard_dir(spec, root)
+    out.mkdir(parents=True, exist_ok=True)
+    (out / SHARD_MANIFEST).unlink(missing_ok=True)
+
+    mine = select_shard(metros, spec)
+    codes = sorted(int(c) for c in mine["Code"])
+    manifest = {"shard": spec.index, "count": spec.count, "codes": codes, "years": list(years),
+                "permit_series": permit_series}
+    if codes:
+        w = ensure_annual_wages(mine, years, quarters, engine=engine, source=source,
+                                derived_dir=out, lineage=False)
+        p = ensure_annual_permits(mine, years, engine=engine, derived_dir=out, lineage=False)
+        (wages_df, annual_wages) = w.df_tuple
+        (permits_df, annual_permits) = p.df_tuple
+        base = base_year if base_year is not None else years[min(1, len(years) - 1)]
+        _stage_frames(out / STAGE_DB, {"wages_metrics": wages_df, "permits_metrics": permits_df})
+        if permit_series != "raw":
+            annual_permits = _series_permits(out / STAGE_DB, codes, years, permit_series)
+        _stage_frames(out / STAGE_DB, {
+            "annual_metrics": build_annual_metrics(annual_wages, annual_permits, engine=engine),
+            "cumulative_metrics": build_cumulative_metrics(annual_wages, annual_permits, base, engine=engine),
+        })
+        manifest["built_keys"] = len(w.missing_keys) + len(p.missing_keys)
+
+    manifest["finished_at"] = datetime.now().isoformat()
+    manifest["seconds"] = round(perf_counter() - t0, 3)
+    tmp = out / f".{SHARD_MANIFEST}.{os.getpid()}"
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, out / SHARD_MANIFEST)
+    logger.info("Shard %s: %d metros in %.2fs", spec.name, len(codes), manifest["seconds"])
+    return manifest
+
+
+def _series_permits(stage_path: Path, codes: list[int], years: list[int], series: str) -> pd.DataFrame:
+    """Annual `series` permits of the shard's metros from every monthly row staged so
+    far, including months built by earlier runs of the shard."""
+    if series not in SERIES:
+        raise ValueError(f"Unknown permit series {series!r}; expected one of {sorted(SERIES)}")
+    with managed_connection(stage_path, profile="query") as con:
+        monthly = con.execute("""
+            SELECT Area, Code, Year, Quarter, Month, Total_Permits FROM permits_metrics
+            WHERE Code IN (SELECT UNNEST(?)) AND Year IN (SELECT UNNEST(?))
+            """, [codes, [int(y) for y in years]]).df()
+    return annual_permits_for_series(monthly, series)
+
+
+def _shard_worker(args: tuple) -> dict:
+    metros, years, spec, base_year, engine, source, root, permit_series = args
+    return build_shard(metros, years, spec, base_year, engine=engine, source=source, root=root,
+                       permit_series=permit_series)
+
+
+def build_shards(
+    metros: pd.DataFrame,
+    years: list[int],
+    count: int,
+    workers: int | None = None,
+    base_year: int | None = None,
+    engine: str = "pandas",
+    source: str = "cache",
+    root: Path = SHARD_ROOT,
+    permit_series: str = "raw",
+) -> list[dict]:
+    """Build all `count` shards of `metros` with a local process pool."""
+    from bls_housing.logging_config import configure_worker_logging, worker_logging_initargs
+
+    prefetch_permit_months(years)
+    jobs = [(metros, years, ShardSpec(i, count), base_year, engine, source, root, permit_series)
+            for i in range(count)]
+    with ProcessPoolExecutor(max_workers=workers or count, initializer=configure_worker_logging,
+                             initargs=worker_logging_initargs()) as pool:
+        return list(pool.map(_shard_worker, jobs))
+
+
+def complete_shards(count: int, root: Path = SHARD_ROOT) -> tuple[list[Path], list[int]]:
+    """(directories of complete shards, indexes of missing/incomplete shards)."""
+    done, missing = [], []
+    for i in range(count):
+        d = shard_dir(ShardSpec(i, count), root)
+        if (d / SHARD_MANIFEST).exists():
+            done.append(d)
+        else:
+            missing.append(i)
+    return done, missing
+
+
+def _shard_codes(shard: Path) -> list[int]:
+    return json.loads((shard / SHARD_MANIFEST).read_text(encoding="utf-8"))["codes"]
+
+
+def merge_shards(
+    con: duckdb.DuckDBPyConnection,
+    count: int,
+    root: Path = SHARD_ROOT,
+    derived_dir: Path = DERIVED_DIR,
+    allow_partial: bool = False,
+) -> dict[str, int]:
+    """Upsert every complete shard into `derived_dir` and the marts of `con`.
+    Returns rows merged per parquet file / table."""
+    done, missing = complete_shards(count, root)
+    if missing and not allow_partial:
+        raise RuntimeError(f"Shards not complete: {missing} of {count}")
+    merged: dict[str, int] = {}
+    if not done:
+        return merged
+
+    for name, keys in DERIVED_FILES.items():
+        parts = [df for df in (_read_parquet_if_exists(d / name) for d in done) if not df.empty]
+        if not parts:
+            continue
+        df_new = pd.concat(parts, ignore_index=True).sort_values(keys).reset_index(drop=True)
+        _upsert_parquet(derived_dir / name, df_new, key_cols=keys)
+        _record_lineage(name.removesuffix(".parquet"), df_new)
+        merged[name] = len(df_new)
+
+    aliases: list[str] = []
+    in_transaction = False
+    try:
+        for d in done:
+            if (d / STAGE_DB).exists():
+                alias = f"shard_{len(aliases)}"
+                path = str(d / STAGE_DB).replace("'", "''")
+                con.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+                aliases.append(alias)
+        # one transaction: readers see all shards merged or none
+        con.execute("BEGIN TRANSACTION")
+        in_transaction = True
+        for table, keys in MERGE_TABLES.items():
+            sources = [f"SELECT * FROM {a}.{table}" for a in aliases if _has_table(con, a, table)]
+            if not sources:
+                continue
+            con.execute(f"CREATE OR REPLACE TEMP VIEW shard_union AS {' UNION ALL BY NAME '.join(sources)}")
+            merged[table] = _upsert_table(con, table, "shard_union", keys)
+        con.execute("COMMIT")
+        in_transaction = False
+    except BaseException:
+        if in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute("DROP VIEW IF EXISTS shard_union")
+        for alias in aliases:
+            con.execute(f"DETACH {alias}")
+
+    tables = [t for t in MERGE_TABLES if t in merged]
+    if tables:
+        mark_built(con, tables)
+        refresh_rollups(
+            con,
+            annual_years=None if "annual_metrics" in merged else [],
+            cumulative_years=None if "cumulative_metrics" in merged else [],
+        )
+    if "annual_wages.parquet" in merged or "annual_permits.parquet" in merged:
+        # keep an already seeded multi-base sweep in step with the merged metros
+        codes = sorted({int(c) for d in done for c in _shard_codes(d)})
+        n = refresh_cumulative_by_base(
+            con,
+            _read_parquet_if_exists(derived_dir / "annual_wages.parquet"),
+            _read_parquet_if_exists(derived_dir / "annual_permits.parquet"),
+            codes=codes,
+        )
+        if n:
+            merged["cumulative_metrics_by_base"] = n
+    if tables:
+        publish_snapshots(con)
+    return merged
+
+
+def _has_table(con: duckdb.DuckDBPyConnection, database: str, table: str) -> bool:
+    return fetch_scalar(con, "SELECT count(*) FROM duckdb_tables() WHERE database_name = ? AND table_name = ?",
+                        [database, table]) > 0
+
+
+def _years(spec: str) -> list[int]:
+    lo, _, hi = spec.partition("-")
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def _load_metros(codes: str | None) -> pd.DataFrame:
+    # read-only: several shard processes or hosts may read the universe at once
+    with managed_connection(DBPATH, profile="query") as con:
+        if codes:
+            return con.execute("SELECT Code, Area, Title FROM dim_metro_full WHERE Code IN (SELECT UNNEST(?))",
+                               [[int(c) for c in codes.split(",")]]).df()
+        return con.execute("SELECT Code, Area, Title FROM dim_metro_full ORDER BY Code").df()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Sharded metro builds and the merge into the marts")
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--shard", help="build one shard, i/N (multi-host: one per host)")
+    mode.add_argument("--count", type=int, help="build all N shards with a local process pool, then merge")
+    mode.add_argument("--merge", type=int, metavar="N", help="only merge the N complete shards")
+    ap.add_argument("--workers", type=int, default=None, help="local processes for --count (default N)")
+    ap.add_argument("--years", default="2014-2024")
+    ap.add_argument("--base-year", type=int, default=None, help="cumulative base year (default second year)")
+    ap.add_argument("--codes", default=None, help="comma separated metro codes (default every metro)")
+    ap.add_argument("--engine", default="pandas", choices=["pandas", "polars"])
+    ap.add_argument("--source", default="cache", choices=["cache", "lake"])
+    ap.add_argument("--allow-partial", action="store_true", help="merge even if some shards are missing")
+    ap.add_argument("--permit-series", default="raw", choices=sorted(SERIES),
+                    help="permits the annual/cumulative marts are built from (trend smooths zero years)")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[build-shards] starting...")
+    years = _years(args.years)
+    if args.shard:
+        spec = ShardSpec.parse(args.shard)
+        res = build_shard(_load_metros(args.codes), years, spec, args.base_year,
+                          engine=args.engine, source=args.source, permit_series=args.permit_series)
+        print(f"[build-shards] shard {spec.name}: {len(res['codes'])} metros in {res['seconds']:.2f}s")
+        print(f"[build-shards] done in {perf_counter() - t0:.2f}s")
+        return 0
+
+    count = args.merge or args.count
+    if args.count:
+        results = build_shards(_load_metros(args.codes), years, args.count, args.workers,
+                               args.base_year, engine=args.engine, source=args.source,
+                               permit_series=args.permit_series)
+        for res in results:
+            print(f"[build-shards] shard {res['shard']:03d}: {len(res['codes'])} metros in {res['seconds']:.2f}s")
+    with managed_connection(DBPATH, profile="build") as con:
+        merged = merge_shards(con, count, allow_partial=args.allow_partial)
+    for name, rows in merged.items():
+        print(f"[build-shards] merged {name}: {rows} rows")
+    print(f"[build-shards] done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+# bls_housing/pipeline/snapshot.py
+"""Versioned, memory-mappable Arrow snapshots of the marts.
+
+`publish_snapshots(con)` exports the wages, permits, annual and cumulative tables to
+uncompressed Arrow IPC files (Feather v2) under
+
+    data/derived/snapshots/<version>/<table>.arrow
+    data/derived/snapshots/<version>/manifest.json
+    data/derived/snapshots/CURRENT          -> "<version>"
+
+A version directory is written under a temporary name and renamed into place, and
+CURRENT is swapped with os.replace, so readers never see a half-written snapshot.
+
+`update_db`, shard merges and `build-data` publish a new snapshot when the data version
+moved; `publish-snapshots` does the same by hand.
+
+`open_snapshot("annual_metrics")` memory-maps the file: column buffers point straight
+into the page cache, so notebooks and worker processes attach in milliseconds and
+share the same physical pages instead of each decoding parquet.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from bls_housing.pipeline.duck import MART_TABLES, get_data_version, managed_connection
+from bls_housing.settings import derived_root
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ROOT = derived_root() / "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+KEEP_VERSIONS = 3
+
+
+def current_version(root: Path = SNAPSHOT_ROOT) -> str | None:
+    try:
+        version = (root / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def read_manifest(version: str | None = None, root: Path = SNAPSHOT_ROOT) -> dict:
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot under {root}")
+    return json.loads((root / version / MANIFEST_FILE).read_text(encoding="utf-8"))
+
+
+def _swap_current(root: Path, version: str) -> None:
+    tmp = root / f".{CURRENT_FILE}.{os.getpid()}"
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, root / CURRENT_FILE)
+
+
+def _prune(root: Path, keep: int) -> None:
+    current = current_version(root)
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in versions[:-keep] if keep > 0 else []:
+        if old.name != current:
+            # open memory maps stay valid after unlink on POSIX
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def publish_tables(
+    tables: dict[str, pa.Table | pd.DataFrame],
+    root: Path = SNAPSHOT_ROOT,
+    data_version: str | None = None,
+    keep: int = KEEP_VERSIONS,
+) -> str:
+    """Write `tables` as one new snapshot version, point CURRENT at it and return the
+    version id."""
+    root.mkdir(parents=True, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    staging = root / f".{version}.tmp"
+    staging.mkdir()
+
+    listed: dict[str, dict] = {}
+    manifest = {"version": version, "data_version": data_version, "tables": listed}
+    try:
+        for name, table in tables.items():
+            if isinstance(table, pd.DataFrame):
+                table = pa.Table.from_pandas(table, preserve_index=False)
+            feather.write_feather(table, staging / f"{name}.arrow", compression="uncompressed")
+            listed[name] = {"rows": table.num_rows, "columns": table.column_names}
+        (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(staging, root / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _swap_current(root, version)
+    _prune(root, keep)
+    logger.info("Published snapshot %s (%d tables)", version, len(tables))
+    return version
+
+
+def publish_snapshots(
+    con: duckdb.DuckDBPyConnection,
+    root: Path = SNAPSHOT_ROOT,
+    force: bool = False,
+    keep: int = KEEP_VERSIONS,
+) -> str | None:
+    """Snapshot the mart tables from DuckDB. Skips (returns the current version) when
+    the database's data version matches the current snapshot, unless `force`."""
+    data_version = get_data_version(con)
+    existing = current_version(root)
+    if existing and not force:
+        try:
+            if read_manifest(existing, root).get("data_version") == data_version:
+                logger.info("Snapshot %s is up to date with data version %s", existing, data_version)
+                return existing
+        except FileNotFoundError:
+            pass
+
+    present = {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    tables = {}
+    for name, order in MART_TABLES.items():
+        if name not in present:
+            logger.warning("Table %s not found, not included in snapshot", name)
+            continue
+        tables[name] = con.execute(f"SELECT * FROM {name} ORDER BY {', '.join(order)}").fetch_arrow_table()
+    if not tables:
+        return None
+    return publish_tables(tables, root, data_version=data_version, keep=keep)
+
+
+def open_snapshot(
+    name: str,
+    columns: list[str] | None = None,
+    version: str | None = None,
+    root: Path = SNAPSHOT_ROOT,
+) -> pa.Table:
+    """Memory-map a snapshot table. Column selection is zero-copy as well."""
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot under {root}")
+    source = pa.memory_map(str(root / version / f"{name}.arrow"), "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def snapshot_frame(
+    name: str,
+    columns: list[str] | None = None,
+    version: str | None = None,
+    root: Path = SNAPSHOT_ROOT,
+) -> pd.DataFrame:
+    """pandas view of a snapshot table. Conversion copies the selected columns, so pass
+    `columns` when only a few are needed."""
+    return open_snapshot(name, columns, version, root).to_pandas(split_blocks=True)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Publish memory-mappable Arrow snapshots of the marts")
+    ap.add_argument("--force", action="store_true", help="publish even if the data version is unchanged")
+    ap.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="snapshot versions to keep")
+    args = ap.parse_args()
+
+    from bls_housing.logging_config import configure_logging
+    configure_logging(level="INFO")
+
+    t0 = perf_counter()
+    print("[publish-snapshots] starting...")
+    with managed_connection(profile="query") as con:
+        version = publish_snapshots(con, force=args.force, keep=args.keep)
+    if version is None:
+        print("[publish-snapshots] no mart tables found")
+        return 1
+    for name, info in read_manifest(version)["tables"].items():
+        print(f"[publish-snapshots] {name}: {info['rows']} rows")
+    print(f"[publish-snapshots] current={version} done in {perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,12 +2,20 @@
 #• writes parquet partitioned 
 
 from bls_housing.qcew_cache import load_area_df #, get_cached_path , fetch_area_csv
-from bls_housing.helper import CPI_U #, QUARTER_TO_MONTH
+from bls_housing.helper import CPI_U, pct_change_unfilled #, QUARTER_TO_MONTH
+from bls_housing.pipeline import polars_engine
+from bls_housing.pipeline.polars_engine import check_engine
+from bls_housing.pipeline.checkpoint import RunJournal
+from bls_housing.pipeline.compact import lake_glob
 from typing import cast
 from typing import List
 from typing import Union
+import logging
+import duckdb
 import numpy as np
 import pandas as pd
+
+logger = logging.getLogger(__name__)
 # import numpy as np
 # import duckdb
 
@@ -38,38 +46,128 @@ def adjust_inflation(row):
     return real_wage
 
 
+def _metro_total(code: int, year, qtr):
+    """Agglvl 40 (metro total) wages of one cached QCEW area file, or None if the file
+    has no metro total. Downloads the file on a cache miss."""
+    df = load_area_df(_to_qcew(code), str(year), str(qtr))
+    msa = df[df.get('agglvl_code') == 40]
+    if msa.empty:
+        logger.debug("Missing agglvl 40: Code=%s, Year=%s, Quarter=%s", code, year, qtr)
+        return None
+    return msa['total_qtrly_wages'].iloc[0]
+
+
+def _lake_quarterly_wages(metros: pd.DataFrame, years: List[int], quarters) -> pd.DataFrame:
+    """Quarterly agglvl 40 wages for all metros in one hive-pruned scan of the lake,
+    in the same row order and schema as the per-file loop. Metro-quarters the lake
+    does not have (e.g. it is only partly built) are read from the QCEW cache."""
+    grid = pd.DataFrame(
+        [(m.Area, cast(int, m.Code), year, qtr) for m in metros.itertuples(index=False)
+         for year in years for qtr in quarters],
+        columns=["Area", "Code", "Year", "Quarter"],
+    )
+    grid["Lake_Code"] = grid["Code"] // 10 * 10   # the lake is keyed by the QCEW area (C1234 -> 12340)
+
+    con = duckdb.connect()
+    try:
+        found = con.execute(f"""
+            SELECT cbsa_code AS Lake_Code, year AS Year, quarter AS Quarter,
+                   first(total_qtrly_wages) AS Total_Wages
+            FROM read_parquet('{lake_glob().replace("'", "''")}', hive_partitioning=true, union_by_name=true)
+            WHERE cbsa_code IN (SELECT UNNEST(?))
+              AND year IN (SELECT UNNEST(?))
+              AND quarter IN (SELECT UNNEST(?))
+              AND agglvl_code = 40
+            GROUP BY ALL
+            """, [sorted(set(grid["Lake_Code"].tolist())), [int(y) for y in years],
+                  [int(q) for q in quarters]]).df()
+    finally:
+        con.close()
+
+    wages_df = grid.merge(found, on=["Lake_Code", "Year", "Quarter"], how="left").drop(columns="Lake_Code")
+    gaps = wages_df["Total_Wages"].isna()
+    if gaps.any():
+        logger.info("%d metro-quarters not in the lake, reading them from the QCEW cache "
+                    "(build-parquet-lake adds them to the lake)", int(gaps.sum()))
+        filled = pd.Series(
+            [_metro_total(cast(int, r.Code), r.Year, r.Quarter) for r in wages_df[gaps].itertuples(index=False)],
+            index=wages_df.index[gaps], dtype="float64",
+        )
+        wages_df["Total_Wages"] = wages_df["Total_Wages"].astype("float64").fillna(filled)
+    missing = int(wages_df["Total_Wages"].isna().sum())
+    if missing:
+        logger.warning("Missing agglvl 40 wages for %d metro-quarters (see dq_issues / DEBUG log)", missing)
+    return wages_df
+
+
 def build_annual_wages(metros: pd.DataFrame, 
                     years: List[int], 
-                    quarters=[1,2,3,4]) ->  tuple[pd.DataFrame, pd.DataFrame]:
+                    quarters=[1,2,3,4],
+                    engine: str = "pandas",
+                    source: str = "cache",
+                    journal: RunJournal | None = None) ->  tuple[pd.DataFrame, pd.DataFrame]:
+    """Quarterly and annual wages per metro. `source` is "cache" (QCEW area CSVs,
+    downloaded on a miss) or "lake" (data/lake/bls parquet, see build-parquet-lake).
+    With a `journal` the per-file loop checkpoints finished (Code, Year) units and
+    skips those done by an interrupted earlier run."""
+    if check_engine(engine) == "polars":
+        return polars_engine.build_annual_wages(metros, years, quarters, source=source)
+    if source == "lake":
+        return _annual_from_quarterly(_lake_quarterly_wages(metros, years, quarters), len(quarters))
+    if source != "cache":
+        raise ValueError(f"Unknown wage source {source!r}, expected one of {polars_engine.WAGE_SOURCES}")
+
     data_list = []
+    missing = 0
     #metros = list_metros(con, area_codes)
-    for m in metros.itertuples(index=False):
-        for year in years:
-            for qtr in quarters:
-                qcew_code = _to_qcew(cast(int, m.Code))
-                df = load_area_df(qcew_code, str(year), str(qtr))
-                
-                msa = df[df.get('agglvl_code') == 40]
-                total_wages_current_qtr = msa['total_qtrly_wages'].iloc[0]
-                data_list.append({
-                    "Area": m.Area,
-                    "Code": cast(int, m.Code),
-                    "Year": year,
-                    "Quarter": qtr,
-                    "Total_Wages": total_wages_current_qtr
-                })
-            
+    try:
+        for m in metros.itertuples(index=False):
+            for year in years:
+                done = journal.done(cast(int, m.Code), year) if journal else None
+                if done is not None:
+                    data_list.extend(done)
+                    continue
+                unit = []
+                for qtr in quarters:
+                    total_wages_current_qtr = _metro_total(cast(int, m.Code), year, qtr)
+                    if total_wages_current_qtr is None:
+                        # no metro total in this file; keep the row so the gap is visible downstream
+                        missing += 1
+                    unit.append({
+                        "Area": m.Area,
+                        "Code": cast(int, m.Code),
+                        "Year": year,
+                        "Quarter": qtr,
+                        "Total_Wages": total_wages_current_qtr
+                    })
+                data_list.extend(unit)
+                if journal:
+                    journal.add(cast(int, m.Code), year, unit)
+    finally:
+        if journal:
+            journal.flush()   # completed units survive an interrupt or error
 
     # print(data_list)
-    wages_df = pd.DataFrame(data_list)
+    if missing:
+        logger.warning("Missing agglvl 40 wages for %d metro-quarters (see dq_issues / DEBUG log)", missing)
+    if journal and journal.skipped:
+        logger.info("Skipped %d wage units already checkpointed", journal.skipped)
+    return _annual_from_quarterly(pd.DataFrame(data_list), len(quarters))
+
 
-    # Calculate annual total wages and percentage change
-    annual_wages_df = wages_df.groupby(["Area", "Code", "Year"])["Total_Wages"].sum().reset_index()
+def _annual_from_quarterly(wages_df: pd.DataFrame, n_quarters: int = 4) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Calculate annual total wages and percentage change.
+    # A year missing any quarter is NaN, not the sum of the quarters it has
+    annual_wages_df = (
+        wages_df.groupby(["Area", "Code", "Year"])["Total_Wages"].sum(min_count=n_quarters).reset_index()
+    )
 
     # Apply the adjustment
     annual_wages_df['Real_Total_Wages'] = annual_wages_df.apply(adjust_inflation, axis=1)
 
     # now calculate the growth rate using the adjusted wages
-    annual_wages_df['Change_Real_Wage'] = annual_wages_df.groupby("Area")['Real_Total_Wages'].pct_change() * 100
+    annual_wages_df['Change_Real_Wage'] = (
+        pct_change_unfilled(annual_wages_df, 'Real_Total_Wages') * 100
+    )
     #print(annual_wages_df.head(15))
     return (wages_df, annual_wages_df)
\ No newline at end of file
@@ -5,7 +5,7 @@ Functions:
 - `fetch_area_csv(area, year, qtr, cache_dir, force_download)` -> returns local CSV path (uses cache)
 - `load_area_df(area, year, qtr, cache_dir, **pd_read_csv_kwargs)` -> returns a pandas.DataFrame
 
-The cache stores files under `cache_dir` (default: `[project root]/data/cache`).
+The cache stores files under `cache_dir` (default: `[cache root]/bls`, see `settings.cache_root()`).
 """
 
 from __future__ import annotations
@@ -17,13 +17,14 @@ from typing import Optional
 import pandas as pd
 import requests
 import logging
-from bls_housing.logging_config import configure_logging
-configure_logging(level="INFO")
+
+from bls_housing.settings import cache_root
+from bls_housing.tiered_cache import fetch_tiered, lookup_cached
+
 logger = logging.getLogger(__name__)
 
-# Repository root (two levels up from this file: src/bls_housing -> src -> repo root)
-REPO_ROOT = Path(__file__).resolve().parents[2]
-CACHE_DIR = REPO_ROOT / "data" / "cache" / "bls"
+# [cache root]/bls, see settings.cache_root()
+CACHE_DIR = cache_root() / "bls"
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 
@@ -50,9 +51,16 @@ def _ensure_cache_dir(cache_dir: str | Path = CACHE_DIR) -> Path:
 
 
 def get_cached_path(area: str, year: str, qtr: str, cache_dir: str | Path = CACHE_DIR) -> Optional[Path]:
+    """Hot cache path for (area, year, qtr), or None if not cached. A file only in the
+    cold tier is copied into the hot tier first (see tiered_cache.lookup_cached)."""
     p = Path(cache_dir)
     p = p / _cache_filename(area, year, qtr)
-    return p if p.exists() else None
+    return lookup_cached(p)
+
+
+def get_cache_path(area: str, year: str, qtr: str, cache_dir: str | Path = CACHE_DIR) -> Path:
+    """Cache path for (area, year, qtr), whether or not the file exists."""
+    return Path(cache_dir) / _cache_filename(area, year, qtr)
 
 
 def fetch_area_csv(
@@ -71,22 +79,22 @@ def fetch_area_csv(
         return cached
 
     url = qcew_get_area_url(year, qtr, area)
-    try:
-        resp = requests.get(url, timeout=timeout)
-    except requests.RequestException as e:
-        logger.error(f"Error downloading {url}: {e}")
-        raise RuntimeError(f"Failed to download {url}: {e}") from e
-    if resp.status_code >= 400:
-        logger.error(f"HTTP {resp.status_code} downloading {url}: {resp.text}")
-        raise RuntimeError(f"Failed to download {url}: HTTP {resp.status_code}")
 
+    def download(tmp_path: Path) -> None:
+        try:
+            resp = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            logger.error("Error downloading %s: %s", url, e)
+            raise RuntimeError(f"Failed to download {url}: {e}") from e
+        if resp.status_code >= 400:
+            logger.error("HTTP %d downloading %s: %s", resp.status_code, url, resp.text)
+            raise RuntimeError(f"Failed to download {url}: HTTP {resp.status_code}")
+        with open(tmp_path, "wb") as fh:
+            fh.write(resp.content)
+
+    # concurrent callers for the same file share one download
     out_path = cache_dir_path / _cache_filename(area, year, qtr)
-    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    with open(tmp_path, "wb") as fh:
-        fh.write(resp.content)
-    tmp_path.replace(out_path)
-
-    return out_path
+    return fetch_tiered(out_path, download, force=force_download)
 
 
 def load_area_df(
@@ -108,7 +116,7 @@ def load_area_df(
     expected = ["agglvl_code", "total_qtrly_wages"]
     missing = [c for c in expected if c not in df.columns]
     if missing:
-        logger.error(f"Missing expected QCEW columns: {missing}. Source CSV: {csv_path}")
+        logger.error("Missing expected QCEW columns: %s. Source CSV: %s", missing, csv_path)
         raise ValueError(f"Missing expected QCEW columns: {missing}. Source CSV: {csv_path}")
 
     return df
@@ -119,5 +127,6 @@ __all__ = [
     "qcew_get_area_url",
     "fetch_area_csv",
     "get_cached_path",
+    "get_cache_path",
     "load_area_df",
 ]
@@ -0,0 +1,143 @@
+"""Runtime settings read from an optional TOML config file and the environment.
+
+The config file is `$BLS_HOUSING_CONFIG` if set, else `[project root]/bls_housing.toml`.
+Environment variables always win over the file. Example:
+
+    [duckdb.build]
+    threads = 8
+    memory_limit = "24GB"
+    temp_directory = "/mnt/nvme/duckdb_tmp"
+
+    [duckdb.query]
+    threads = 2
+
+    [paths]
+    data_root = "/mnt/nvme/bls"         # analysis.duckdb, lake/, derived/, tmp/, raw/
+    cache = "/mnt/nvme/bls/cache"       # hot tier of the raw download cache
+    cold_cache = "/shared/bls/cache"    # optional shared cold tier
+    outputs = "/srv/bls/outputs"        # rendered charts
+    logs = "/var/log/bls_housing"
+
+    [cache]
+    hot_max_gb = 20                     # evict promoted files beyond this
+
+Relative paths are taken from the project root. Each path also has an environment
+variable: BLS_DATA_ROOT, BLS_CACHE_DIR, BLS_COLD_CACHE_DIR, BLS_LAKE_DIR,
+BLS_DERIVED_DIR, BLS_DB_PATH, BLS_OUTPUTS_DIR, BLS_LOG_DIR, plus BLS_CACHE_HOT_MAX_GB
+for the budget.
+"""
+
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, overload
+
+# Repository root (two levels up from this file: src/bls_housing -> src -> repo root)
+REPO_ROOT = Path(__file__).resolve().parents[2]
+CONFIG_ENV = "BLS_HOUSING_CONFIG"
+DEFAULT_CONFIG_PATH = REPO_ROOT / "bls_housing.toml"
+
+
+def _read_toml(path: Path) -> dict:
+    try:
+        import tomllib  # Python 3.11+
+    except ImportError:  # pragma: no cover - 3.10
+        try:
+            import tomli as tomllib  # type: ignore[no-redef,import-not-found]
+        except ImportError as e:
+            raise ImportError(f"Reading {path} on Python 3.10 needs 'tomli' installed") from e
+    with open(path, "rb") as fh:
+        return tomllib.load(fh)
+
+
+@lru_cache(maxsize=1)
+def load_config() -> dict:
+    """Return the parsed config file, or {} if there is none."""
+    env_path = os.environ.get(CONFIG_ENV)
+    path = Path(env_path) if env_path else DEFAULT_CONFIG_PATH
+    if not path.exists():
+        if env_path:
+            raise FileNotFoundError(f"{CONFIG_ENV} points to a missing file: {path}")
+        return {}
+    return _read_toml(path)
+
+
+def get_section(*keys: str) -> dict:
+    """Nested config section, e.g. get_section("duckdb", "build"); {} if absent."""
+    node: Any = load_config()
+    for k in keys:
+        node = node.get(k, {}) if isinstance(node, dict) else {}
+    return node if isinstance(node, dict) else {}
+
+
+def env_value(name: str) -> str | None:
+    """Non-empty environment value or None."""
+    val = os.environ.get(name)
+    return val if val not in (None, "") else None
+
+
+def parse_bool(value: str | bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@overload
+def _path_setting(env: str, key: str, default: Path) -> Path: ...
+
+
+@overload
+def _path_setting(env: str, key: str, default: None) -> Path | None: ...
+
+
+def _path_setting(env: str, key: str, default: Path | None) -> Path | None:
+    val = env_value(env) or get_section("paths").get(key)
+    if not val:
+        return default
+    path = Path(str(val)).expanduser()
+    return path if path.is_absolute() else REPO_ROOT / path
+
+
+def data_root() -> Path:
+    """Base of everything under `data/` (default: the checkout's data directory)."""
+    return _path_setting("BLS_DATA_ROOT", "data_root", REPO_ROOT / "data")
+
+
+def cache_root() -> Path:
+    """Raw download cache (QCEW and Census files), the hot tier if a cold one is set."""
+    return _path_setting("BLS_CACHE_DIR", "cache", data_root() / "cache")
+
+
+def cold_cache_root() -> Path | None:
+    """Shared cold tier behind the cache, or None."""
+    return _path_setting("BLS_COLD_CACHE_DIR", "cold_cache", None)
+
+
+def lake_root() -> Path:
+    return _path_setting("BLS_LAKE_DIR", "lake", data_root() / "lake")
+
+
+def derived_root() -> Path:
+    return _path_setting("BLS_DERIVED_DIR", "derived", data_root() / "derived")
+
+
+def db_path() -> Path:
+    return _path_setting("BLS_DB_PATH", "db", data_root() / "analysis.duckdb")
+
+
+def outputs_root() -> Path:
+    """Rendered charts (default: the checkout's outputs directory)."""
+    return _path_setting("BLS_OUTPUTS_DIR", "outputs", REPO_ROOT / "outputs")
+
+
+def log_root() -> Path:
+    """Log files (default: the checkout's logs directory)."""
+    return _path_setting("BLS_LOG_DIR", "logs", REPO_ROOT / "logs")
+
+
+def hot_cache_budget() -> int | None:
+    """Size limit of the hot cache tier in bytes, or None for no limit."""
+    val = env_value("BLS_CACHE_HOT_MAX_GB") or get_section("cache").get("hot_max_gb")
+    return None if val in (None, "") else int(float(val) * 1024**3)
@@ -0,0 +1,107 @@
+"""Statement-level SQL execution helpers shared by `build-data` and `scripts/run_sql.py`.
+
+- `split_statements` splits a script with DuckDB's own parser (no regex splitting).
+- `run_statements` executes them one by one and returns per-statement timings,
+  optionally with DuckDB's JSON profile (the EXPLAIN ANALYZE tree) of each statement.
+- `data_dependencies` finds files a script reads via read_csv/read_parquet/read_json
+  literals, so their content can be part of a checksum.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+DATA_REF_RE = re.compile(r"read_(?:csv(?:_auto)?|parquet|json(?:_auto)?)\(\s*'([^']+)'", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class StatementTiming:
+    source: str
+    index: int
+    kind: str
+    seconds: float
+    preview: str
+    profile: dict | None = None
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_dependencies(sql: str, root: Path) -> list[Path]:
+    """Existing files referenced by literal read_csv/read_parquet/read_json paths
+    (globs are ignored)."""
+    deps = []
+    for ref in DATA_REF_RE.findall(sql):
+        if any(ch in ref for ch in "*?["):
+            continue
+        p = (root / ref).resolve()
+        if p.is_file():
+            deps.append(p)
+    return sorted(set(deps))
+
+
+def _preview(sql: str) -> str:
+    lines = [ln.strip() for ln in sql.splitlines() if ln.strip() and not ln.strip().startswith("--")]
+    first = lines[0] if lines else ""
+    return first[:80]
+
+
+def split_statements(con: duckdb.DuckDBPyConnection, sql: str) -> list[tuple[str, str]]:
+    """(statement type, query text) for each statement in `sql`."""
+    return [(st.type.name, st.query) for st in con.extract_statements(sql)]
+
+
+def enable_profiling(con: duckdb.DuckDBPyConnection, output: Path) -> None:
+    """Write the JSON profile of every following query on `con` to `output`.
+    Profiling settings are per connection: set them on each cursor."""
+    con.execute("SET enable_profiling = 'json'")
+    con.execute(f"SET profiling_output = '{str(output).replace(chr(39), chr(39) * 2)}'")
+
+
+def run_statements(
+    con: duckdb.DuckDBPyConnection,
+    sql: str,
+    source: str = "<sql>",
+    profile_output: Path | None = None,
+) -> list[StatementTiming]:
+    """Execute `sql` statement by statement, logging and returning each timing.
+    With `profile_output`, profiling is enabled on `con` and each statement's
+    JSON profile is attached to its timing."""
+    if profile_output is not None:
+        enable_profiling(con, profile_output)
+    timings = []
+    for i, (kind, query) in enumerate(split_statements(con, sql), start=1):
+        t0 = perf_counter()
+        con.execute(query)
+        if kind == "SELECT":
+            # results stream; drain them so the timing (and profile) covers the whole query
+            while con.fetchmany(10_000):
+                pass
+        seconds = perf_counter() - t0
+        profile = None
+        if profile_output is not None and profile_output.exists():
+            profile = json.loads(profile_output.read_text(encoding="utf-8"))
+            profile_output.unlink()
+        timing = StatementTiming(source, i, kind, seconds, _preview(query), profile)
+        logger.info("%s #%d %s %.3fs  %s", source, i, kind, timing.seconds, timing.preview)
+        timings.append(timing)
+    return timings
@@ -0,0 +1,197 @@
+"""Two-tier raw download cache: a local hot tier in front of an optional shared cold tier.
+
+The hot tier is `settings.cache_root()`, e.g. local NVMe. The cold tier is
+`settings.cold_cache_root()`, e.g. a big shared volume, and mirrors the same
+relative layout (`bls/C1234_2020_1.csv`, `census/xls/...`). Without a cold tier
+everything here behaves exactly like `fetch_once`.
+
+- `lookup_cached(path)` returns the hot copy. On a hot miss it copies the cold copy into
+  the hot tier (promotion) and returns that, so it is a read with a side effect.
+- `resolve_cached(path)` and `cached_files(directory, pattern)` are the pure lookups
+  for code that scans the cache: they see files in either tier and copy nothing.
+  Anything that treats a cache directory as the full set of sources (change
+  detection, manifests, globs over all cached months) must use them, since an
+  evicted file is missing from the hot tier but still cached.
+- `fetch_tiered(path, produce)` is `fetch_once` with a cold-tier step: a miss copies the
+  cold copy instead of downloading. A new download or conversion is also written
+  through to the cold tier, so other machines can reuse it.
+- `evict()` keeps the hot tier under `settings.hot_cache_budget()`. It removes the
+  least recently used files first, and only files that also exist in the cold tier,
+  so eviction never forces a download. Fills run it every `EVICT_EVERY` calls.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from bls_housing.cache_lock import LOCK_DIRNAME, fetch_once, unique_tmp
+from bls_housing.settings import cache_root, cold_cache_root, hot_cache_budget
+
+logger = logging.getLogger(__name__)
+
+HOT_ROOT = cache_root()
+COLD_ROOT = cold_cache_root()
+HOT_BUDGET = hot_cache_budget()
+EVICT_EVERY = 64
+
+_fills = 0
+_fills_lock = threading.Lock()
+
+
+def cold_path(path: Path) -> Path | None:
+    """Cold-tier twin of a hot-tier path, or None if there is no cold tier or
+    `path` is outside the hot tier."""
+    if COLD_ROOT is None:
+        return None
+    try:
+        rel = Path(path).resolve().relative_to(HOT_ROOT.resolve())
+    except ValueError:
+        return None
+    return COLD_ROOT / rel
+
+
+def _touch(path: Path) -> None:
+    """Mark `path` as recently used. Only atime changes; mtime is what lineage watches."""
+    try:
+        st = path.stat()
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def _copy_into(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = unique_tmp(dst)
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def resolve_cached(path: Path) -> Path | None:
+    """Where hot-tier `path` can be read right now: the hot file, else its cold twin,
+    else None. Nothing is copied or touched."""
+    path = Path(path)
+    if path.exists():
+        return path
+    cold = cold_path(path)
+    return cold if cold is not None and cold.exists() else None
+
+
+def cached_files(directory: Path, pattern: str) -> list[Path]:
+    """Hot-tier paths of the files matching `pattern` under `directory` in either tier,
+    sorted. Evicted files are listed under their hot path; read them through
+    `resolve_cached`."""
+    directory = Path(directory)
+    found = {p.relative_to(directory) for p in directory.glob(pattern)}
+    cold = cold_path(directory)
+    if cold is not None and cold.is_dir():
+        found |= {p.relative_to(cold) for p in cold.glob(pattern)}
+    return sorted(directory / rel for rel in found)
+
+
+def readable_files(directory: Path, pattern: str) -> list[Path]:
+    """`cached_files` resolved to the tier each file can be read from."""
+    return [p for p in map(resolve_cached, cached_files(directory, pattern)) if p is not None]
+
+
+def lookup_cached(path: Path) -> Path | None:
+    """Hot-tier `path` if it exists or could be promoted from the cold tier, else None.
+    A promotion copies the file into the hot tier; use `resolve_cached` to only look."""
+    path = Path(path)
+    if path.exists():
+        _touch(path)
+        return path
+    cold = cold_path(path)
+    if cold is None or not cold.exists():
+        return None
+    def promote(tmp: Path) -> None:
+        shutil.copy2(cold, tmp)
+
+    fetch_once(path, promote)
+    logger.debug("Promoted %s from the cold tier", path.name)
+    _maybe_evict()
+    return path
+
+
+def fetch_tiered(path: Path, produce: Callable[[Path], None], force: bool = False) -> Path:
+    """`fetch_once` through both tiers: hot hit, else cold copy, else `produce`.
+    With `force` the cold copy is skipped and the new file replaces it too."""
+    path = Path(path)
+    if not force and lookup_cached(path) is not None:
+        return path
+    cold = cold_path(path)
+    produced = False
+
+    def fill(tmp: Path) -> None:
+        nonlocal produced
+        if not force and cold is not None and cold.exists():
+            shutil.copy2(cold, tmp)
+        else:
+            produce(tmp)
+            produced = True
+
+    fetch_once(path, fill, force=force)
+    if produced and cold is not None:
+        try:
+            _copy_into(path, cold)
+        except OSError as e:
+            # the hot copy is good; the cold tier catches up on the next fill
+            logger.warning("Could not write %s through to the cold tier: %s", path.name, e)
+    _maybe_evict()
+    return path
+
+
+def _hot_files(root: Path):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != LOCK_DIRNAME]
+        for name in filenames:
+            if name.endswith(".tmp"):
+                continue
+            path = Path(dirpath) / name
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                continue
+
+
+def evict(budget: int | None = None) -> tuple[int, int]:
+    """Drop least recently used hot files backed by the cold tier until the hot tier
+    fits in `budget` bytes. Returns (files removed, bytes freed)."""
+    budget = HOT_BUDGET if budget is None else budget
+    if budget is None or COLD_ROOT is None or not HOT_ROOT.exists():
+        return 0, 0
+    files = list(_hot_files(HOT_ROOT))
+    total = sum(st.st_size for _, st in files)
+    removed = freed = 0
+    for path, st in sorted(files, key=lambda f: f[1].st_atime_ns):
+        if total <= budget:
+            break
+        cold = cold_path(path)
+        if cold is None or not cold.exists() or cold.stat().st_size != st.st_size:
+            continue
+        path.unlink(missing_ok=True)
+        total -= st.st_size
+        removed += 1
+        freed += st.st_size
+    if removed:
+        logger.info("Evicted %d hot cache files (%.1f MB)", removed, freed / 1e6)
+    return removed, freed
+
+
+def _maybe_evict() -> None:
+    global _fills
+    if HOT_BUDGET is None or COLD_ROOT is None:
+        return
+    with _fills_lock:
+        _fills += 1
+        due = _fills % EVICT_EVERY == 0
+    if due:
+        evict()
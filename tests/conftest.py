@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline.wages import adjust_inflation
+
+METROS = [("Abilene", 10180), ("Akron", 10420), ("Albany", 10580)]
+YEARS = list(range(2015, 2021))
+
+
+def _annual_frames(drop: tuple[int, int] | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Annual wages / permits frames shaped like the derived parquet."""
+    rng = np.random.default_rng(7)
+    rows = [(a, c, y) for a, c in METROS for y in YEARS if (c, y) != drop]
+    wages = pd.DataFrame(rows, columns=["Area", "Code", "Year"])
+    wages["Total_Wages"] = rng.uniform(1e9, 5e9, len(wages))
+    wages["Real_Total_Wages"] = wages.apply(adjust_inflation, axis=1)
+    wages["Change_Real_Wage"] = wages.groupby("Code")["Real_Total_Wages"].pct_change() * 100
+    permits = pd.DataFrame(rows, columns=["Area", "Code", "Year"])
+    permits["Total_Permits"] = rng.integers(100, 5000, len(permits)).astype("float64")
+    permits["Change_Permit"] = permits.groupby("Code")["Total_Permits"].pct_change() * 100
+    return wages, permits
+
+
+@pytest.fixture()
+def annual_frames():
+    return _annual_frames
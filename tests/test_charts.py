@@ -0,0 +1,39 @@
+import duckdb
+
+from bls_housing.pipeline.charts import _prune_pages, load_pivots, plan_jobs
+
+
+def _marts():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE annual_metrics (Area VARCHAR, Code BIGINT, Year BIGINT, Zoning_Pressure DOUBLE)")
+    con.execute("CREATE TABLE cumulative_metrics (Area VARCHAR, Code BIGINT, Year BIGINT, Structural_Gap DOUBLE)")
+    for table in ("annual_metrics", "cumulative_metrics"):
+        con.execute(f"INSERT INTO {table} VALUES ('Akron, OH', 10420, 2018, 1.1), ('Albany, NY', 10580, 2018, 0.9)")
+    return con
+
+
+def test_empty_selection_loads_no_metros():
+    pivots = load_pivots(_marts(), codes=[])
+    assert all(pivot.empty for pivot, _ in pivots.values())
+    assert plan_jobs(pivots) == []
+
+
+def test_stale_pages_are_removed(tmp_path):
+    jobs = plan_jobs(load_pivots(_marts()), tmp_path, per_page=1)
+    pages = tmp_path / "small_multiples"
+    pages.mkdir()
+    for name in ("zoning_001.png", "zoning_002.png", "zoning_003.png"):
+        (pages / name).write_bytes(b"")
+    manifest = {"small_multiples/zoning_003.png": "old"}
+
+    assert _prune_pages(tmp_path, jobs, manifest) == 1
+    assert sorted(p.name for p in pages.iterdir()) == ["zoning_001.png", "zoning_002.png"]
+    assert manifest == {}
+
+
+def test_dpi_is_part_of_the_digest(tmp_path):
+    pivots = load_pivots(_marts())
+    default = {j.out_path: j.digest for j in plan_jobs(pivots, tmp_path)}
+    sharper = {j.out_path: j.digest for j in plan_jobs(pivots, tmp_path, dpi=200)}
+    assert default.keys() == sharper.keys()
+    assert all(default[k] != sharper[k] for k in default)
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline import wages
+from bls_housing.pipeline.checkpoint import RunJournal
+
+METROS = pd.DataFrame({"Area": ["Akron", "Albany"], "Code": [10420, 10580]})
+YEARS = [2016, 2017]
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Record every metro-quarter read; raise once on the one in `fail_on`."""
+    calls = []
+    fail_on = set()
+
+    def load_area_df(area, year, qtr):
+        calls.append((area, int(year), int(qtr)))
+        if (area, int(year), int(qtr)) in fail_on:
+            fail_on.clear()
+            raise RuntimeError("interrupted")
+        return pd.DataFrame({"agglvl_code": [40], "total_qtrly_wages": [float(1000 * int(year) + int(qtr))]})
+
+    monkeypatch.setattr(wages, "load_area_df", load_area_df)
+    return calls, fail_on
+
+
+def _journal(tmp_path):
+    return RunJournal("annual_wages", METROS["Code"], YEARS, root=tmp_path)
+
+
+def test_resume_skips_journaled_units(tmp_path, fetches):
+    calls, fail_on = fetches
+    expected = wages.build_annual_wages(METROS, YEARS)
+    calls.clear()
+
+    # Albany 2016 fails after Akron's two years are done
+    fail_on.add(("C1058", 2016, 2))
+    with pytest.raises(RuntimeError, match="interrupted"):
+        wages.build_annual_wages(METROS, YEARS, journal=_journal(tmp_path))
+    assert {(a, y) for a, y, _ in calls} == {("C1042", 2016), ("C1042", 2017), ("C1058", 2016)}
+
+    calls.clear()
+    journal = _journal(tmp_path)
+    result = wages.build_annual_wages(METROS, YEARS, journal=journal)
+    assert {(a, y) for a, y, _ in calls} == {("C1058", 2016), ("C1058", 2017)}
+    assert journal.skipped == 2
+    for got, want in zip(result, expected):
+        pd.testing.assert_frame_equal(got, want)
+
+    journal.finish()
+    assert not journal.dir.exists()
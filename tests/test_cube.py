@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline.cube import MetroCube, structural_gap, zoning_pressure
+from bls_housing.pipeline.marts import (
+    build_annual_metrics,
+    build_cumulative_metrics,
+    build_cumulative_metrics_sweep,
+)
+
+
+def _cubes(wages, permits):
+    return MetroCube.from_frame(wages, "Total_Wages"), MetroCube.from_frame(permits, "Total_Permits")
+
+
+def _sorted(df, keys):
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+def test_zoning_pressure_matches_pandas(annual_frames):
+    wages, permits = annual_frames()
+    expected = build_annual_metrics(wages, permits)
+    got = zoning_pressure(*_cubes(wages, permits))
+    pd.testing.assert_frame_equal(
+        _sorted(got, ["Code", "Year"]), _sorted(expected[got.columns], ["Code", "Year"]),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("drop", [None, (10420, 2018)])
+def test_structural_gap_matches_pandas(annual_frames, drop):
+    wages, permits = annual_frames(drop)
+    wage_cube, permit_cube = _cubes(wages, permits)
+    for base in (2015, 2017):
+        expected = build_cumulative_metrics(wages, permits, base)
+        got = structural_gap(wage_cube, permit_cube, base)
+        pd.testing.assert_frame_equal(
+            _sorted(got, ["Code", "Year"]), _sorted(expected[got.columns], ["Code", "Year"]),
+            check_dtype=False,
+        )
+
+
+@pytest.mark.parametrize("drop", [None, (10420, 2018)])
+def test_sweep_matches_per_base(annual_frames, drop):
+    wages, permits = annual_frames(drop)
+    bases = [2015, 2016, 2017]
+    per_base = pd.concat(
+        [build_cumulative_metrics(wages, permits, b).assign(Base_Year=b) for b in bases],
+        ignore_index=True,
+    )
+    sweep = build_cumulative_metrics_sweep(wages, permits, bases)
+    keys = ["Base_Year", "Code", "Year"]
+    pd.testing.assert_frame_equal(
+        _sorted(sweep, keys), _sorted(per_base[sweep.columns], keys), check_dtype=False,
+    )
+
+
+def test_unknown_sub_period_raises():
+    df = pd.DataFrame({"Code": [10180, 10180], "Year": [2020, 2020], "Quarter": [1, 5], "v": [1.0, 2.0]})
+    with pytest.raises(ValueError, match="not in cube"):
+        MetroCube.from_frame(df, "v", sub_col="Quarter", subs=[1, 2, 3, 4])
+
+
+def test_non_contiguous_years_raise():
+    df = pd.DataFrame({"Code": [10180, 10180], "Year": [2018, 2020], "v": [1.0, 2.0]})
+    with pytest.raises(ValueError, match="contiguous"):
+        MetroCube.from_frame(df, "v", years=[2018, 2020])
+    # default years span the gap, the missing year is an unobserved cell
+    cube = MetroCube.from_frame(df, "v")
+    assert cube.years.tolist() == [2018, 2019, 2020]
+    assert cube.mask[0, :, 0].tolist() == [True, False, True]
+
+
+def test_duplicate_cells_raise():
+    df = pd.DataFrame({"Code": [10180, 10180], "Year": [2020, 2020], "v": [1.0, 2.0]})
+    with pytest.raises(ValueError, match="Duplicate"):
+        MetroCube.from_frame(df, "v")
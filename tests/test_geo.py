@@ -0,0 +1,58 @@
+import duckdb
+import pandas as pd
+import pytest
+
+gpd = pytest.importorskip("geopandas")
+pyproj = pytest.importorskip("pyproj")
+from shapely.geometry import box  # noqa: E402
+
+from bls_housing.pipeline import geo  # noqa: E402
+
+# a 0.2 degree box around downtown Akron and one around Honolulu
+BOXES = {10420: (-81.62, 41.98, -81.42, 42.18), 46520: (-158.0, 21.2, -157.8, 21.4)}
+
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(geo, "BOUNDARIES_CACHE", tmp_path / "boundaries.parquet")
+    monkeypatch.setattr(geo, "CROSSWALK_CACHE", tmp_path / "crosswalk.parquet")
+    gdf = gpd.GeoDataFrame({"CBSAFP": [str(c) for c in BOXES]},
+                           geometry=[box(*b) for b in BOXES.values()], crs=geo.SOURCE_CRS)
+    boundaries = tmp_path / "cbsa.geojson"
+    gdf.to_file(boundaries, driver="GeoJSON")
+    zips = tmp_path / "zips.csv"
+    # inside Akron, 1 degree of longitude east of it, 0.5 degree east of Honolulu
+    pd.DataFrame({"zip": ["44308", "44999", "96999"], "lat": [42.08, 42.08, 21.3],
+                  "lon": [-81.52, -80.42, -157.3]}).to_csv(zips, index=False)
+    con = duckdb.connect()
+    con.execute("CREATE TABLE dim_metro_full AS SELECT * FROM (VALUES "
+                "(10420, 'Akron', 'Akron, OH'), (46520, 'Urban Honolulu', 'Urban Honolulu, HI')) "
+                "t(Code, Area, Title)")
+    return con, boundaries, zips
+
+
+def test_distances_are_geodesic(inputs):
+    con, boundaries, zips = inputs
+    out = geo.ensure_zip_cbsa_crosswalk(con, boundaries, zips).set_index("ZIP")
+    assert out.loc["44308", "Match"] == "contains"
+    geod = pyproj.Geod(ellps="GRS80")
+    for zip_code, edge_lon in (("44999", -81.42), ("96999", -157.8)):
+        row = out.loc[zip_code]
+        expected = geod.inv(row["lon"], row["lat"], edge_lon, row["lat"])[2] / 1000.0
+        assert row["Match"] == "nearest"
+        assert row["Distance_km"] == pytest.approx(expected, rel=1e-3)
+
+
+def test_cache_keyed_on_parameters(inputs):
+    con, boundaries, zips = inputs
+    out = geo.ensure_zip_cbsa_crosswalk(con, boundaries, zips)
+    assert (out["Match"] == "nearest").sum() == 2
+
+    out = geo.ensure_zip_cbsa_crosswalk(con, boundaries, zips, max_distance_km=60)
+    assert out.set_index("ZIP").loc["44999", "Match"] == "none"
+    assert out.set_index("ZIP").loc["96999", "Match"] == "nearest"
+
+    con.execute("DELETE FROM dim_metro_full WHERE Code = 46520")
+    out = geo.ensure_zip_cbsa_crosswalk(con, boundaries, zips, max_distance_km=60)
+    assert pd.read_parquet(geo.BOUNDARIES_CACHE)["Code"].tolist() == [10420]
+    assert out.set_index("ZIP").loc["96999", "Match"] == "none"
@@ -0,0 +1,92 @@
+import os
+
+import duckdb
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline import lineage, snapshot, wages
+from bls_housing.pipeline.marts import build_annual_metrics, build_cumulative_metrics
+
+METROS = pd.DataFrame({"Area": ["Akron", "Albany"], "Code": [10420, 10580]})
+YEARS = [2018, 2019, 2020]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Derived parquet, lineage and marts built from one raw file per metro-quarter,
+    each holding its quarterly wage total."""
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    monkeypatch.setattr(lineage, "DERIVED_DIR", tmp_path)
+    monkeypatch.setattr(lineage, "SOURCE_FILES_PATH", tmp_path / "source_files.parquet")
+    monkeypatch.setattr(lineage, "SOURCE_LINEAGE_PATH", tmp_path / "source_lineage.parquet")
+    monkeypatch.setattr(lineage, "LINEAGE_DIR", tmp_path)
+    monkeypatch.setattr(snapshot, "publish_snapshots", lambda con: None)
+    monkeypatch.setattr(lineage, "get_cache_path", lambda area, y, q: raw / f"{area}_{y}_{q}.csv")
+    monkeypatch.setattr(wages, "load_area_df", lambda area, y, q: pd.DataFrame(
+        {"agglvl_code": [40], "total_qtrly_wages": [float((raw / f"{area}_{y}_{q}.csv").read_text())]}))
+    for code in METROS["Code"]:
+        for year in YEARS:
+            for qtr in (1, 2, 3, 4):
+                (raw / f"{wages._to_qcew(code)}_{year}_{qtr}.csv").write_text(str(code + year + qtr))
+
+    wages_q, annual_wages = wages.build_annual_wages(METROS, YEARS)
+    annual_wages.to_parquet(tmp_path / "annual_wages.parquet", index=False)
+    annual_permits = annual_wages[["Area", "Code", "Year"]].assign(Total_Permits=100.0)
+    annual_permits["Change_Permit"] = annual_permits.groupby("Code")["Total_Permits"].pct_change() * 100
+    annual_permits.to_parquet(tmp_path / "annual_permits.parquet", index=False)
+    lineage.record_lineage("annual_wages", annual_wages[["Code", "Year"]].itertuples(index=False, name=None))
+
+    con = duckdb.connect()
+    annual = build_annual_metrics(annual_wages, annual_permits)
+    cumulative = build_cumulative_metrics(annual_wages, annual_permits, YEARS[0])
+    con.execute("CREATE TABLE annual_metrics AS SELECT * FROM annual")
+    con.execute("CREATE TABLE cumulative_metrics AS SELECT * FROM cumulative")
+    con.execute("CREATE TABLE wages_metrics AS SELECT * FROM wages_q")
+    return con, raw
+
+
+def _annual(con, table):
+    return con.execute(f"SELECT * FROM {table} ORDER BY Code, Year").df()
+
+
+def test_revised_file_rebuilds_affected_rows(store):
+    con, raw = store
+    before = {t: _annual(con, t) for t in ("annual_metrics", "cumulative_metrics")}
+    revised = raw / "C1042_2019_2.csv"
+    revised.write_text("999999")
+
+    res = lineage.refresh_revised(con)
+    assert res.changed_files == [str(revised)]
+    assert res.wages_keys == {(10420, 2019)}
+    assert res.cumulative_codes == {10420}
+
+    annual = _annual(con, "annual_metrics").set_index(["Code", "Year"])
+    old = before["annual_metrics"].set_index(["Code", "Year"])
+    revised_total = old.loc[(10420, 2019), "Total_Wages"] - (10420 + 2019 + 2) + 999999
+    assert annual.loc[(10420, 2019), "Total_Wages"] == revised_total
+    assert annual.loc[(10420, 2020), "Change_Real_Wage"] != pytest.approx(old.loc[(10420, 2020), "Change_Real_Wage"])
+    pd.testing.assert_frame_equal(annual.loc[[10580]], old.loc[[10580]])
+    pd.testing.assert_frame_equal(annual.loc[[(10420, 2018)]], old.loc[[(10420, 2018)]])
+
+    cumulative = _annual(con, "cumulative_metrics")
+    assert not cumulative[cumulative["Code"] == 10420].equals(
+        before["cumulative_metrics"][before["cumulative_metrics"]["Code"] == 10420])
+    assert lineage.refresh_revised(con).changed_files == []
+
+
+def test_touched_file_is_not_rehashed_again(store, monkeypatch):
+    con, raw = store
+    touched = raw / "C1058_2020_1.csv"
+    st = touched.stat()
+    os.utime(touched, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert lineage.detect_changed_sources().empty
+    files = pd.read_parquet(lineage.SOURCE_FILES_PATH).set_index("src_path")
+    assert files.loc[str(touched), "mtime_ns"] == st.st_mtime_ns + 10**9
+
+    def no_hash(*args, **kwargs):
+        raise AssertionError("unchanged file rehashed")
+
+    monkeypatch.setattr(lineage, "file_sha256", no_hash)
+    assert lineage.detect_changed_sources().empty
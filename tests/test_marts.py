@@ -0,0 +1,47 @@
+import duckdb
+
+import pandas as pd
+
+from bls_housing.pipeline import snapshot
+from bls_housing.pipeline.duck import update_db
+from bls_housing.pipeline.marts import build_annual_metrics, refresh_cumulative_by_base
+
+
+def test_cumulative_by_base_refresh_keeps_seeded_base_years(annual_frames):
+    wages, permits = annual_frames()
+    con = duckdb.connect()
+    # nothing seeded yet: incremental refreshes leave the table alone
+    assert refresh_cumulative_by_base(con, wages, permits) == 0
+
+    assert refresh_cumulative_by_base(con, wages, permits, base_years=[2016, 2018, 1990]) > 0
+    wages.loc[wages["Code"] == 10420, "Real_Total_Wages"] *= 2
+    n = refresh_cumulative_by_base(con, wages, permits, codes=[10420])
+
+    rows = con.execute("""
+        SELECT Base_Year, count(*), min(Code), max(Code), max(Cumul_Wage_Index)
+        FROM cumulative_metrics_by_base GROUP BY 1 ORDER BY 1""").fetchall()
+    assert [r[0] for r in rows] == [2016, 2018]
+    assert n == 5 + 3  # metro 10420 only, years from each base on
+    assert [r[1] for r in rows] == [3 * 5, 3 * 3]
+
+
+def test_update_db_refreshes_swept_base_years(annual_frames, monkeypatch):
+    published = []
+    monkeypatch.setattr(snapshot, "publish_snapshots", published.append)
+    wages, permits = annual_frames()
+    con = duckdb.connect()
+    annual = build_annual_metrics(wages, permits)
+    con.execute("CREATE TABLE annual_metrics AS SELECT * FROM annual")
+    refresh_cumulative_by_base(con, wages, permits, base_years=[2016])
+
+    wages.loc[(wages["Code"] == 10420) & (wages["Year"] == 2019), "Real_Total_Wages"] *= 2
+    changed = build_annual_metrics(wages, permits)
+    update_db(con, changed[changed["Code"] == 10420], pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+
+    row = con.execute("""
+        SELECT Real_Total_Wages, Cumul_Wage_Index FROM cumulative_metrics_by_base
+        WHERE Base_Year = 2016 AND Code = 10420 AND Year = 2019""").fetchone()
+    expected = changed.set_index(["Code", "Year"])["Real_Total_Wages"]
+    assert row[0] == expected[(10420, 2019)]
+    assert row[1] == expected[(10420, 2019)] / expected[(10420, 2016)]
+    assert published == [con]
@@ -0,0 +1,51 @@
+import duckdb
+import pytest
+
+from bls_housing.pipeline.rollups import ANNUAL_ROLLUP, CSA_DIM, ensure_rollup_tables, refresh_rollups
+
+# (Code, Year, Real_Total_Wages, Total_Permits); 10580 enters the marts in 2017
+ROWS = [
+    (10420, 2015, 100.0, 10.0), (10420, 2016, 110.0, 12.0), (10420, 2017, 121.0, 15.0),
+    (10580, 2017, 1000.0, 500.0), (10580, 2018, 1100.0, 400.0), (10420, 2018, 133.1, 15.0),
+]
+
+
+@pytest.fixture()
+def con():
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE annual_metrics (Area VARCHAR, Code BIGINT, Year BIGINT, Total_Wages BIGINT,
+          Real_Total_Wages DOUBLE, Total_Permits DOUBLE);
+        CREATE TABLE cumulative_metrics (Area VARCHAR, Code BIGINT, Year BIGINT, Real_Total_Wages DOUBLE,
+          Total_Permits DOUBLE, Base_Wage DOUBLE, Base_Permits DOUBLE);
+        """)
+    con.executemany("INSERT INTO annual_metrics VALUES (?, ?, ?, ?, ?, ?)",
+                    [(f"M{c}", c, y, int(w), w, p) for c, y, w, p in ROWS])
+    ensure_rollup_tables(con)
+    con.execute(f"INSERT INTO {CSA_DIM} VALUES (10420, 104, 'Albany-Schenectady, NY'), (10580, 104, 'Albany-Schenectady, NY')")
+    refresh_rollups(con)
+    return con
+
+
+def _csa(con):
+    return {r[0]: r[1:] for r in con.execute(f"""
+        SELECT Year, Geo_Name, Metros, Change_Real_Wage, Change_Permit FROM {ANNUAL_ROLLUP}
+        WHERE Level = 'csa' ORDER BY Year""").fetchall()}
+
+
+def test_growth_only_counts_metros_in_both_years(con):
+    csa = _csa(con)
+    # 2017: 10580 enters; growth is 10420's own, not the jump in summed levels
+    name, metros, wage, permit = csa[2017]
+    assert (name, metros) == ("Albany-Schenectady, NY", 2)
+    assert wage == pytest.approx(10.0)
+    assert permit == pytest.approx(25.0)
+    # 2018: both metros matched
+    assert csa[2018][2] == pytest.approx((133.1 + 1100) / (121 + 1000) * 100 - 100)
+
+
+def test_incremental_refresh_matches_full_build(con):
+    full = con.execute(f"SELECT * FROM {ANNUAL_ROLLUP} ORDER BY ALL").fetchall()
+    con.execute(f"DELETE FROM {ANNUAL_ROLLUP} WHERE Year >= 2017")
+    refresh_rollups(con, annual_years=[2017], cumulative_years=[])
+    assert con.execute(f"SELECT * FROM {ANNUAL_ROLLUP} ORDER BY ALL").fetchall() == full
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline.seasonal import annual_series, build_seasonal, check_window
+
+
+def _monthly(counts: dict[int, list[float]]) -> pd.DataFrame:
+    rows = [
+        {"Area": "Akron", "Code": 10420, "Year": y, "Quarter": (m - 1) // 3 + 1, "Month": m,
+         "Total_Permits": v}
+        for y, values in counts.items() for m, v in enumerate(values, start=1)
+    ]
+    return pd.DataFrame(rows)
+
+
+SEASON = [2, 3, 6, 9, 12, 14, 13, 11, 9, 6, 3, 2]
+
+
+def test_series_stay_non_negative():
+    rng = np.random.default_rng(3)
+    permits = _monthly({y: rng.poisson(SEASON).astype(float).tolist() for y in range(2015, 2022)})
+    out = build_seasonal(permits)
+    assert (out["Adjusted_Permits"] >= 0).all()
+    assert (out["Trend_Permits"] >= 0).all()
+    factors = out.drop_duplicates("Month")["Seasonal"]
+    assert factors.mean() == pytest.approx(1.0)
+
+
+def test_zero_year_is_not_a_zero_denominator():
+    counts = {y: [float(v) for v in SEASON] for y in range(2015, 2021)}
+    counts[2018] = [0.0] * 12
+    seasonal = build_seasonal(_monthly(counts))
+
+    raw = annual_series(seasonal, "raw").set_index("Year")
+    assert np.isnan(raw.loc[2018, "Total_Permits"])
+    assert np.isnan(raw.loc[2019, "Change_Permit"])
+
+    trend = annual_series(seasonal).set_index("Year")   # trend is the default
+    assert trend.loc[2018, "Total_Permits"] > 0
+    assert np.isfinite(trend["Change_Permit"].dropna()).all()
+
+
+def test_missing_month_makes_a_partial_year():
+    counts = {y: [float(v) for v in SEASON] for y in range(2015, 2019)}
+    counts[2017][4] = None
+    seasonal = build_seasonal(_monthly(counts))
+    assert np.isnan(annual_series(seasonal, "adjusted").set_index("Year").loc[2017, "Total_Permits"])
+    assert annual_series(seasonal, "trend").set_index("Year").loc[2017, "Total_Permits"] > 0
+
+
+@pytest.mark.parametrize("window", [0, 6, 13])
+def test_window_must_cover_whole_years(window):
+    with pytest.raises(ValueError, match="multiple of 12"):
+        check_window(window)
+    with pytest.raises(ValueError):
+        build_seasonal(_monthly({2020: SEASON}), window)
@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import duckdb
+import pytest
+
+from bls_housing.pipeline.duck import mark_built
+from bls_housing.pipeline.serve import ReadConnections, ServiceBusy, make_server
+
+WRITER = """
+import sys
+from bls_housing.pipeline.duck import connect, mark_built
+con = connect(sys.argv[1], "build")
+con.execute("INSERT INTO annual_metrics VALUES (10420, 'Akron, OH', 2019, 1.5)")
+mark_built(con, ["annual_metrics"])
+con.close()
+"""
+
+
+@pytest.fixture()
+def dbpath(tmp_path):
+    path = tmp_path / "analysis.duckdb"
+    con = duckdb.connect(str(path))
+    con.execute("CREATE TABLE annual_metrics (Code BIGINT, Area VARCHAR, Year BIGINT, Zoning_Pressure DOUBLE)")
+    con.execute("INSERT INTO annual_metrics VALUES (10420, 'Akron, OH', 2018, 1.2)")
+    mark_built(con, ["annual_metrics"])
+    con.close()
+    return path
+
+
+@pytest.fixture()
+def server(dbpath):
+    httpd = make_server("127.0.0.1", 0, dbpath, pool_size=2)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        return json.loads(resp.read()), resp.headers
+
+
+def test_writer_succeeds_while_serving(server, dbpath):
+    body, _ = _get(f"{server}/tables/annual_metrics?code=10420")
+    assert [r["Year"] for r in body["rows"]] == [2018]
+    before = body["version"]
+
+    # no connection is held between requests, so a separate writer process gets the lock
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    proc = subprocess.run([sys.executable, "-c", WRITER, str(dbpath)],
+                          capture_output=True, text=True, timeout=60, env=env)
+    assert proc.returncode == 0, proc.stderr
+
+    body, _ = _get(f"{server}/tables/annual_metrics?code=10420")
+    assert [r["Year"] for r in body["rows"]] == [2018, 2019]
+    assert body["version"] != before
+
+
+def test_no_free_slot_is_busy(dbpath):
+    conns = ReadConnections(dbpath, size=1, timeout=0.05)
+    with conns.connection():
+        with pytest.raises(ServiceBusy):
+            with conns.connection():
+                pass
+
+
+def test_busy_maps_to_503(server, monkeypatch):
+    def busy(self):
+        raise ServiceBusy("database is being written")
+
+    monkeypatch.setattr(ReadConnections, "connection", busy)
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _get(f"{server}/tables/annual_metrics")
+    assert exc.value.code == 503
+    assert exc.value.headers["Retry-After"] == "1"
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from bls_housing import tiered_cache
+from bls_housing.pipeline.sectors import scan_sources
+
+
+@pytest.fixture
+def tiers(tmp_path, monkeypatch):
+    hot, cold = tmp_path / "hot", tmp_path / "cold"
+    monkeypatch.setattr(tiered_cache, "HOT_ROOT", hot)
+    monkeypatch.setattr(tiered_cache, "COLD_ROOT", cold)
+    return hot, cold
+
+
+def _cache_file(hot, cold, rel, text):
+    """Write `rel` to the hot tier and copy it through to the cold tier."""
+    path = hot / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    tiered_cache._copy_into(path, cold / rel)
+    return path
+
+
+def _age(path, seconds):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns - seconds * 10**9, st.st_mtime_ns))
+
+
+def test_scans_see_evicted_files(tiers):
+    hot, cold = tiers
+    old = _cache_file(hot, cold, "bls/C1042_2020_1.csv", "a" * 100)
+    new = _cache_file(hot, cold, "bls/C1042_2020_2.csv", "b" * 100)
+    _age(old, 60)
+    before = scan_sources(hot / "bls")
+
+    assert tiered_cache.evict(budget=150) == (1, 100)
+    assert not old.exists()
+    assert tiered_cache.cached_files(hot / "bls", "*.csv") == [old, new]
+    assert tiered_cache.resolve_cached(old) == cold / "bls" / old.name
+    assert not old.exists()  # looking does not promote
+    assert tiered_cache.readable_files(hot / "bls", "*.csv") == [cold / "bls" / old.name, new]
+    # the sector manifest keys and stats stay the same, so nothing counts as removed
+    assert scan_sources(hot / "bls").equals(before)
+
+
+def test_lookup_promotes(tiers):
+    hot, cold = tiers
+    path = _cache_file(hot, cold, "census/csv/CBSA_2024_01.csv", "x")
+    path.unlink()
+    assert tiered_cache.resolve_cached(path) == cold / "census" / "csv" / path.name
+    assert tiered_cache.lookup_cached(path) == path
+    assert path.read_text() == "x"
+
+
+def test_without_cold_tier(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiered_cache, "COLD_ROOT", None)
+    assert tiered_cache.resolve_cached(tmp_path / "missing.csv") is None
+    assert tiered_cache.cached_files(tmp_path, "*.csv") == []
@@ -0,0 +1,101 @@
+import math
+
+import pandas as pd
+import pytest
+
+from bls_housing.pipeline import polars_engine, wages
+from bls_housing.pipeline.ensure import ensure_annual_wages
+from bls_housing.pipeline.wages import _annual_from_quarterly
+
+METROS = pd.DataFrame({"Area": ["Akron"], "Code": [10420]})
+
+
+def _quarterly(missing: tuple[int, int]) -> pd.DataFrame:
+    rows = [
+        {"Area": "Akron", "Code": 10420, "Year": y, "Quarter": q,
+         "Total_Wages": None if (y, q) == missing else 1000 * y + q}
+        for y in (2016, 2017, 2018) for q in (1, 2, 3, 4)
+    ]
+    return pd.DataFrame(rows)
+
+
+def _check_partial_year(annual: pd.DataFrame) -> None:
+    by_year = annual.set_index("Year")
+    # 2017 lost its third quarter: unknown, not three quarters' worth
+    assert math.isnan(by_year.loc[2017, "Total_Wages"])
+    assert math.isnan(by_year.loc[2017, "Real_Total_Wages"])
+    assert by_year.loc[2016, "Total_Wages"] == 4 * 2016000 + 10
+    # growth into and out of the partial year is unknown too
+    assert math.isnan(by_year.loc[2017, "Change_Real_Wage"])
+    assert math.isnan(by_year.loc[2018, "Change_Real_Wage"])
+
+
+def test_partial_year_is_nan_pandas():
+    _, annual = _annual_from_quarterly(_quarterly(missing=(2017, 3)))
+    _check_partial_year(annual)
+
+
+def test_partial_year_is_nan_polars(monkeypatch):
+    pl = pytest.importorskip("polars")
+    found = _quarterly(missing=(2017, 3)).dropna()[["Code", "Year", "Quarter", "Total_Wages"]]
+    monkeypatch.setattr(polars_engine, "qcew_wages_lazy",
+                        lambda *args, **kwargs: pl.from_pandas(found).lazy())
+    wages, annual = polars_engine.build_annual_wages(METROS, [2016, 2017, 2018])
+    assert wages["Total_Wages"].isna().sum() == 1
+    _check_partial_year(annual)
+
+
+def test_partial_permit_year_is_null_polars(monkeypatch):
+    pl = pytest.importorskip("polars")
+    found = pd.DataFrame(
+        [{"Code": 10420, "Year": y, "Month": m, "Total_Permits": 10}
+         for y in (2017, 2018) for m in range(1, 13) if (y, m) != (2018, 6)]
+    )
+    monkeypatch.setattr(polars_engine, "bps_permits_lazy",
+                        lambda *args, **kwargs: pl.from_pandas(found).lazy())
+    _, annual = polars_engine.build_annual_permits(METROS, [2017, 2018])
+    by_year = annual.set_index("Year")
+    assert by_year.loc[2017, "Total_Permits"] == 120
+    assert math.isnan(by_year.loc[2018, "Total_Permits"])
+
+
+def test_nan_year_is_retried_by_ensure(tmp_path, monkeypatch):
+    gaps = {("C1042", "2017", "3")}
+
+    def load_area_df(area, year, qtr):
+        if (area, year, qtr) in gaps:
+            return pd.DataFrame({"agglvl_code": [70], "total_qtrly_wages": [1]})
+        return pd.DataFrame({"agglvl_code": [40], "total_qtrly_wages": [1000 * int(year) + int(qtr)]})
+
+    monkeypatch.setattr(wages, "load_area_df", load_area_df)
+    years = [2016, 2017, 2018]
+    first = ensure_annual_wages(METROS, years, derived_dir=tmp_path, lineage=False, checkpoint=False)
+    assert first.missing_keys == {(10420, y) for y in years}
+    _check_partial_year(first.df_tuple[1])
+
+    gaps.clear()
+    second = ensure_annual_wages(METROS, years, derived_dir=tmp_path, lineage=False, checkpoint=False)
+    assert second.missing_keys == {(10420, 2017)}
+    by_year = second.df_tuple[1].set_index("Year")
+    assert by_year.loc[2017, "Total_Wages"] == 4 * 2017000 + 10
+    # the stored growth of the following year is recomputed as well
+    assert not math.isnan(by_year.loc[2018, "Change_Real_Wage"])
+    stored = pd.read_parquet(tmp_path / "annual_wages.parquet")
+    assert stored["Total_Wages"].notna().all()
+
+
+def test_partly_built_lake_falls_back_to_the_cache(tmp_path, monkeypatch):
+    part = tmp_path / "cbsa_code=10420" / "year=2016" / "quarter=1"
+    part.mkdir(parents=True)
+    pd.DataFrame({"agglvl_code": [40], "total_qtrly_wages": [2016001]}).to_parquet(part / "data.parquet")
+    monkeypatch.setattr(wages, "lake_glob", lambda: str(tmp_path / "cbsa_code=*" / "year=*" / "quarter=*" / "*.parquet"))
+    fetched = []
+
+    def load_area_df(area, year, qtr):
+        fetched.append(int(qtr))
+        return pd.DataFrame({"agglvl_code": [40], "total_qtrly_wages": [1000 * int(year) + int(qtr)]})
+
+    monkeypatch.setattr(wages, "load_area_df", load_area_df)
+    _, annual = wages.build_annual_wages(METROS, [2016], source="lake")
+    assert fetched == [2, 3, 4]
+    assert annual["Total_Wages"].tolist() == [4 * 2016000 + 10]